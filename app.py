@@ -1,24 +1,48 @@
 import streamlit as st
 import pandas as pd
-from googleapiclient.discovery import build
-import google.generativeai as genai
 import time
-import random
-import json
 import altair as alt
 import streamlit.components.v1 as components
-import io
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
+import atexit
+import queue
+import uuid
 from collections import OrderedDict
-import requests
-from bs4 import BeautifulSoup
-import html2text
+from browser_pool import BrowserPool
+from limiter import RateLimitedExecutor
+from pipeline import StagedPipeline
+from report import collect_reports, parquet_available
+from run_store import RunRecord, RunStore
+from page_fetcher import PageFetcher
+from quota import SharedQuota, get_quota_manager
+from replay import current_tape, replay_mode
+from jsonfix import stats_since as json_stats_since, stats_snapshot as json_stats_snapshot
+from metrics import limiter_bound, to_json as metrics_to_json, to_prometheus
+from journal import RunJournal, run_signature
+from cache import CacheView
+from core import (
+    SEARCH_ENGINE_ID,
+    convert_url_to_pdf,
+    extract_dom_content,
+    extract_keywords_with_pdf,
+    fetch_webpage_content,
+    extract_keywords_from_content,
+    fetch_suggestions_bulk,
+    fetch_keyword_serp,
+    attach_competitor_pages,
+    analyze_keyword_strategy,
+    analyze_keyword_batch,
+    strategy_batch_cost,
+    keyword_error_result,
+    generate_content_direction,
+    SERP_CACHE_MAX_TTL_HOURS,
+    open_serp_cache,
+    open_suggest_cache,
+    open_gemini_cache,
+    open_page_cache,
+)
 
-# =================================================
-# 0. 固定設定
-# =================================================
-SEARCH_ENGINE_ID = "23e43fb5e029f4b50"  # CX 寫死（非機密）
+# Streamlit 1.52 起 download_button 的 data 可傳入 callable，按下時才產生下載內容
+DEFERRED_DOWNLOADS = tuple(int(p) for p in st.__version__.split(".")[:2]) >= (1, 52)
 
 # =================================================
 # 1. Page Config
@@ -50,12 +74,32 @@ with st.sidebar:
         ["gemini-2.5-flash", "gemini-2.5-pro", "gemini-3-pro-preview"],
         index=0
     )
+    STREAM_OUTPUT = st.checkbox(
+        "串流顯示分析結果",
+        value=True,
+        help="逐段接收 Gemini 回應，策略與內容指引的欄位一完成就先顯示（最終結果相同；批次模式不適用）"
+    )
 
     st.divider()
     st.header("🌍 搜尋設定")
     TARGET_GL = st.text_input("地區 (gl)", value="tw")
     TARGET_HL = st.text_input("語言 (hl)", value="zh-TW")
     MAX_PAGES = st.slider("抓取頁數", 1, 3, 2)
+    SUGGEST_DEPTH = st.radio(
+        "搜尋建議展開深度",
+        [1, 2],
+        index=0,
+        horizontal=True,
+        help="2 = 對第一層建議字再展開一次（請求數約增加 8 倍，已並行處理）"
+    )
+    COMPETITOR_PAGES = st.slider(
+        "抓取前幾名頁面內容",
+        min_value=0,
+        max_value=10,
+        value=0,
+        help="第二階段抓取每個關鍵字 SERP 前 N 名的頁面內文，一併交給 AI 分析（0 = 只用標題與摘要）。"
+             "跨關鍵字重複的網址只抓一次，並使用 ETag / Last-Modified 快取"
+    )
 
     st.divider()
     st.header("⚡ 效能設定")
@@ -79,592 +123,168 @@ with st.sidebar:
         max_value=3.0,
         value=1.0,
         step=0.5,
-        help="每次 Gemini 呼叫的最小間隔"
+        help="每次 Gemini 呼叫的最小間隔（換算為 RPM 上限，撞到 429 時自動降速、成功後回升）"
+    )
+    GEMINI_TPM = st.number_input(
+        "Gemini TPM 上限",
+        min_value=0,
+        max_value=10_000_000,
+        value=1_000_000,
+        step=50_000,
+        help="每分鐘輸入 token 預算（0 表示不限制）"
+    )
+    SERP_RPM = st.slider(
+        "SERP 每分鐘請求上限",
+        min_value=10,
+        max_value=600,
+        value=300,
+        step=10,
+        help="Google CSE API 的 RPM 預算"
+    )
+    MAX_CONCURRENT_SUGGEST = st.slider(
+        "Suggest 同時請求數",
+        min_value=1,
+        max_value=16,
+        value=8,
+        help="第一階段 Google 搜尋建議的並發上限"
+    )
+    PIPELINE_QUEUE_SIZE = st.slider(
+        "SERP → 分析 佇列上限",
+        min_value=1,
+        max_value=50,
+        value=10,
+        help="SERP 已抓取、等待 Gemini 分析的關鍵字上限，滿了 SERP 階段會暫停"
     )
 
-# =================================================
-# 3. Rate Limited Executor（核心平行控制）
-# =================================================
-class RateLimitedExecutor:
-    """帶 rate limit 的平行執行器，防止 API 過載"""
-    
-    def __init__(self, max_concurrent_serp=3, max_concurrent_gemini=2, gemini_min_interval=1.0):
-        self.serp_semaphore = threading.Semaphore(max_concurrent_serp)
-        self.gemini_semaphore = threading.Semaphore(max_concurrent_gemini)
-        self.gemini_last_call = 0
-        self.gemini_min_interval = gemini_min_interval
-        self.lock = threading.Lock()
-        
-        # 統計用
-        self.stats = {
-            "serp_calls": 0,
-            "gemini_calls": 0,
-            "gemini_retries": 0,
-            "errors": []
-        }
-    
-    def call_serp(self, func, *args, **kwargs):
-        """執行 SERP API 呼叫，帶並發控制"""
-        with self.serp_semaphore:
-            try:
-                result = func(*args, **kwargs)
-                with self.lock:
-                    self.stats["serp_calls"] += 1
-                time.sleep(0.5)  # 基本間隔避免過快
-                return result
-            except Exception as e:
-                with self.lock:
-                    self.stats["errors"].append(f"SERP: {str(e)}")
-                raise
-    
-    def call_gemini(self, func, *args, **kwargs):
-        """執行 Gemini API 呼叫，帶並發控制 + 速率限制 + 重試"""
-        with self.gemini_semaphore:
-            # 確保最小間隔
-            with self.lock:
-                elapsed = time.time() - self.gemini_last_call
-                if elapsed < self.gemini_min_interval:
-                    time.sleep(self.gemini_min_interval - elapsed)
-                self.gemini_last_call = time.time()
-            
-            # Exponential backoff retry
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    result = func(*args, **kwargs)
-                    with self.lock:
-                        self.stats["gemini_calls"] += 1
-                    return result
-                except Exception as e:
-                    error_str = str(e).lower()
-                    is_rate_limit = any(x in error_str for x in ["429", "quota", "rate", "limit"])
-                    
-                    if is_rate_limit and attempt < max_retries - 1:
-                        wait_time = (2 ** attempt) + random.uniform(0.5, 1.5)
-                        with self.lock:
-                            self.stats["gemini_retries"] += 1
-                        time.sleep(wait_time)
-                    else:
-                        with self.lock:
-                            self.stats["errors"].append(f"Gemini: {str(e)}")
-                        raise
-            
-            # 最後一次嘗試
-            return func(*args, **kwargs)
+    st.divider()
+    st.header("🤝 共用額度")
+    SHARED_QUOTA = st.checkbox(
+        "與其他 session 共用 API 額度",
+        value=True,
+        help="同一台伺服器上所有 session 與 process（含 CLI）使用相同 API Key 時，共同遵守以下 RPM 與每日預算，並公平分配"
+    )
+    SHARED_GEMINI_RPM = st.number_input(
+        "Gemini 共用 RPM", min_value=1, max_value=10_000, value=60, disabled=not SHARED_QUOTA
+    )
+    SHARED_SERP_RPM = st.number_input(
+        "SERP 共用 RPM", min_value=1, max_value=10_000, value=300, disabled=not SHARED_QUOTA
+    )
+    GEMINI_DAILY_BUDGET = st.number_input(
+        "Gemini 每日預算（請求數）", min_value=0, max_value=10_000_000, value=0, step=100,
+        disabled=not SHARED_QUOTA, help="0 表示不限制"
+    )
+    SERP_DAILY_BUDGET = st.number_input(
+        "SERP 每日預算（請求數）", min_value=0, max_value=10_000_000, value=0, step=100,
+        disabled=not SHARED_QUOTA, help="0 表示不限制；Custom Search 免費額度為每日 100 次"
+    )
 
+    st.divider()
+    st.header("📦 批次分析")
+    BATCH_MODE = st.checkbox(
+        "啟用批次策略分析",
+        value=False,
+        help="將多個關鍵字的 SERP 合併成一次 Gemini 請求，大量關鍵字時可大幅減少請求數"
+    )
+    BATCH_MAX_KEYWORDS = st.slider(
+        "每批最多關鍵字數",
+        min_value=2,
+        max_value=20,
+        value=8,
+        disabled=not BATCH_MODE
+    )
+    BATCH_TOKEN_BUDGET = st.number_input(
+        "每批 token 預算",
+        min_value=4_000,
+        max_value=200_000,
+        value=32_000,
+        step=4_000,
+        disabled=not BATCH_MODE,
+        help="依每個關鍵字的 SERP 大小估算 token，自動決定每批的關鍵字數"
+    )
+
+    st.divider()
+    st.header("💾 快取設定")
+    SERP_CACHE_TTL_HOURS = st.slider(
+        "SERP 快取有效期（小時）",
+        min_value=0,
+        max_value=SERP_CACHE_MAX_TTL_HOURS,
+        value=24,
+        help="相同關鍵字/地區/語言/頁數在有效期內直接使用快取，不耗 CSE 配額；設為 0 則停用"
+    )
+    SERP_CACHE_MAX_MB = st.slider(
+        "SERP 快取容量上限（MB）",
+        min_value=10,
+        max_value=500,
+        value=50,
+        step=10,
+        help="超過上限時淘汰最久未使用的項目"
+    )
+    BYPASS_GEMINI_CACHE = st.checkbox(
+        "本次略過 Gemini 快取",
+        value=False,
+        help="強制重新呼叫 Gemini（新結果仍會寫回快取）"
+    )
+
+    st.divider()
+    st.header("🎞️ 錄製 / 重播")
+    # 模式為整個 process 共用，只在啟動時由環境變數設定（SERP_RADAR_REPLAY / SERP_RADAR_REPLAY_ARCHIVE），
+    # 避免不同 session 在執行途中互相切換模式或清空錄製檔
+    REPLAY_MODE = replay_mode()
+    _tape = current_tape()
+    st.caption(
+        {"off": "關閉", "record": "錄製", "replay": "重播"}[REPLAY_MODE]
+        + (f"：{_tape.path}" if _tape is not None else "")
+        + "（以環境變數 SERP_RADAR_REPLAY 設定，或使用 cli.py --record / --replay）"
+    )
+    if REPLAY_MODE != "off":
+        # 快取命中的呼叫不會經過錄製檔，錄製 / 重播時一律停用
+        SERP_CACHE_TTL_HOURS = 0
+        BYPASS_GEMINI_CACHE = True
+        st.caption("錄製 / 重播時不使用快取；DOM 文字與 PDF 擷取仍需開啟瀏覽器連網")
 
 # =================================================
-# 4. Phase 1: 關鍵字探索 Helper Functions
+# 3. 共用資源（跨 session）
 # =================================================
-from playwright.sync_api import sync_playwright
-import tempfile
-import os
-
-def convert_url_to_pdf(url):
-    """將網頁轉換為 PDF 檔案（使用 Playwright）"""
-    try:
-        # 建立暫存檔
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
-            pdf_path = tmp_file.name
-        
-        with sync_playwright() as p:
-            browser = p.chromium.launch()
-            page = browser.new_page()
-            
-            # 設定一些 header 避免被擋
-            page.set_extra_http_headers({
-                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            })
-            
-            try:
-                page.goto(url, wait_until="networkidle", timeout=20000)
-            except Exception:
-                # 如果超時，嘗試繼續執行（可能資源載入慢）
-                pass
-                
-            # 產生 PDF
-            page.pdf(path=pdf_path, format="A4", print_background=True)
-            browser.close()
-            
-        return pdf_path, None
-        
-    except Exception as e:
-        return None, f"PDF 轉換失敗：{str(e)}"
+@st.cache_resource
+def get_serp_cache():
+    """SERP 磁碟快取（跨 session 共用）"""
+    return open_serp_cache()
 
 
-def extract_keywords_with_pdf(api_key, pdf_path, product_name, model_name):
-    """使用 Gemini 讀取 PDF 並萃取關鍵字"""
-    genai.configure(api_key=api_key)
-    
-    try:
-        # 上傳 PDF 到 Gemini
-        uploaded_file = genai.upload_file(pdf_path, mime_type="application/pdf")
-        
-        # 等待處理完成
-        while uploaded_file.state.name == "PROCESSING":
-            time.sleep(1)
-            uploaded_file = genai.get_file(uploaded_file.name)
-        
-        if uploaded_file.state.name == "FAILED":
-            return None, "PDF 上傳處理失敗"
-        
-        # 使用模型分析
-        model = genai.GenerativeModel(model_name)
-        
-        prompt = f"""
-你是一位專業的 SEO 關鍵字研究專家。
-
-請分析這份 PDF 文件的內容，針對產品/服務「{product_name}」萃取 30 組具有 SEO 價值的關鍵字。
-
-請將關鍵字分為三類：
-1. **痛點字（Pain Point Keywords）**：使用者可能遇到的問題、困擾、需求（例如：「失眠怎麼辦」「肩頸痠痛」）
-2. **產品字（Product Keywords）**：與產品/服務直接相關的搜尋詞（例如：「保健食品推薦」「按摩椅功能」）
-3. **品牌字（Brand Keywords）**：品牌名稱、競品名稱、商品型號（例如：「XXX品牌評價」「YYY vs ZZZ」）
-
-每類至少 8 組，總共 30 組關鍵字。
-
-請只用 JSON 回傳，不要任何 markdown 格式、不要 ```json```、不要任何前後說明文字：
-{{
-  "pain_point_keywords": [
-    {{"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"}},
-    {{"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}}
-  ],
-  "product_keywords": [
-    {{"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"}},
-    {{"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}}
-  ],
-  "brand_keywords": [
-    {{"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"}},
-    {{"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}}
-  ]
-}}
-"""
-        
-        response = model.generate_content([uploaded_file, prompt])
-        raw = response.text.strip()
-        cleaned = raw.replace("```json", "").replace("```", "").strip()
-        
-        # 清理暫存檔
-        try:
-            os.unlink(pdf_path)
-            genai.delete_file(uploaded_file.name)
-        except:
-            pass
-        
-        return json.loads(cleaned), None
-        
-    except json.JSONDecodeError as e:
-        # 嘗試修復
-        fixed = repair_json(api_key, raw, str(e))
-        if fixed:
-            return fixed, None
-        return None, f"JSON 解析失敗：{str(e)}"
-    except Exception as e:
-        return None, f"AI 分析 PDF 失敗：{str(e)}"
-
-
-def fetch_webpage_content(url):
-    """抓取網頁內容並轉換為純文字（優化版）"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-    }
-    
-    try:
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        response.encoding = response.apparent_encoding or 'utf-8'
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 移除不需要的元素
-        for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe', 'noscript']):
-            tag.decompose()
-        
-        # 取得主要內容
-        main_content = soup.find('main') or soup.find('article') or soup.find('body')
-        
-        if main_content:
-            # 轉換為純文字
-            h = html2text.HTML2Text()
-            h.ignore_links = True
-            h.ignore_images = True
-            h.ignore_emphasis = False
-            text = h.handle(str(main_content))
-            
-            # 清理多餘空白
-            lines = [line.strip() for line in text.split('\n') if line.strip()]
-            cleaned_text = '\n'.join(lines)
-            
-            # 限制長度避免 token 過多
-            if len(cleaned_text) > 20000:
-                cleaned_text = cleaned_text[:20000] + "..."
-            
-            return cleaned_text, None
-        else:
-            return None, "無法找到主要內容區塊"
-            
-    except requests.exceptions.RequestException as e:
-        return None, f"網頁抓取失敗：{str(e)}"
-    except Exception as e:
-        return None, f"內容解析錯誤：{str(e)}"
+@st.cache_resource
+def get_browser_pool():
+    """常駐 Chromium（跨 session 共用，首次使用時啟動）"""
+    pool = BrowserPool(max_contexts=4)
+    atexit.register(pool.close)
+    return pool
 
 
-def extract_keywords_from_content(api_key, content, product_name, model_name):
-    """AI 分析頁面內容，萃取 30 組關鍵字"""
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name)
-    
-    prompt = f"""
-你是一位專業的 SEO 關鍵字研究專家。
-
-請分析以下網頁內容，針對產品/服務「{product_name}」萃取 30 組具有 SEO 價值的關鍵字。
-
-網頁內容：
----
-{content}
----
-
-請將關鍵字分為三類：
-1. **痛點字（Pain Point Keywords）**：使用者可能遇到的問題、困擾、需求（例如：「失眠怎麼辦」「肩頸痠痛」）
-2. **產品字（Product Keywords）**：與產品/服務直接相關的搜尋詞（例如：「保健食品推薦」「按摩椅功能」）
-3. **品牌字（Brand Keywords）**：品牌名稱、競品名稱、商品型號（例如：「XXX品牌評價」「YYY vs ZZZ」）
-
-每類至少 8 組，總共 30 組關鍵字。
-
-請只用 JSON 回傳，不要任何 markdown 格式、不要 ```json```、不要任何前後說明文字：
-{{
-  "pain_point_keywords": [
-    {{"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"}},
-    {{"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}}
-  ],
-  "product_keywords": [
-    {{"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"}},
-    {{"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}}
-  ],
-  "brand_keywords": [
-    {{"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"}},
-    {{"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}}
-  ]
-}}
-"""
-    
-    try:
-        res = model.generate_content(prompt)
-        raw = res.text.strip()
-        cleaned = raw.replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned), None
-    except json.JSONDecodeError as e:
-        # 嘗試修復
-        fixed = repair_json(api_key, raw, str(e))
-        if fixed:
-            return fixed, None
-        return None, f"JSON 解析失敗：{str(e)}"
-    except Exception as e:
-        return None, f"AI 分析失敗：{str(e)}"
-
-
-def extract_keywords_from_content(api_key, content, product_name, model_name):
-    """AI 分析頁面內容，萃取 30 組關鍵字"""
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name)
-    
-    prompt = f"""
-你是一位專業的 SEO 關鍵字研究專家。
-
-請分析以下網頁內容，針對產品/服務「{product_name}」萃取 30 組具有 SEO 價值的關鍵字。
-
-網頁內容：
----
-{content}
----
-
-請將關鍵字分為三類：
-1. **痛點字（Pain Point Keywords）**：使用者可能遇到的問題、困擾、需求（例如：「失眠怎麼辦」「肩頸痠痛」）
-2. **產品字（Product Keywords）**：與產品/服務直接相關的搜尋詞（例如：「保健食品推薦」「按摩椅功能」）
-3. **品牌字（Brand Keywords）**：品牌名稱、競品名稱、商品型號（例如：「XXX品牌評價」「YYY vs ZZZ」）
-
-每類至少 8 組，總共 30 組關鍵字。
-
-請只用 JSON 回傳，不要任何 markdown 格式、不要 ```json```、不要任何前後說明文字：
-{{
-  "pain_point_keywords": [
-    {{"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"}},
-    {{"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}}
-  ],
-  "product_keywords": [
-    {{"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"}},
-    {{"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}}
-  ],
-  "brand_keywords": [
-    {{"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"}},
-    {{"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}}
-  ]
-}}
-"""
-    
-    try:
-        res = model.generate_content(prompt)
-        raw = res.text.strip()
-        cleaned = raw.replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned), None
-    except json.JSONDecodeError as e:
-        # 嘗試修復
-        fixed = repair_json(api_key, raw, str(e))
-        if fixed:
-            return fixed, None
-        return None, f"JSON 解析失敗：{str(e)}"
-    except Exception as e:
-        return None, f"AI 分析失敗：{str(e)}"
-
-
-def get_google_suggestions(keyword, gl, hl):
-    """取得 Google 搜尋建議 (Autocomplete)"""
-    try:
-        # 使用 Google Suggest API (Client=chrome 格式較好解析)
-        url = f"http://google.com/complete/search?client=chrome&q={keyword}&gl={gl}&hl={hl}"
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        
-        response = requests.get(url, headers=headers, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            # data[0] 是 query, data[1] 是 suggestions list
-            if len(data) >= 2 and isinstance(data[1], list):
-                return data[1][:8], None  # 取前 8 個建議
-        
-        return [], None
-        
-    except Exception as e:
-        return [], str(e)
+@st.cache_resource
+def get_suggest_cache():
+    """Google Suggest 快取（跨 session 共用）"""
+    return open_suggest_cache()
 
 
-# =================================================
-# 5. Phase 2: SERP 分析 Helper Functions
-# =================================================
-def detect_page_type(item):
-    """判斷 SERP 結果的頁面類型"""
-    link = (item.get("link") or "").lower()
-    title = (item.get("title") or "").lower()
-
-    if any(x in link for x in ["ptt.cc", "dcard", "reddit", "mobile01"]):
-        return "UGC / Forum"
-    if any(x in link for x in ["youtube.com", "instagram.com", "tiktok.com"]):
-        return "Social / Video"
-    if any(x in link for x in ["shopee", "momo", "pchome", "amazon", "/product/"]):
-        return "E-commerce"
-    if any(x in link for x in ["udn.com", "ltn.com", "ettoday", "/news/"]):
-        return "Media"
-    if "wiki" in link:
-        return "Wiki"
-    if any(x in title for x in ["價格", "優惠", "推薦"]):
-        return "Commercial Content"
-    return "General"
-
-
-def get_serp_raw(api_key, keyword, gl, hl, pages):
-    """抓取 SERP 資料"""
-    service = build("customsearch", "v1", developerKey=api_key)
-    results = []
-
-    for page in range(pages):
-        start = page * 10 + 1
-        res = service.cse().list(
-            q=keyword,
-            cx=SEARCH_ENGINE_ID,
-            num=10,
-            start=start,
-            gl=gl,
-            hl=hl
-        ).execute()
-
-        for i, item in enumerate(res.get("items", [])):
-            desc = item.get("snippet", "") or ""
-            if len(desc) > 200:
-                desc = desc[:200] + "..."
-
-            results.append({
-                "Rank": start + i,
-                "Type": detect_page_type(item),
-                "Title": item.get("title"),
-                "Description": desc,
-                "DisplayLink": item.get("displayLink"),
-                "URL": item.get("link")
-            })
+@st.cache_resource
+def get_gemini_cache():
+    """Gemini 回應快取（跨 session 共用）"""
+    return open_gemini_cache()
+
+
+@st.cache_resource
+def get_page_cache():
+    """競品頁面 HTTP 快取（跨 session 共用）"""
+    return open_page_cache()
 
-        if page < pages - 1:
-            time.sleep(0.8)
-
-    return results
-
-
-def repair_json(api_key, broken_text, error):
-    """嘗試修復 Gemini 回傳的壞 JSON"""
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.0-flash")
-
-    prompt = f"""
-Fix the JSON below and return ONLY valid JSON. No markdown, no explanation.
-
-Error: {error}
-
-Broken JSON:
-{broken_text}
-"""
-    try:
-        res = model.generate_content(prompt)
-        text = res.text.strip()
-        text = text.replace("```json", "").replace("```", "").strip()
-        return json.loads(text)
-    except Exception:
-        return None
-
-
-def analyze_strategy_raw(api_key, keyword, df, gl, model_name):
-    """執行 Gemini 策略分析"""
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name)
-
-    data = df[["Rank", "Type", "Title", "Description", "DisplayLink"]].to_string(index=False)
-
-    prompt = f"""
-你是 SEO 策略顧問。
-請分析關鍵字「{keyword}」在 Google（{gl}）的 SERP 戰場。
-
-資料：
-{data}
-
-請只用 JSON 回傳，不要任何 markdown 格式、不要 ```json```、不要任何前後說明文字：
-{{
-  "User_Intent": "描述使用者搜尋此關鍵字的意圖",
-  "Battlefield_Status": "目前 SERP 戰場的競爭狀態分析",
-  "Opportunity_Gap": "發現的機會缺口",
-  "Recommended_Page_Type": "建議製作的頁面類型",
-  "Winning_Angles": [
-    {{ "angle": "切角1", "target": "目標受眾" }},
-    {{ "angle": "切角2", "target": "目標受眾" }}
-  ],
-  "Killer_Titles": [
-    {{ "title": "標題1", "reason": "為何有效" }},
-    {{ "title": "標題2", "reason": "為何有效" }}
-  ]
-}}
-"""
-
-    try:
-        res = model.generate_content(prompt)
-        raw = res.text.strip()
-        cleaned = raw.replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned), raw
-    except json.JSONDecodeError as e:
-        fixed = repair_json(api_key, raw, str(e))
-        if fixed:
-            return fixed, raw
-        return {"error": str(e), "raw_response": raw}, raw
-    except Exception as e:
-        return {"error": str(e)}, str(e)
-
-
-def generate_content_direction(api_key, all_strategies, selected_keywords, model_name):
-    """根據所有關鍵字的 SERP 分析，產生內容寫作綜合指引"""
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name)
-    
-    # 整理所有策略資訊
-    strategy_summary = []
-    for s in all_strategies:
-        if "error" not in s:
-            strategy_summary.append({
-                "keyword": s.get("Keyword", ""),
-                "intent": s.get("User_Intent", ""),
-                "opportunity": s.get("Opportunity_Gap", ""),
-                "page_type": s.get("Recommended_Page_Type", "")
-            })
-    
-    prompt = f"""
-你是一位資深內容策略顧問。
-
-根據以下關鍵字的 SERP 戰場分析結果，請產生一份「內容寫作方向綜合指引」。
-
-分析的關鍵字：
-{json.dumps(selected_keywords, ensure_ascii=False)}
-
-各關鍵字的 SERP 分析摘要：
-{json.dumps(strategy_summary, ensure_ascii=False, indent=2)}
-
-請提供具體、可執行的內容策略建議。
-
-請只用 JSON 回傳，不要任何 markdown 格式、不要 ```json```、不要任何前後說明文字：
-{{
-  "content_theme": "核心主題方向（一句話描述這篇內容的核心定位）",
-  "target_audience": "目標受眾描述（他們是誰？在什麼情境下會搜尋？）",
-  "content_structure": [
-    {{"section": "建議段落標題1", "focus": "這段要涵蓋的重點內容", "keywords_to_use": ["建議使用的關鍵字"]}},
-    {{"section": "建議段落標題2", "focus": "這段要涵蓋的重點內容", "keywords_to_use": ["建議使用的關鍵字"]}},
-    {{"section": "建議段落標題3", "focus": "這段要涵蓋的重點內容", "keywords_to_use": ["建議使用的關鍵字"]}}
-  ],
-  "must_cover_topics": ["必須涵蓋的主題1", "必須涵蓋的主題2", "必須涵蓋的主題3"],
-  "differentiation_angle": "差異化切角（如何讓這篇內容與現有 SERP 結果不同）",
-  "content_format_suggestion": "建議的內容格式（例如：比較表、步驟教學、案例分析等）",
-  "avoid_pitfalls": ["需避免的寫作陷阱1", "需避免的寫作陷阱2"]
-}}
-"""
-    
-    try:
-        res = model.generate_content(prompt)
-        raw = res.text.strip()
-        cleaned = raw.replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned), None
-    except json.JSONDecodeError as e:
-        fixed = repair_json(api_key, raw, str(e))
-        if fixed:
-            return fixed, None
-        return None, f"JSON 解析失敗：{str(e)}"
-    except Exception as e:
-        return None, f"內容指引產生失敗：{str(e)}"
-
-
-def process_single_keyword(kw, executor, google_key, gemini_key, gl, hl, pages, model_name):
-    """處理單一關鍵字的完整流程（SERP + 分析）"""
-    result = {
-        "keyword": kw,
-        "serp_df": None,
-        "serp_raw": None,
-        "strategy": None,
-        "raw_response": None,
-        "error": None,
-        "timing": {}
-    }
-    
-    try:
-        # Step 1: SERP 抓取
-        start_serp = time.time()
-        serp_data = executor.call_serp(
-            get_serp_raw, google_key, kw, gl, hl, pages
-        )
-        result["timing"]["serp"] = time.time() - start_serp
-        result["serp_raw"] = serp_data
-        result["serp_df"] = pd.DataFrame(serp_data)
-        
-        # Step 2: Gemini 分析
-        start_gemini = time.time()
-        strategy, raw = executor.call_gemini(
-            analyze_strategy_raw, gemini_key, kw, result["serp_df"], gl, model_name
-        )
-        result["timing"]["gemini"] = time.time() - start_gemini
-        result["strategy"] = strategy
-        result["raw_response"] = raw
-        
-    except Exception as e:
-        result["error"] = str(e)
-    
-    return result
+
+@st.cache_resource
+def get_run_store():
+    """第二階段執行結果（依 run id 保存，rerun 時讀回）"""
+    return RunStore()
 
 
 # =================================================
-# 6. Session State 初始化
+# 4. Session State 初始化
 # =================================================
 if "phase1_keywords" not in st.session_state:
     st.session_state.phase1_keywords = None
@@ -674,15 +294,409 @@ if "phase1_completed" not in st.session_state:
     st.session_state.phase1_completed = False
 if "select_all_mode" not in st.session_state:
     st.session_state.select_all_mode = None  # None, 'all', 'none'
+if "phase1_timings" not in st.session_state:
+    st.session_state.phase1_timings = []
+if "phase2_run_id" not in st.session_state:
+    st.session_state.phase2_run_id = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:8]
 
 
 # =================================================
-# 7. Main App - 兩階段分頁
+# 5. 結果呈現 Helper Functions
+# =================================================
+def render_keyword_result(kw, r):
+    """顯示單一關鍵字的戰場分布與策略結論"""
+    st.subheader(f"🔍 {kw}")
+    
+    if r.get("timing"):
+        timing = r["timing"]
+        pages_timing = f" ｜ 頁面: {timing['pages']:.1f}s" if "pages" in timing else ""
+        st.caption(f"⏱️ SERP: {timing.get('serp', 0):.1f}s{pages_timing} ｜ Gemini: {timing.get('gemini', 0):.1f}s")
+    
+    if r.get("error"):
+        st.error(f"❌ 處理失敗：{r['error']}")
+        st.divider()
+        return
+    
+    df = r.get("serp_df")
+    strategy = r.get("strategy")
+    
+    # 戰場分布
+    with st.expander("📊 戰場分布", expanded=True):
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            if df is not None:
+                st.dataframe(
+                    df[["Rank", "Type", "Title", "DisplayLink"]], 
+                    use_container_width=True, 
+                    height=220
+                )
+        with col2:
+            if df is not None and not df.empty:
+                type_counts = df["Type"].value_counts().reset_index()
+                type_counts.columns = ["Type", "Count"]
+                chart = alt.Chart(type_counts).mark_arc(innerRadius=50).encode(
+                    theta="Count",
+                    color="Type",
+                    tooltip=["Type", "Count"]
+                )
+                st.altair_chart(chart, use_container_width=True)
+    
+    competitor_pages = r.get("competitor_pages")
+    if competitor_pages:
+        fetched = sum(1 for page in competitor_pages if page.get("text"))
+        with st.expander(f"📄 前 {len(competitor_pages)} 名頁面內容（成功 {fetched}）", expanded=False):
+            for page in competitor_pages:
+                if page.get("text"):
+                    st.markdown(f"**#{page['rank']}** {page['url']}")
+                    st.caption(page["text"][:300])
+                else:
+                    st.markdown(f"**#{page['rank']}** {page['url']} — ❌ {page.get('error') or '無內容'}")
+    
+    # 策略結論
+    if strategy and "error" not in strategy:
+        st.markdown("### 🧠 策略結論")
+        
+        col_a, col_b = st.columns(2)
+        with col_a:
+            st.info(f"**使用者意圖**\n{strategy.get('User_Intent', 'N/A')}")
+            st.success(f"**機會缺口**\n{strategy.get('Opportunity_Gap', 'N/A')}")
+        with col_b:
+            st.warning(f"**戰場狀態**\n{strategy.get('Battlefield_Status', 'N/A')}")
+            st.info(f"**建議頁型**\n{strategy.get('Recommended_Page_Type', 'N/A')}")
+
+        st.markdown("**致勝切角**")
+        for a in strategy.get("Winning_Angles", []):
+            st.markdown(f"- **{a.get('angle', '')}**（{a.get('target', '')}）")
+
+        st.markdown("**必勝標題**")
+        for t in strategy.get("Killer_Titles", []):
+            st.markdown(f"- {t.get('title', '')}｜{t.get('reason', '')}")
+    
+    elif strategy and "error" in strategy:
+        st.error("❌ 策略解析失敗")
+        with st.expander("查看原始回應"):
+            st.code(r.get("raw_response", "N/A"))
+    
+    st.divider()
+
+
+def render_provider_metrics(metrics):
+    """各 provider 的等待 / 執行延遲分位數、429 比例與 token 用量"""
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else "-"
+
+    rows = []
+    for provider, snap in metrics["providers"].items():
+        wait, elapsed = snap["queue_wait"], snap["exec"]
+        rows.append({
+            "Provider": provider.upper(),
+            "請求數": snap["requests"],
+            "等待 p50/p95/p99 (ms)": f"{ms(wait['p50'])} / {ms(wait['p95'])} / {ms(wait['p99'])}",
+            "執行 p50/p95/p99 (ms)": f"{ms(elapsed['p50'])} / {ms(elapsed['p95'])} / {ms(elapsed['p99'])}",
+            "429 比例": f"{snap['throttle_rate']:.1%}",
+            "Token（輸入/輸出）": f"{snap['prompt_tokens']:,} / {snap['output_tokens']:,}" if snap["total_tokens"] else "-",
+            "瓶頸": ("本地限速" if limiter_bound(snap) else "Provider 回應") if snap["requests"] else "-"
+        })
+    st.markdown("**延遲分布（每次嘗試）**")
+    st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+    col_json, col_prom = st.columns(2)
+    with col_json:
+        st.download_button(
+            "下載指標 JSON",
+            data=metrics_to_json(metrics),
+            file_name=f"serp_radar_metrics_{int(metrics['started'])}.json",
+            mime="application/json",
+            key=f"metrics_json_{metrics['started']}"
+        )
+    with col_prom:
+        st.download_button(
+            "下載 Prometheus 格式",
+            data=to_prometheus(metrics),
+            file_name=f"serp_radar_metrics_{int(metrics['started'])}.prom",
+            mime="text/plain",
+            key=f"metrics_prom_{metrics['started']}"
+        )
+
+
+def quota_status_text(quota_stats):
+    """共用額度：此 session 的占比與排隊順位"""
+    parts = []
+    for provider, q in quota_stats.items():
+        text = f"{provider.upper()} 占比 {q['share']:.0%}（{q['active_sessions']} 個 session"
+        if q["queue_position"]:
+            text += f"，排隊第 {q['queue_position']} 位"
+        text += "）"
+        if q["daily_budget"]:
+            text += f" 今日 {q['daily_used']}/{q['daily_budget']}"
+        parts.append(text)
+    return "🤝 " + "｜".join(parts)
+
+
+def render_run_stats(stats):
+    """執行統計（數值於執行結束時記錄在 run store）"""
+    with st.expander("📊 執行統計", expanded=False):
+        stat_cols = st.columns(4)
+        with stat_cols[0]:
+            st.metric("SERP 呼叫次數", stats.get("serp_calls", 0))
+        with stat_cols[1]:
+            st.metric("Gemini 呼叫次數", stats.get("gemini_calls", 0))
+        with stat_cols[2]:
+            st.metric("Gemini 重試次數", stats.get("gemini_retries", 0))
+        with stat_cols[3]:
+            st.metric("總耗時", f"{stats.get('total_time', 0):.1f}s")
+
+        serp_cache_stats = stats.get("serp_cache")
+        if serp_cache_stats:
+            cache_cols = st.columns(4)
+            with cache_cols[0]:
+                st.metric("SERP 快取命中", serp_cache_stats["hits"])
+            with cache_cols[1]:
+                st.metric("SERP 快取未命中", serp_cache_stats["misses"])
+            with cache_cols[2]:
+                st.metric("快取淘汰", serp_cache_stats["evictions"])
+            with cache_cols[3]:
+                st.metric("快取大小", f"{serp_cache_stats['size_mb']:.1f} MB")
+
+        gemini_cache_stats = stats.get("gemini_cache") or {}
+        gemini_cols = st.columns(4)
+        with gemini_cols[0]:
+            st.metric("Gemini 快取命中", gemini_cache_stats.get("hits", 0))
+        with gemini_cols[1]:
+            st.metric("Gemini 快取未命中", gemini_cache_stats.get("misses", 0))
+        with gemini_cols[2]:
+            st.metric("Gemini 目前 RPM", f"{stats.get('gemini_rpm', 0):.0f}")
+        with gemini_cols[3]:
+            st.metric("SERP 重試次數", stats.get("serp_retries", 0))
+
+        page_stats = stats.get("pages")
+        if page_stats:
+            page_cols = st.columns(4)
+            with page_cols[0]:
+                st.metric("頁面請求（去重後）", page_stats["requested"] - page_stats["deduplicated"],
+                          help=f"共 {page_stats['requested']} 個排名網址，{page_stats['deduplicated']} 個與其他關鍵字重複")
+            with page_cols[1]:
+                st.metric("頁面快取命中", page_stats["cache_fresh"] + page_stats["not_modified"],
+                          help=f"未過期 {page_stats['cache_fresh']}，304 重新驗證 {page_stats['not_modified']}")
+            with page_cols[2]:
+                st.metric("頁面下載", page_stats["downloaded"])
+            with page_cols[3]:
+                st.metric("頁面抓取失敗", page_stats["errors"])
+
+        quota_stats = stats.get("quota")
+        if quota_stats:
+            st.markdown("**🤝 共用額度（最近 60 秒）**")
+            quota_cols = st.columns(len(quota_stats) * 2)
+            for i, (provider, q) in enumerate(quota_stats.items()):
+                with quota_cols[i * 2]:
+                    st.metric(f"{provider.upper()} 本 session 占比", f"{q['share']:.0%}",
+                              help=f"{q['session_requests']}/{q['window_requests']} 次請求")
+                with quota_cols[i * 2 + 1]:
+                    budget = f"/{q['daily_budget']}" if q["daily_budget"] else ""
+                    st.metric(f"{provider.upper()} 今日用量", f"{q['daily_used']}{budget}",
+                              help=f"使用中的 session：{q['active_sessions']}")
+
+        json_stats = stats.get("json")
+        if json_stats:
+            json_cols = st.columns(4)
+            with json_cols[0]:
+                st.metric("JSON 本地修復", json_stats["local_repair"])
+            with json_cols[1]:
+                st.metric("JSON Gemini 修復", json_stats["remote_repair"])
+            with json_cols[2]:
+                st.metric("JSON 解析失敗", json_stats["failed"])
+            with json_cols[3]:
+                st.metric("結構不符 schema", json_stats["schema_invalid"])
+
+        pipeline_stats = stats.get("pipeline")
+        if pipeline_stats:
+            pipe_cols = st.columns(4)
+            with pipe_cols[0]:
+                st.metric("佇列平均深度", f"{pipeline_stats['queue_avg']:.1f}")
+            with pipe_cols[1]:
+                st.metric("佇列最大深度", f"{pipeline_stats['queue_max']} / {stats.get('queue_size', '?')}")
+            with pipe_cols[2]:
+                st.metric("SERP 階段使用率", f"{pipeline_stats['fetch_utilization']:.0%}")
+            with pipe_cols[3]:
+                st.metric("分析階段使用率", f"{pipeline_stats['analyze_utilization']:.0%}")
+            if stats.get("batch_mode"):
+                st.caption(f"📦 批次模式：{pipeline_stats['analyze_done']} 個關鍵字共 {pipeline_stats['analyze_batches']} 批")
+
+        metrics = stats.get("metrics")
+        if metrics:
+            render_provider_metrics(metrics)
+
+        errors = stats.get("errors") or []
+        if errors:
+            st.warning(f"發生 {len(errors)} 個錯誤")
+            for err in errors:
+                st.text(err)
+
+
+STRATEGY_FIELD_LABELS = OrderedDict([
+    ("User_Intent", "使用者意圖"),
+    ("Battlefield_Status", "戰場狀態"),
+    ("Opportunity_Gap", "機會缺口"),
+    ("Recommended_Page_Type", "建議頁型"),
+    ("Winning_Angles", "致勝切角"),
+    ("Killer_Titles", "必勝標題"),
+])
+
+CONTENT_DIRECTION_FIELD_LABELS = OrderedDict([
+    ("content_theme", "核心主題方向"),
+    ("target_audience", "目標受眾"),
+    ("content_structure", "建議文章架構"),
+    ("must_cover_topics", "必須涵蓋的主題"),
+    ("differentiation_angle", "差異化切角"),
+    ("content_format_suggestion", "建議內容格式"),
+    ("avoid_pitfalls", "需避免的陷阱"),
+])
+
+
+def render_partial_fields(fields, labels):
+    """串流中先行顯示已完成的欄位（完成後改由正式的區塊顯示）"""
+    for key, label in labels.items():
+        if key not in fields:
+            continue
+        value = fields[key]
+        st.markdown(f"**{label}**")
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    item = "｜".join(str(v) for v in item.values() if not isinstance(v, list))
+                st.markdown(f"- {item}")
+        else:
+            st.write(value)
+    pending = [label for key, label in labels.items() if key not in fields]
+    if pending:
+        st.caption(f"⏳ 產生中：{'、'.join(pending)}")
+
+
+def render_content_direction(content_direction, error=None):
+    """內容寫作方向綜合指引"""
+    st.header("📝 內容寫作方向綜合指引")
+
+    if error:
+        st.error(f"❌ {error}")
+    elif content_direction:
+        # 核心主題
+        st.markdown("### 🎯 核心主題方向")
+        st.info(content_direction.get("content_theme", "N/A"))
+
+        # 目標受眾
+        st.markdown("### 👥 目標受眾")
+        st.success(content_direction.get("target_audience", "N/A"))
+
+        # 建議文章架構
+        st.markdown("### 📐 建議文章架構")
+        for section in content_direction.get("content_structure", []):
+            with st.container():
+                st.markdown(f"**{section.get('section', '')}**")
+                st.write(section.get('focus', ''))
+                if section.get('keywords_to_use'):
+                    st.caption(f"建議使用關鍵字：{', '.join(section['keywords_to_use'])}")
+                st.markdown("---")
+
+        # 必須涵蓋的主題
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("### ✅ 必須涵蓋的主題")
+            for topic in content_direction.get("must_cover_topics", []):
+                st.markdown(f"- {topic}")
+
+        with col2:
+            st.markdown("### ⚠️ 需避免的陷阱")
+            for pitfall in content_direction.get("avoid_pitfalls", []):
+                st.markdown(f"- {pitfall}")
+
+        # 差異化切角
+        st.markdown("### 💡 差異化切角")
+        st.warning(content_direction.get("differentiation_angle", "N/A"))
+
+        # 內容格式建議
+        st.markdown("### 📄 建議內容格式")
+        st.info(content_direction.get("content_format_suggestion", "N/A"))
+
+    st.divider()
+
+
+def render_download(record, fmt, label, file_name, mime):
+    """
+    單一格式的下載按鈕。
+    Streamlit 支援延後產生時，按下按鈕才在背景產生內容（不保留在 run record）；
+    舊版則先按「產生」才建立該格式，只有使用者要求的格式會佔用記憶體
+    """
+    key = f"{fmt}_{record.run_id}"
+    if DEFERRED_DOWNLOADS:
+        st.download_button(
+            label=label, data=lambda: record.export(fmt, keep=False),
+            file_name=file_name, mime=mime, key=key
+        )
+        return
+
+    ready_key = f"ready_{key}"
+    if st.session_state.get(ready_key) or st.button(f"⚙️ 產生 {fmt.upper()} 檔案", key=f"prepare_{key}"):
+        st.session_state[ready_key] = True
+        st.download_button(label=label, data=record.export(fmt), file_name=file_name, mime=mime, key=key)
+
+
+def render_run(record):
+    """從 run store 重畫整次執行結果（下載按鈕等互動造成的 rerun 不需重跑分析）"""
+    stats = record.stats
+    st.divider()
+    st.success(
+        f"✅ SERP 分析完成！{len(record.keywords)} 組關鍵字，總耗時 {stats.get('total_time', 0):.1f} 秒"
+        + (f"（其中 {stats['restored']} 組從執行紀錄恢復）" if stats.get("restored") else "")
+    )
+    render_run_stats(stats)
+    st.divider()
+
+    for kw in record.keywords:
+        r = record.results.get(kw)
+        if r is not None:
+            render_keyword_result(kw, r)
+
+    reports, _ = record.reports()
+    if not reports:
+        return
+
+    render_content_direction(record.content_direction, record.content_error)
+
+    # Excel / JSON / NDJSON / Parquet 輸出（下載時才產生，不在每次重畫時建立全部格式）
+    st.subheader("📥 下載報告")
+    stamp = int(record.created_at)
+    col_dl1, col_dl2 = st.columns(2)
+    with col_dl1:
+        render_download(
+            record, "xlsx", "📊 下載完整 Excel 報告", f"seo_strategy_{stamp}.xlsx",
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    with col_dl2:
+        render_download(record, "json", "📄 下載 JSON 備份", f"seo_strategy_{stamp}.json", "application/json")
+
+    with st.expander("📦 分析用格式（NDJSON / Parquet）"):
+        render_download(
+            record, "ndjson", "下載 NDJSON（每行一個關鍵字）", f"seo_strategy_{stamp}.ndjson",
+            "application/x-ndjson"
+        )
+        if parquet_available():
+            render_download(
+                record, "parquet", "下載 Parquet（SERP 列 + 策略摘要）", f"seo_strategy_{stamp}.parquet",
+                "application/octet-stream"
+            )
+        else:
+            st.caption("安裝 pyarrow 後可下載 Parquet")
+
+
+# =================================================
+# 6. Main App - 兩階段分頁
 # =================================================
 tab1, tab2 = st.tabs(["🔍 第一階段：關鍵字探索", "📊 第二階段：SERP 戰略分析"])
 
 # =================================================
-# 7.1 第一階段：關鍵字探索
+# 6.1 第一階段：關鍵字探索
 # =================================================
 with tab1:
     st.markdown("""
@@ -704,6 +718,25 @@ with tab1:
             help="用於引導 AI 萃取更精準的關鍵字"
         )
     
+    capture_col1, capture_col2 = st.columns([2, 1])
+    with capture_col1:
+        CAPTURE_MODE = st.radio(
+            "網頁擷取模式",
+            ["DOM 文字", "PDF"],
+            index=0,
+            horizontal=True,
+            help="DOM 文字：直接從渲染後頁面取主要內容，省去 PDF 上傳與處理等待；PDF：保留完整版面交給 Gemini 讀取"
+        )
+    with capture_col2:
+        DOM_SCREENSHOTS = st.number_input(
+            "附加截圖數（DOM 模式）",
+            min_value=0,
+            max_value=4,
+            value=0,
+            disabled=CAPTURE_MODE != "DOM 文字",
+            help="附上主要內容區塊的壓縮截圖，讓 AI 參考版面資訊"
+        )
+    
     # 備用方案：直接貼上內容
     with st.expander("📝 備用方案：直接貼上網頁內容"):
         manual_content = st.text_area(
@@ -713,7 +746,7 @@ with tab1:
         )
     
     if st.button("🚀 開始關鍵字探索", type="primary", key="phase1_btn"):
-        if not (GOOGLE_API_KEY and GEMINI_API_KEY):
+        if REPLAY_MODE != "replay" and not (GOOGLE_API_KEY and GEMINI_API_KEY):
             st.error("請先在側邊欄輸入 Google API Key 與 Gemini API Key")
             st.stop()
         
@@ -724,19 +757,46 @@ with tab1:
         keywords_data = None
         error = None
         
-        # 優先使用 PDF 轉換 + Gemini 讀取
+        # 優先使用瀏覽器渲染（DOM 文字或 PDF）+ Gemini 讀取
         if input_url:
-            with st.spinner("📄 正在將網頁轉換為 PDF..."):
-                pdf_path, pdf_error = convert_url_to_pdf(input_url)
+            capture_start = time.time()
+            pdf_path = None
+            pdf_text = None
+            dom_content = None
+            dom_images = []
+            
+            if CAPTURE_MODE == "DOM 文字":
+                with st.spinner("🧭 正在擷取渲染後的頁面內容..."):
+                    dom_content, dom_images, capture_error = extract_dom_content(
+                        input_url, get_browser_pool(), screenshots=DOM_SCREENSHOTS
+                    )
+            else:
+                with st.spinner("📄 正在將網頁轉換為 PDF..."):
+                    pdf_path, pdf_text, capture_error = convert_url_to_pdf(input_url, get_browser_pool())
+            capture_time = time.time() - capture_start
+            analysis_start = time.time()
             
-            if pdf_path:
+            if dom_content:
+                st.success(f"✅ 頁面內容擷取成功（{len(dom_content)} 字，{len(dom_images)} 張截圖）")
+                with st.expander("📄 擷取到的內容預覽", expanded=False):
+                    st.text(dom_content[:2000] + "..." if len(dom_content) > 2000 else dom_content)
+                
+                with st.spinner("🤖 AI 正在分析並萃取關鍵字..."):
+                    keywords_data, error = extract_keywords_from_content(
+                        GEMINI_API_KEY, dom_content, product_name, MODEL_NAME,
+                        cache=get_gemini_cache(), bypass_cache=BYPASS_GEMINI_CACHE,
+                        images=dom_images
+                    )
+            elif pdf_path:
                 st.success("✅ PDF 轉換成功")
                 with st.spinner("🤖 AI 正在讀取 PDF 並萃取關鍵字..."):
                     keywords_data, error = extract_keywords_with_pdf(
-                        GEMINI_API_KEY, pdf_path, product_name, MODEL_NAME
+                        GEMINI_API_KEY, pdf_path, product_name, MODEL_NAME,
+                        cache=get_gemini_cache(), bypass_cache=BYPASS_GEMINI_CACHE,
+                        source_url=input_url, page_text=pdf_text
                     )
             else:
-                st.warning(f"⚠️ PDF 轉換失敗：{pdf_error}")
+                st.warning(f"⚠️ {capture_error}")
                 st.info("嘗試使用備用方案（HTML 文字抓取）...")
                 
                 # 備用方案：HTML 文字抓取
@@ -749,23 +809,38 @@ with tab1:
                     
                     with st.spinner("🤖 AI 正在分析並萃取關鍵字..."):
                         keywords_data, error = extract_keywords_from_content(
-                            GEMINI_API_KEY, content, product_name, MODEL_NAME
+                            GEMINI_API_KEY, content, product_name, MODEL_NAME,
+                            cache=get_gemini_cache(), bypass_cache=BYPASS_GEMINI_CACHE
                         )
                 elif manual_content:
                     st.info("使用您貼上的內容繼續分析...")
                     with st.spinner("🤖 AI 正在分析並萃取關鍵字..."):
                         keywords_data, error = extract_keywords_from_content(
-                            GEMINI_API_KEY, manual_content, product_name, MODEL_NAME
+                            GEMINI_API_KEY, manual_content, product_name, MODEL_NAME,
+                            cache=get_gemini_cache(), bypass_cache=BYPASS_GEMINI_CACHE
                         )
                 else:
                     st.error(f"❌ 無法取得網頁內容：{fetch_error}")
                     st.stop()
+            
+            # 記錄各擷取模式的耗時，方便比較
+            analysis_time = time.time() - analysis_start
+            st.session_state.phase1_timings.append({
+                "模式": CAPTURE_MODE if (dom_content or pdf_path) else "HTML 抓取（備用）",
+                "截圖數": len(dom_images),
+                "擷取 (s)": round(capture_time, 2),
+                "AI 分析 (s)": round(analysis_time, 2),
+                "總計 (s)": round(capture_time + analysis_time, 2),
+                "網址": input_url
+            })
+            st.caption(f"⏱️ 擷取：{capture_time:.1f}s ｜ AI 分析：{analysis_time:.1f}s")
         
         elif manual_content:
             # 只有手動內容
             with st.spinner("🤖 AI 正在分析並萃取關鍵字..."):
                 keywords_data, error = extract_keywords_from_content(
-                    GEMINI_API_KEY, manual_content, product_name, MODEL_NAME
+                    GEMINI_API_KEY, manual_content, product_name, MODEL_NAME,
+                    cache=get_gemini_cache(), bypass_cache=BYPASS_GEMINI_CACHE
                 )
         else:
             st.error("請輸入網址或貼上網頁內容")
@@ -775,7 +850,7 @@ with tab1:
             st.error(f"❌ {error}")
             st.stop()
         
-        # 為每個關鍵字取得 Search Suggestion
+        # 為每個關鍵字取得 Search Suggestion（並行 + 共用連線 + 快取）
         st.info("🔄 正在擷取 Google Autocomplete 真實搜尋建議...")
         progress_bar = st.progress(0)
         
@@ -783,35 +858,40 @@ with tab1:
         categories = ["pain_point_keywords", "product_keywords", "brand_keywords"]
         category_names = {"pain_point_keywords": "痛點字", "product_keywords": "產品字", "brand_keywords": "品牌字"}
         
-        total_kw = sum(len(keywords_data.get(cat, [])) for cat in categories)
-        processed = 0
+        seed_keywords = [
+            kw_item.get("keyword", "")
+            for category in categories
+            for kw_item in keywords_data.get(category, [])
+        ]
+        suggestions = fetch_suggestions_bulk(
+            seed_keywords, TARGET_GL, TARGET_HL,
+            max_workers=MAX_CONCURRENT_SUGGEST,
+            depth=SUGGEST_DEPTH,
+            cache=get_suggest_cache() if REPLAY_MODE == "off" else None,
+            on_progress=lambda done, total: progress_bar.progress(done / total)
+        )
         
         for category in categories:
             kw_list = keywords_data.get(category, [])
             for kw_item in kw_list:
                 keyword = kw_item.get("keyword", "")
                 if keyword:
-                    # 使用 Google Suggest API
-                    related, _ = get_google_suggestions(
-                        keyword, TARGET_GL, TARGET_HL
-                    )
-                    
                     all_keywords.append({
                         "category": category,
                         "category_name": category_names[category],
                         "keyword": keyword,
                         "search_intent": kw_item.get("search_intent", ""),
-                        "related": related
+                        "related": suggestions.get(keyword, [])
                     })
-                    processed += 1
-                    progress_bar.progress(processed / total_kw)
-                    # Suggest API 不需要太長間隔，但還是給一點點
-                    time.sleep(0.1)
         
         progress_bar.empty()
         st.session_state.phase1_keywords = all_keywords
         st.success(f"✅ 成功萃取 {len(all_keywords)} 組關鍵字！")
     
+    if st.session_state.phase1_timings:
+        with st.expander("⏱️ 擷取模式耗時比較", expanded=False):
+            st.dataframe(pd.DataFrame(st.session_state.phase1_timings), hide_index=True, use_container_width=True)
+    
     # 顯示關鍵字結果與選取介面
     if st.session_state.phase1_keywords:
         st.divider()
@@ -899,7 +979,7 @@ with tab1:
 
 
 # =================================================
-# 7.2 第二階段：SERP 戰略分析
+# 6.2 第二階段：SERP 戰略分析
 # =================================================
 with tab2:
     st.markdown("""
@@ -941,10 +1021,20 @@ with tab2:
         with col2:
             st.metric("預估 SERP 呼叫", len(keywords_preview) * MAX_PAGES)
         with col3:
-            st.metric("預估 Gemini 呼叫", len(keywords_preview) + 1)  # +1 for content direction
+            if BATCH_MODE:
+                st.metric("預估 Gemini 呼叫", -(-len(keywords_preview) // BATCH_MAX_KEYWORDS) + 1)
+            else:
+                st.metric("預估 Gemini 呼叫", len(keywords_preview) + 1)  # +1 for content direction
+    
+    RESUME_RUN = st.checkbox(
+        "♻️ 從上次中斷處續跑",
+        value=False,
+        help="相同關鍵字與設定（地區/語言/頁數/模型）已完成的結果直接從執行紀錄讀回，只分析尚未完成的關鍵字"
+             "（紀錄保留 7 天，不受 SERP 快取有效期與「略過 Gemini 快取」影響；未勾選時重新執行，舊紀錄不會被覆蓋）"
+    )
     
     if st.button("🚀 啟動戰略分析", type="primary", key="phase2_btn"):
-        if not (GOOGLE_API_KEY and GEMINI_API_KEY):
+        if REPLAY_MODE != "replay" and not (GOOGLE_API_KEY and GEMINI_API_KEY):
             st.error("請輸入 Google API Key 與 Gemini API Key")
             st.stop()
 
@@ -955,293 +1045,226 @@ with tab2:
             st.stop()
 
         # 初始化執行器
+        # 共用額度：跨 session / process 共同遵守 RPM 與每日預算（重播不會呼叫 API，不需要）
+        serp_quota, gemini_quota = None, None
+        if SHARED_QUOTA and REPLAY_MODE != "replay":
+            quota_manager = get_quota_manager()
+            session_id = st.session_state.session_id
+            serp_quota = SharedQuota(quota_manager, GOOGLE_API_KEY, "serp", session_id,
+                                     SHARED_SERP_RPM, SERP_DAILY_BUDGET)
+            gemini_quota = SharedQuota(quota_manager, GEMINI_API_KEY, "gemini", session_id,
+                                       SHARED_GEMINI_RPM, GEMINI_DAILY_BUDGET)
         executor = RateLimitedExecutor(
             max_concurrent_serp=MAX_CONCURRENT_SERP,
             max_concurrent_gemini=MAX_CONCURRENT_GEMINI,
-            gemini_min_interval=GEMINI_MIN_INTERVAL
+            gemini_min_interval=GEMINI_MIN_INTERVAL,
+            serp_rpm=SERP_RPM,
+            gemini_tpm=GEMINI_TPM or None,
+            serp_quota=serp_quota,
+            gemini_quota=gemini_quota
         )
         
+        # SERP 快取
+        serp_cache = None
+        if SERP_CACHE_TTL_HOURS > 0:
+            # 共用快取以本次的設定包裝，不修改跨 session 的實例；統計也只計本次
+            serp_cache = CacheView(
+                get_serp_cache(),
+                ttl_seconds=SERP_CACHE_TTL_HOURS * 3600,
+                max_bytes=SERP_CACHE_MAX_MB * 1024 * 1024
+            )
+        serp_cache_before = serp_cache.snapshot() if serp_cache else None
+        gemini_cache = CacheView(get_gemini_cache())
+        gemini_cache_before = gemini_cache.snapshot()
+        json_stats_before = json_stats_snapshot()
+
+        # 競品頁面（選用）：錄製 / 重播時不使用快取，確保每個請求都經過錄製檔
+        page_fetcher = None
+        if COMPETITOR_PAGES:
+            page_fetcher = PageFetcher(cache=get_page_cache() if REPLAY_MODE == "off" else None)
+
+        # 執行紀錄：每個關鍵字完成即寫入磁碟，可於中斷後續跑
+        signature = run_signature(keywords, TARGET_GL, TARGET_HL, MAX_PAGES, MODEL_NAME, COMPETITOR_PAGES)
+        journal = RunJournal.start(signature)
+        restored = OrderedDict()
+        if RESUME_RUN:
+            restored = journal.resume_from(RunJournal.latest(signature))
+            restored = OrderedDict((kw, restored[kw]) for kw in keywords if kw in restored)
+        pending_keywords = [kw for kw in keywords if kw not in restored]
+
         # UI 元素
         st.divider()
+        if restored:
+            st.info(f"♻️ 已從執行紀錄恢復 {len(restored)} 組關鍵字，剩餘 {len(pending_keywords)} 組需要分析")
         status_header = st.empty()
         status_header.info(f"⚡ 平行處理中... SERP×{MAX_CONCURRENT_SERP} / Gemini×{MAX_CONCURRENT_GEMINI}")
         
         progress_bar = st.progress(0)
         status_text = st.empty()
+        quota_status = st.empty()
         
         # 收集結果
-        all_results = OrderedDict()
-        completed_count = 0
+        all_results = OrderedDict(restored)
+        completed_count = len(restored)
         total_start_time = time.time()
         
-        # 平行執行
-        max_workers = max(MAX_CONCURRENT_SERP, MAX_CONCURRENT_GEMINI) + 1
+        # 串流：worker thread 只把完成的欄位放進佇列，由主 thread 在等待結果時更新畫面
+        streaming = STREAM_OUTPUT and not BATCH_MODE
+        partial_fields = queue.Queue()
+        partial_views = {}
         
-        with ThreadPoolExecutor(max_workers=max_workers) as pool:
-            future_to_kw = {
-                pool.submit(
-                    process_single_keyword,
-                    kw, executor, GOOGLE_API_KEY, GEMINI_API_KEY,
-                    TARGET_GL, TARGET_HL, MAX_PAGES, MODEL_NAME
-                ): kw for kw in keywords
-            }
-            
-            for future in as_completed(future_to_kw):
-                kw = future_to_kw[future]
-                try:
-                    result = future.result()
-                except Exception as e:
-                    result = {
-                        "keyword": kw,
-                        "error": str(e),
-                        "serp_df": None,
-                        "strategy": None
-                    }
-                
-                all_results[kw] = result
-                completed_count += 1
-                
-                progress_bar.progress(completed_count / len(keywords))
-                status_text.text(f"✅ 完成：{kw} ({completed_count}/{len(keywords)})")
+        def strategy_field_callback(kw):
+            if not streaming:
+                return None
+            return lambda key, value: partial_fields.put((kw, key, value))
         
-        total_time = time.time() - total_start_time
+        def fetch_keyword(kw):
+            result = fetch_keyword_serp(kw, executor, GOOGLE_API_KEY, TARGET_GL, TARGET_HL, MAX_PAGES, serp_cache)
+            if page_fetcher:
+                attach_competitor_pages(result, page_fetcher, COMPETITOR_PAGES)
+            return result
         
-        status_header.success(f"✅ SERP 分析完成！總耗時 {total_time:.1f} 秒")
-        status_text.empty()
+        # 分段管線：SERP 與 Gemini 各自的 worker，中間以有界佇列銜接
+        pipeline = StagedPipeline(
+            fetch_fn=fetch_keyword,
+            analyze_fn=lambda r: analyze_keyword_strategy(
+                r, executor, GEMINI_API_KEY, TARGET_GL, MODEL_NAME,
+                gemini_cache, BYPASS_GEMINI_CACHE,
+                on_field=strategy_field_callback(r["keyword"])
+            ),
+            fetch_workers=MAX_CONCURRENT_SERP,
+            analyze_workers=MAX_CONCURRENT_GEMINI,
+            queue_size=PIPELINE_QUEUE_SIZE,
+            error_result=keyword_error_result,
+            analyze_batch_fn=(lambda rs: analyze_keyword_batch(
+                rs, executor, GEMINI_API_KEY, TARGET_GL, MODEL_NAME,
+                gemini_cache, BYPASS_GEMINI_CACHE
+            )) if BATCH_MODE else None,
+            batch_cost=strategy_batch_cost,
+            batch_budget=BATCH_TOKEN_BUDGET,
+            max_batch=BATCH_MAX_KEYWORDS,
+            on_result=journal.append
+        )
         
-        # 執行統計
-        with st.expander("📊 執行統計", expanded=False):
-            stat_cols = st.columns(4)
-            with stat_cols[0]:
-                st.metric("SERP 呼叫次數", executor.stats["serp_calls"])
-            with stat_cols[1]:
-                st.metric("Gemini 呼叫次數", executor.stats["gemini_calls"])
-            with stat_cols[2]:
-                st.metric("Gemini 重試次數", executor.stats["gemini_retries"])
-            with stat_cols[3]:
-                st.metric("總耗時", f"{total_time:.1f}s")
-            
-            if executor.stats["errors"]:
-                st.warning(f"發生 {len(executor.stats['errors'])} 個錯誤")
-                for err in executor.stats["errors"]:
-                    st.text(err)
+        # 各關鍵字的結果區塊（依輸入順序預先建立，串流中先顯示已完成的欄位，完成後替換為完整結果）
+        keyword_slots = OrderedDict((kw, st.empty()) for kw in keywords)
         
-        st.divider()
+        quota_refreshed = [0.0]
         
-        # 顯示結果
-        reports = []
-        serp_all_rows = []
+        def show_progress_details():
+            # 共用額度狀態（每秒更新一次）
+            if (serp_quota or gemini_quota) and time.time() - quota_refreshed[0] >= 1.0:
+                quota_refreshed[0] = time.time()
+                quota_status.caption(quota_status_text(executor.quota_stats()))
+            if streaming:
+                show_partial_fields()
         
-        for kw in keywords:
-            r = all_results.get(kw)
-            if not r:
-                continue
-            
-            st.subheader(f"🔍 {kw}")
-            
-            if r.get("timing"):
-                timing = r["timing"]
-                st.caption(f"⏱️ SERP: {timing.get('serp', 0):.1f}s ｜ Gemini: {timing.get('gemini', 0):.1f}s")
-            
-            if r.get("error"):
-                st.error(f"❌ 處理失敗：{r['error']}")
-                st.divider()
-                continue
-            
-            df = r.get("serp_df")
-            strategy = r.get("strategy")
-            
-            # 收集 SERP 原始資料
-            if df is not None and not df.empty:
-                serp_copy = df.copy()
-                serp_copy.insert(0, "Keyword", kw)
-                serp_all_rows.append(serp_copy)
-            
-            # 戰場分布
-            with st.expander("📊 戰場分布", expanded=True):
-                col1, col2 = st.columns([2, 1])
-                with col1:
-                    if df is not None:
-                        st.dataframe(
-                            df[["Rank", "Type", "Title", "DisplayLink"]], 
-                            use_container_width=True, 
-                            height=220
-                        )
-                with col2:
-                    if df is not None and not df.empty:
-                        type_counts = df["Type"].value_counts().reset_index()
-                        type_counts.columns = ["Type", "Count"]
-                        chart = alt.Chart(type_counts).mark_arc(innerRadius=50).encode(
-                            theta="Count",
-                            color="Type",
-                            tooltip=["Type", "Count"]
-                        )
-                        st.altair_chart(chart, use_container_width=True)
-            
-            # 策略結論
-            if strategy and "error" not in strategy:
-                st.markdown("### 🧠 策略結論")
-                
-                col_a, col_b = st.columns(2)
-                with col_a:
-                    st.info(f"**使用者意圖**\n{strategy.get('User_Intent', 'N/A')}")
-                    st.success(f"**機會缺口**\n{strategy.get('Opportunity_Gap', 'N/A')}")
-                with col_b:
-                    st.warning(f"**戰場狀態**\n{strategy.get('Battlefield_Status', 'N/A')}")
-                    st.info(f"**建議頁型**\n{strategy.get('Recommended_Page_Type', 'N/A')}")
-
-                st.markdown("**致勝切角**")
-                for a in strategy.get("Winning_Angles", []):
-                    st.markdown(f"- **{a.get('angle', '')}**（{a.get('target', '')}）")
-
-                st.markdown("**必勝標題**")
-                for t in strategy.get("Killer_Titles", []):
-                    st.markdown(f"- {t.get('title', '')}｜{t.get('reason', '')}")
-
-                strategy["Keyword"] = kw
-                reports.append(strategy)
-            
-            elif strategy and "error" in strategy:
-                st.error("❌ 策略解析失敗")
-                with st.expander("查看原始回應"):
-                    st.code(r.get("raw_response", "N/A"))
-            
-            st.divider()
+        def show_partial_fields():
+            changed = set()
+            while True:
+                try:
+                    kw, key, value = partial_fields.get_nowait()
+                except queue.Empty:
+                    break
+                if kw in all_results:
+                    continue
+                partial_views.setdefault(kw, {})[key] = value
+                changed.add(kw)
+            for kw in changed:
+                with keyword_slots[kw].container():
+                    st.subheader(f"🔍 {kw}")
+                    render_partial_fields(partial_views[kw], STRATEGY_FIELD_LABELS)
         
-        # =================================================
-        # 內容寫作方向綜合指引（新功能）
-        # =================================================
-        if reports:
-            st.header("📝 內容寫作方向綜合指引")
-            
-            with st.spinner("🤖 AI 正在產生內容策略建議..."):
-                content_direction, error = generate_content_direction(
-                    GEMINI_API_KEY, reports, keywords, MODEL_NAME
-                )
+        for kw, r in restored.items():
+            with keyword_slots[kw].container():
+                render_keyword_result(kw, r)
+        
+        for result in pipeline.run(pending_keywords, on_idle=show_progress_details):
+            kw = result["keyword"]
+            all_results[kw] = result
+            completed_count += 1
             
-            if error:
-                st.error(f"❌ {error}")
-            elif content_direction:
-                # 核心主題
-                st.markdown("### 🎯 核心主題方向")
-                st.info(content_direction.get("content_theme", "N/A"))
-                
-                # 目標受眾
-                st.markdown("### 👥 目標受眾")
-                st.success(content_direction.get("target_audience", "N/A"))
-                
-                # 建議文章架構
-                st.markdown("### 📐 建議文章架構")
-                for section in content_direction.get("content_structure", []):
-                    with st.container():
-                        st.markdown(f"**{section.get('section', '')}**")
-                        st.write(section.get('focus', ''))
-                        if section.get('keywords_to_use'):
-                            st.caption(f"建議使用關鍵字：{', '.join(section['keywords_to_use'])}")
-                        st.markdown("---")
-                
-                # 必須涵蓋的主題
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown("### ✅ 必須涵蓋的主題")
-                    for topic in content_direction.get("must_cover_topics", []):
-                        st.markdown(f"- {topic}")
-                
-                with col2:
-                    st.markdown("### ⚠️ 需避免的陷阱")
-                    for pitfall in content_direction.get("avoid_pitfalls", []):
-                        st.markdown(f"- {pitfall}")
-                
-                # 差異化切角
-                st.markdown("### 💡 差異化切角")
-                st.warning(content_direction.get("differentiation_angle", "N/A"))
-                
-                # 內容格式建議
-                st.markdown("### 📄 建議內容格式")
-                st.info(content_direction.get("content_format_suggestion", "N/A"))
+            with keyword_slots[kw].container():
+                render_keyword_result(kw, result)
             
-            st.divider()
+            progress_bar.progress(completed_count / len(keywords))
+            status_text.text(f"✅ 完成：{kw} ({completed_count}/{len(keywords)})")
+        
+        total_time = time.time() - total_start_time
+        status_text.empty()
+        if page_fetcher:
+            page_fetcher.close()
+        quota_status.empty()
         
-        # =================================================
-        # Excel 輸出
-        # =================================================
+        # 內容寫作方向綜合指引
+        reports, _ = collect_reports(keywords, all_results)
+        content_direction, content_error = None, None
         if reports:
-            st.subheader("📥 下載報告")
-            
-            # 策略工作表
-            strategy_rows = []
-            for r in reports:
-                strategy_rows.append({
-                    "Keyword": r.get("Keyword", ""),
-                    "User_Intent": r.get("User_Intent", ""),
-                    "Battlefield_Status": r.get("Battlefield_Status", ""),
-                    "Opportunity_Gap": r.get("Opportunity_Gap", ""),
-                    "Recommended_Page_Type": r.get("Recommended_Page_Type", ""),
-                    "Winning_Angles": "\n".join(
-                        [f"- {a.get('angle', '')}（{a.get('target', '')}）"
-                         for a in r.get("Winning_Angles", [])]
-                    ),
-                    "Killer_Titles": "\n".join(
-                        [f"- {t.get('title', '')}｜{t.get('reason', '')}"
-                         for t in r.get("Killer_Titles", [])]
-                    ),
-                    "Raw_JSON": json.dumps(r, ensure_ascii=False)
-                })
-
-            df_strategy = pd.DataFrame(strategy_rows)
+            status_header.info("🤖 AI 正在產生內容策略建議...")
+            direction_preview = st.empty()
+            direction_fields = {}
             
-            # SERP 原始資料工作表
-            df_serp_all = pd.concat(serp_all_rows, ignore_index=True) if serp_all_rows else pd.DataFrame()
+            def show_direction_field(key, value):
+                direction_fields[key] = value
+                with direction_preview.container():
+                    st.header("📝 內容寫作方向綜合指引")
+                    render_partial_fields(direction_fields, CONTENT_DIRECTION_FIELD_LABELS)
             
-            # 內容指引工作表
-            df_content_direction = pd.DataFrame()
-            if content_direction:
-                df_content_direction = pd.DataFrame([{
-                    "Content_Theme": content_direction.get("content_theme", ""),
-                    "Target_Audience": content_direction.get("target_audience", ""),
-                    "Differentiation_Angle": content_direction.get("differentiation_angle", ""),
-                    "Content_Format": content_direction.get("content_format_suggestion", ""),
-                    "Must_Cover_Topics": "\n".join(content_direction.get("must_cover_topics", [])),
-                    "Avoid_Pitfalls": "\n".join(content_direction.get("avoid_pitfalls", [])),
-                    "Content_Structure": json.dumps(content_direction.get("content_structure", []), ensure_ascii=False)
-                }])
-
-            # 寫入 Excel
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-                df_strategy.to_excel(writer, sheet_name="Strategy", index=False)
-                
-                if not df_serp_all.empty:
-                    df_serp_all.to_excel(writer, sheet_name="SERP_Raw", index=False)
-                
-                if not df_content_direction.empty:
-                    df_content_direction.to_excel(writer, sheet_name="Content_Direction", index=False)
-                
-                # 調整欄寬
-                workbook = writer.book
-                for sheet_name in writer.sheets:
-                    worksheet = writer.sheets[sheet_name]
-                    worksheet.set_column('A:A', 20)
-                    worksheet.set_column('B:H', 40)
-
-            col_dl1, col_dl2 = st.columns(2)
-            with col_dl1:
-                st.download_button(
-                    label="📊 下載完整 Excel 報告",
-                    data=buffer.getvalue(),
-                    file_name=f"seo_strategy_{int(time.time())}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            with col_dl2:
-                # JSON 備份
-                full_json = {
-                    "strategies": reports,
-                    "content_direction": content_direction
-                }
-                json_data = json.dumps(full_json, ensure_ascii=False, indent=2)
-                st.download_button(
-                    label="📄 下載 JSON 備份",
-                    data=json_data,
-                    file_name=f"seo_strategy_{int(time.time())}.json",
-                    mime="application/json"
-                )
+            content_direction, content_error = generate_content_direction(
+                GEMINI_API_KEY, reports, keywords, MODEL_NAME,
+                cache=gemini_cache, bypass_cache=BYPASS_GEMINI_CACHE,
+                on_field=show_direction_field if STREAM_OUTPUT else None
+            )
+        
+        # 執行統計（只保存數值，重畫時不需要 executor / 快取物件）
+        serp_cache_stats = None
+        if serp_cache:
+            serp_cache_after = serp_cache.snapshot()
+            serp_cache_stats = {
+                "hits": serp_cache_after["hits"] - serp_cache_before["hits"],
+                "misses": serp_cache_after["misses"] - serp_cache_before["misses"],
+                "evictions": serp_cache_after["evictions"] - serp_cache_before["evictions"],
+                "size_mb": serp_cache.size_bytes() / 1024 / 1024
+            }
+        gemini_cache_after = gemini_cache.snapshot()
+        run_stats = {
+            "total_time": total_time,
+            "restored": len(restored),
+            "serp_calls": executor.stats["serp_calls"],
+            "gemini_calls": executor.stats["gemini_calls"],
+            "gemini_retries": executor.stats["gemini_retries"],
+            "serp_retries": executor.stats["serp_retries"],
+            "gemini_rpm": executor.gemini.current_rpm,
+            "serp_cache": serp_cache_stats,
+            "gemini_cache": {
+                "hits": gemini_cache_after["hits"] - gemini_cache_before["hits"],
+                "misses": gemini_cache_after["misses"] - gemini_cache_before["misses"]
+            },
+            "pipeline": pipeline.summary(),
+            "queue_size": PIPELINE_QUEUE_SIZE,
+            "batch_mode": BATCH_MODE,
+            "errors": list(executor.stats["errors"]),
+            "json": json_stats_since(json_stats_before),
+            "quota": executor.quota_stats(),
+            "pages": dict(page_fetcher.stats) if page_fetcher else None,
+            "metrics": executor.metrics.snapshot()
+        }
+        
+        # 存入 run store 後重畫：之後的互動（下載、展開）都從 run store 讀取
+        record = RunRecord(
+            keywords, all_results,
+            content_direction=content_direction,
+            content_error=content_error,
+            stats=run_stats
+        )
+        get_run_store().put(record)
+        st.session_state.phase2_run_id = record.run_id
+        st.rerun()
+    
+    # 顯示最近一次執行結果（跨 rerun 保留）
+    run_record = get_run_store().get(st.session_state.phase2_run_id)
+    if run_record is not None:
+        render_run(run_record)
+    elif st.session_state.phase2_run_id:
+        st.info("上次的執行結果已過期，請重新啟動分析（已完成的關鍵字可從執行紀錄續跑）")
+        st.session_state.phase2_run_id = None
@@ -0,0 +1,69 @@
+"""
+Benchmark：每個關鍵字的 client 建立成本（改用 registry 前後比較）
+
+不發出任何 API 請求，只量測 discovery 解析 / genai.configure / GenerativeModel 建立的開銷。
+
+執行方式：
+    python benchmarks/bench_client_setup.py --keywords 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google.generativeai as genai
+from googleapiclient.discovery import build
+
+import clients
+
+FAKE_GOOGLE_KEY = "bench-google-key"
+FAKE_GEMINI_KEY = "bench-gemini-key"
+MODEL_NAME = "gemini-2.5-flash"
+
+
+def setup_before():
+    """原本的做法：每個關鍵字都重新 build + configure + 建立 model"""
+    service = build("customsearch", "v1", developerKey=FAKE_GOOGLE_KEY)
+    service.cse().list(q="bench", cx="bench")
+    genai.configure(api_key=FAKE_GEMINI_KEY)
+    genai.GenerativeModel(MODEL_NAME)
+
+
+def setup_after():
+    """Registry：第一次建立後直接取用"""
+    service = clients.get_cse_service(FAKE_GOOGLE_KEY)
+    service.cse().list(q="bench", cx="bench")
+    clients.get_gemini_model(FAKE_GEMINI_KEY, MODEL_NAME)
+
+
+def measure(func, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    print(f"{name:<10} total={sum(samples):9.1f}ms  mean={statistics.mean(samples):7.3f}ms  "
+          f"p50={statistics.median(samples):7.3f}ms  p95={p95:7.3f}ms  first={samples[0]:7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, default=200, help="模擬的關鍵字數")
+    args = parser.parse_args()
+
+    clients.reset_clients()
+    report("before", measure(setup_before, args.keywords))
+    report("after", measure(setup_after, args.keywords))
+
+
+if __name__ == "__main__":
+    main()
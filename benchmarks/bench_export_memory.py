@@ -0,0 +1,119 @@
+"""
+Benchmark：報告輸出的峰值記憶體（一次組 DataFrame vs 串流 writer）
+
+以合成資料模擬 N 個關鍵字（每個關鍵字 --rows 筆 SERP 結果），用 tracemalloc 量測輸出期間的 Python 峰值記憶體。
+原本的做法：collect_reports → 每個關鍵字 copy DataFrame → concat → 寫入 BytesIO。
+串流做法：ExcelStreamWriter（constant_memory）/ NDJSON / Parquet 逐列寫到暫存檔。
+（Parquet 的 Arrow 緩衝區配置在 C++ 端，tracemalloc 只看得到 Python 端的部分）
+
+執行方式：
+    python benchmarks/bench_export_memory.py --keywords 1000 10000
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from report import (
+    STREAM_WRITERS,
+    build_excel_bytes,
+    collect_reports,
+    parquet_available,
+)
+
+PAGE_TYPES = ["論壇/社群", "影音", "電商/產品頁", "新聞/媒體", "一般文章/其他"]
+
+
+def make_results(n_keywords, rows_per_keyword):
+    """合成與 fetch_keyword_serp + analyze_keyword_strategy 相同格式的結果"""
+    keywords = [f"關鍵字 {i}" for i in range(n_keywords)]
+    results = {}
+    for i, kw in enumerate(keywords):
+        serp_raw = [
+            {
+                "Rank": r + 1,
+                "Type": PAGE_TYPES[(i + r) % len(PAGE_TYPES)],
+                "Title": f"{kw} 推薦比較 第 {r + 1} 名｜完整評測與價格整理",
+                "Description": f"{kw} 的使用心得、優缺點與購買建議，整理 2024 最新熱門款式。" * 2,
+                "DisplayLink": f"www.site{r}.com.tw",
+                "URL": f"https://www.site{r}.com.tw/article/{i}-{r}"
+            }
+            for r in range(rows_per_keyword)
+        ]
+        results[kw] = {
+            "keyword": kw,
+            "serp_raw": serp_raw,
+            "serp_df": pd.DataFrame(serp_raw),
+            "strategy": {
+                "User_Intent": "比較型：想找出最適合自己的款式",
+                "Battlefield_Status": "論壇與電商混戰",
+                "Opportunity_Gap": "缺少實測數據與長期使用心得",
+                "Recommended_Page_Type": "比較評測文",
+                "Winning_Angles": [{"angle": "實測數據", "target": "重視效能的使用者"}],
+                "Killer_Titles": [{"title": f"{kw} 實測比較", "reason": "結合數據與情境"}]
+            },
+            "error": None
+        }
+    return keywords, results
+
+
+def export_before(keywords, results, tmp_dir):
+    reports, serp_frames = collect_reports(keywords, results)
+    data = build_excel_bytes(reports, serp_frames)
+    with open(os.path.join(tmp_dir, "before.xlsx"), "wb") as f:
+        f.write(data)
+
+
+def export_stream(fmt):
+    def run(keywords, results, tmp_dir):
+        writer = STREAM_WRITERS[fmt](os.path.join(tmp_dir, f"stream.{fmt}"))
+        for kw in keywords:
+            writer.add(kw, results[kw])
+        writer.close()
+    return run
+
+
+def measure(fn, keywords, results):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn(keywords, results, tmp_dir)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak / 1024 / 1024, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, nargs="+", default=[1000, 10000], help="關鍵字數量（可多個）")
+    parser.add_argument("--rows", type=int, default=20, help="每個關鍵字的 SERP 筆數")
+    args = parser.parse_args()
+
+    cases = [
+        ("before: DataFrame + BytesIO", export_before),
+        ("stream: xlsx constant_memory", export_stream("xlsx")),
+        ("stream: ndjson", export_stream("ndjson")),
+    ]
+    if parquet_available():
+        cases.append(("stream: parquet", export_stream("parquet")))
+
+    for n in args.keywords:
+        keywords, results = make_results(n, args.rows)
+        print(f"\n{n} 個關鍵字 × {args.rows} 筆 SERP（{n * args.rows} 列）")
+        print(f"{'方式':<32}{'峰值記憶體 (MB)':>16}{'耗時 (s)':>12}")
+        for name, fn in cases:
+            peak_mb, elapsed = measure(fn, keywords, results)
+            print(f"{name:<32}{peak_mb:>16.1f}{elapsed:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark：網頁 → 純文字（原本的整份處理 vs 有上限的擷取）
+
+對一個資料夾內存好的 HTML 檔（*.html / *.htm）比較：
+- legacy：apparent_encoding 掃描整份內容 → html.parser → str(子樹) → html2text → 截斷 20,000 字
+- bounded：只處理前 MAX_DOWNLOAD_BYTES → header / <meta> 決定編碼 → lxml（若有）→ 依字元上限擷取
+沒有指定 --corpus 時以合成頁面（UTF-8 / Big5、不同大小）測試。
+legacy 需要 html2text（已不在 requirements.txt），未安裝時只量測 bounded。
+
+執行方式：
+    python benchmarks/bench_html_extract.py --corpus saved_pages/ --repeat 3
+    python benchmarks/bench_html_extract.py --synthetic 40
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from bs4 import BeautifulSoup
+
+from html_extract import HTML_PARSER, MAX_DOWNLOAD_BYTES, MAX_TEXT_CHARS, decode_html, extract_main_text
+
+try:
+    import html2text
+except ImportError:
+    html2text = None
+
+
+def legacy_extract(content):
+    """原本 fetch_webpage_content 的處理流程（對照組）"""
+    response = requests.Response()
+    response._content = content
+    response.encoding = response.apparent_encoding or 'utf-8'
+    soup = BeautifulSoup(response.text, 'html.parser')
+    for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe', 'noscript']):
+        tag.decompose()
+    main_content = soup.find('main') or soup.find('article') or soup.find('body')
+    if not main_content:
+        return None
+    h = html2text.HTML2Text()
+    h.ignore_links = True
+    h.ignore_images = True
+    h.ignore_emphasis = False
+    text = h.handle(str(main_content))
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    cleaned_text = '\n'.join(lines)
+    if len(cleaned_text) > MAX_TEXT_CHARS:
+        cleaned_text = cleaned_text[:MAX_TEXT_CHARS] + "..."
+    return cleaned_text
+
+
+def bounded_extract(content):
+    text, _ = extract_main_text(decode_html(content[:MAX_DOWNLOAD_BYTES], "text/html"))
+    return text
+
+
+def synthetic_page(i):
+    """不同大小的文章頁：導覽、側欄、script 與大量段落"""
+    paragraphs = 20 + (i % 10) * 150
+    body = "".join(
+        f"<p>第 {n} 段：空氣清淨機的<b>濾網</b>更換週期、<a href='/x/{n}'>耗電量</a>與噪音比較，"
+        f"整理實際使用心得與常見問題。</p>"
+        + (f"<h2>小標題 {n}</h2><ul><li>重點一</li><li>重點二</li></ul>" if n % 10 == 0 else "")
+        for n in range(paragraphs)
+    )
+    charset = "big5" if i % 3 == 0 else "utf-8"
+    nav = '<a href="#">選單</a>' * 50
+    html = (
+        f"<html><head><meta charset=\"{charset}\"><title>頁面 {i}</title>"
+        f"<script>{'var x = 1;' * 2000}</script><style>{'.a{color:red}' * 500}</style></head>"
+        f"<body><nav>{nav}</nav><aside>側欄</aside>"
+        f"<article><h1>文章 {i}</h1>{body}</article><footer>版權</footer></body></html>"
+    )
+    return f"synthetic_{i}.html", html.encode("cp950" if charset == "big5" else "utf-8", errors="replace")
+
+
+def load_corpus(args):
+    if args.corpus:
+        paths = sorted(glob.glob(os.path.join(args.corpus, "*.htm*")))
+        if not paths:
+            sys.exit(f"{args.corpus} 內沒有 .html / .htm 檔")
+        pages = []
+        for path in paths:
+            with open(path, "rb") as f:
+                pages.append((os.path.basename(path), f.read()))
+        return pages
+    return [synthetic_page(i) for i in range(args.synthetic)]
+
+
+def measure(fn, pages, repeat):
+    timings, chars = [], 0
+    for _, content in pages:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text = fn(content)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+        chars += len(text or "")
+    return timings, chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="存放 HTML 檔的資料夾")
+    parser.add_argument("--synthetic", type=int, default=30, help="未指定 --corpus 時的合成頁面數")
+    parser.add_argument("--repeat", type=int, default=3, help="每頁重複次數（取最佳值）")
+    args = parser.parse_args()
+
+    pages = load_corpus(args)
+    total_mb = sum(len(content) for _, content in pages) / 1024 / 1024
+    print(f"{len(pages)} 頁，共 {total_mb:.1f} MB；解析器：{HTML_PARSER}")
+
+    methods = [("bounded", bounded_extract)]
+    if html2text is not None:
+        methods.insert(0, ("legacy", legacy_extract))
+    else:
+        print("未安裝 html2text，略過 legacy")
+
+    print(f"{'方法':<10}{'總計(s)':>10}{'每頁中位數(ms)':>16}{'p95(ms)':>10}{'輸出字元':>12}")
+    for name, fn in methods:
+        timings, chars = measure(fn, pages, args.repeat)
+        ordered = sorted(timings)
+        p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+        print(f"{name:<10}{sum(timings):>10.2f}{statistics.median(timings) * 1000:>16.1f}"
+              f"{p95 * 1000:>10.1f}{chars:>12}")
+
+
+if __name__ == "__main__":
+    main()
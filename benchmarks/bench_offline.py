@@ -0,0 +1,255 @@
+"""
+離線 benchmark：以本地替身量測第一 / 第二階段在不同並發設定下的吞吐量與尾端延遲
+
+不消耗任何 API 配額（CSE / Gemini / Suggest 皆為 benchmarks/fakes.py 的替身），
+用來調整 MAX_CONCURRENT_SERP / MAX_CONCURRENT_GEMINI / GEMINI_MIN_INTERVAL 等設定。
+
+- Phase 1：fetch_suggestions_bulk（Suggest 替身）+ 一次關鍵字萃取（Gemini 替身）
+- Phase 2：StagedPipeline（SERP 抓取 → 策略分析），與 app.py 相同的組裝方式
+每種組合輸出牆鐘時間、吞吐量、關鍵字完成時間的 p50 / p95 / p99、429 次數與 executor 的等待/執行分位數。
+
+執行方式：
+    python benchmarks/bench_offline.py --keywords 20 100 --serp-concurrency 2 4 --gemini-concurrency 1 2 4
+    python benchmarks/bench_offline.py --phase 2 --gemini-latency 2.0,0.5 --gemini-rpm-limit 30 --gemini-interval 0.5 1.0
+    python benchmarks/bench_offline.py --phase 1 --suggest-workers 4 8 16 --suggest-depth 2
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import (
+    FakeCSEService,
+    FakeGenerativeModel,
+    FakeSuggestSession,
+    LatencyModel,
+    install_fakes,
+)
+
+from core import (
+    analyze_keyword_batch,
+    analyze_keyword_strategy,
+    extract_keywords_from_content,
+    fetch_keyword_serp,
+    fetch_suggestions_bulk,
+    keyword_error_result,
+    strategy_batch_cost,
+)
+from limiter import RateLimitedExecutor
+from pipeline import StagedPipeline
+
+GOOGLE_KEY = "offline-google-key"
+GEMINI_KEY = "offline-gemini-key"
+MODEL_NAME = "gemini-2.5-flash"
+REPAIR_MODEL = "gemini-2.0-flash"
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def make_backends(args):
+    scale = args.time_scale
+    cse = FakeCSEService(
+        LatencyModel.parse(args.serp_latency, scale, seed=1),
+        error_rate=args.serp_429, rpm_limit=args.serp_rpm_limit, seed=1
+    )
+    gemini = FakeGenerativeModel(
+        LatencyModel.parse(args.gemini_latency, scale, seed=2),
+        error_rate=args.gemini_429, rpm_limit=args.gemini_rpm_limit, seed=2
+    )
+    suggest = FakeSuggestSession(
+        LatencyModel.parse(args.suggest_latency, scale, seed=3),
+        error_rate=args.suggest_429, seed=3
+    )
+    install_fakes(GOOGLE_KEY, GEMINI_KEY, [MODEL_NAME, REPAIR_MODEL], cse=cse, gemini=gemini, suggest=suggest)
+    return cse, gemini, suggest
+
+
+# =================================================
+# Phase 1
+# =================================================
+def run_phase1(args, suggest, gemini, n_keywords, workers):
+    suggest.reset_stats()
+    gemini.reset_stats()
+    seeds = [f"種子關鍵字 {i}" for i in range(n_keywords)]
+
+    start = time.perf_counter()
+    extract_keywords_from_content(GEMINI_KEY, "離線測試內容", "測試產品", MODEL_NAME)
+    fetch_suggestions_bulk(seeds, "tw", "zh-TW", max_workers=workers, depth=args.suggest_depth)
+    wall = time.perf_counter() - start
+
+    latencies = suggest.stats["latencies"]
+    return {
+        "keywords": n_keywords,
+        "workers": workers,
+        "wall": wall,
+        "requests": suggest.stats["calls"],
+        "req_per_s": suggest.stats["calls"] / wall if wall else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "throttled": suggest.stats["throttled"]
+    }
+
+
+# =================================================
+# Phase 2
+# =================================================
+def run_phase2(args, cse, gemini, n_keywords, serp_conc, gemini_conc, interval):
+    cse.reset_stats()
+    gemini.reset_stats()
+    keywords = [f"測試關鍵字 {i}" for i in range(n_keywords)]
+
+    executor = RateLimitedExecutor(
+        max_concurrent_serp=serp_conc,
+        max_concurrent_gemini=gemini_conc,
+        gemini_min_interval=interval,
+        serp_rpm=args.serp_rpm,
+        gemini_tpm=args.gemini_tpm or None
+    )
+    pipeline = StagedPipeline(
+        fetch_fn=lambda kw: fetch_keyword_serp(kw, executor, GOOGLE_KEY, "tw", "zh-TW", args.pages),
+        analyze_fn=lambda r: analyze_keyword_strategy(r, executor, GEMINI_KEY, "tw", MODEL_NAME),
+        fetch_workers=serp_conc,
+        analyze_workers=gemini_conc,
+        queue_size=args.queue_size,
+        error_result=keyword_error_result,
+        analyze_batch_fn=(lambda rs: analyze_keyword_batch(
+            rs, executor, GEMINI_KEY, "tw", MODEL_NAME
+        )) if args.batch else None,
+        batch_cost=strategy_batch_cost,
+        batch_budget=args.batch_token_budget,
+        max_batch=args.batch_size
+    )
+
+    start = time.perf_counter()
+    finished = []
+    failed = 0
+    for result in pipeline.run(keywords):
+        finished.append(time.perf_counter() - start)
+        strategy = result.get("strategy")
+        if result.get("error") or not isinstance(strategy, dict) or "error" in strategy:
+            failed += 1
+    wall = time.perf_counter() - start
+
+    metrics = executor.metrics.snapshot()["providers"]
+    gemini_metrics = metrics["gemini"]
+    return {
+        "keywords": n_keywords,
+        "serp": serp_conc,
+        "gemini": gemini_conc,
+        "interval": interval,
+        "wall": wall,
+        "kw_per_s": n_keywords / wall if wall else 0.0,
+        "done_p50": percentile(finished, 0.50),
+        "done_p95": percentile(finished, 0.95),
+        "done_p99": percentile(finished, 0.99),
+        "gemini_wait_p95": gemini_metrics["queue_wait"]["p95"] or 0.0,
+        "gemini_exec_p95": gemini_metrics["exec"]["p95"] or 0.0,
+        "throttled": cse.stats["throttled"] + gemini.stats["throttled"],
+        "failed": failed,
+        "gemini_peak": gemini.stats["max_in_flight"]
+    }
+
+
+def print_table(rows, columns):
+    header = "".join(f"{title:>{width}}" for title, _, width, _ in columns)
+    print(header)
+    for row in rows:
+        print("".join(f"{fmt.format(row[key]):>{width}}" for _, key, width, fmt in columns))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phase", choices=["1", "2", "both"], default="both")
+    parser.add_argument("--keywords", type=int, nargs="+", default=[20, 50], help="關鍵字數量（可多個）")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="所有延遲乘上此倍率（<1 加快 benchmark）")
+
+    fake = parser.add_argument_group("替身設定（延遲格式：中位數秒數[,lognormal sigma]）")
+    fake.add_argument("--serp-latency", default="0.4,0.4")
+    fake.add_argument("--gemini-latency", default="2.0,0.5")
+    fake.add_argument("--suggest-latency", default="0.08,0.3")
+    fake.add_argument("--serp-429", type=float, default=0.0, help="SERP 隨機 429 機率")
+    fake.add_argument("--gemini-429", type=float, default=0.0, help="Gemini 隨機 429 機率")
+    fake.add_argument("--suggest-429", type=float, default=0.0, help="Suggest 隨機 429 機率")
+    fake.add_argument("--serp-rpm-limit", type=int, default=None, help="模擬 SERP 端每分鐘上限")
+    fake.add_argument("--gemini-rpm-limit", type=int, default=None, help="模擬 Gemini 端每分鐘上限")
+
+    p1 = parser.add_argument_group("Phase 1")
+    p1.add_argument("--suggest-workers", type=int, nargs="+", default=[4, 8, 16])
+    p1.add_argument("--suggest-depth", type=int, choices=[1, 2], default=1)
+
+    p2 = parser.add_argument_group("Phase 2")
+    p2.add_argument("--serp-concurrency", type=int, nargs="+", default=[3])
+    p2.add_argument("--gemini-concurrency", type=int, nargs="+", default=[1, 2, 4])
+    p2.add_argument("--gemini-interval", type=float, nargs="+", default=[1.0])
+    p2.add_argument("--serp-rpm", type=int, default=300)
+    p2.add_argument("--gemini-tpm", type=int, default=0)
+    p2.add_argument("--pages", type=int, default=2)
+    p2.add_argument("--queue-size", type=int, default=10)
+    p2.add_argument("--batch", action="store_true")
+    p2.add_argument("--batch-size", type=int, default=8)
+    p2.add_argument("--batch-token-budget", type=int, default=32_000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cse, gemini, suggest = make_backends(args)
+
+    if args.phase in ("1", "both"):
+        print("\n=== Phase 1：Suggest 展開 + 關鍵字萃取 ===")
+        rows = [
+            run_phase1(args, suggest, gemini, n, workers)
+            for n, workers in itertools.product(args.keywords, args.suggest_workers)
+        ]
+        print_table(rows, [
+            ("keywords", "keywords", 10, "{}"),
+            ("workers", "workers", 9, "{}"),
+            ("wall(s)", "wall", 10, "{:.2f}"),
+            ("requests", "requests", 10, "{}"),
+            ("req/s", "req_per_s", 9, "{:.1f}"),
+            ("p50(s)", "p50", 9, "{:.3f}"),
+            ("p95(s)", "p95", 9, "{:.3f}"),
+            ("p99(s)", "p99", 9, "{:.3f}"),
+            ("429", "throttled", 6, "{}"),
+        ])
+
+    if args.phase in ("2", "both"):
+        print(f"\n=== Phase 2：SERP → 策略分析（{'批次' if args.batch else '逐筆'}）===")
+        rows = [
+            run_phase2(args, cse, gemini, n, serp_conc, gemini_conc, interval)
+            for n, serp_conc, gemini_conc, interval in itertools.product(
+                args.keywords, args.serp_concurrency, args.gemini_concurrency, args.gemini_interval
+            )
+        ]
+        print_table(rows, [
+            ("keywords", "keywords", 10, "{}"),
+            ("serp", "serp", 6, "{}"),
+            ("gemini", "gemini", 8, "{}"),
+            ("interval", "interval", 10, "{:.2f}"),
+            ("wall(s)", "wall", 10, "{:.1f}"),
+            ("kw/s", "kw_per_s", 8, "{:.2f}"),
+            ("done p50", "done_p50", 10, "{:.1f}"),
+            ("done p95", "done_p95", 10, "{:.1f}"),
+            ("done p99", "done_p99", 10, "{:.1f}"),
+            ("gem wait95", "gemini_wait_p95", 12, "{:.2f}"),
+            ("gem exec95", "gemini_exec_p95", 12, "{:.2f}"),
+            ("429", "throttled", 6, "{}"),
+            ("failed", "failed", 8, "{}"),
+            ("peak", "gemini_peak", 6, "{}"),
+        ])
+        print("\ndone pXX：自開始起算各關鍵字完成的時間；gem wait/exec：executor 記錄的 Gemini 等待/執行 p95")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark：頁面類型分類（原本的 any() 子字串鏈 vs 編譯後的規則引擎）
+
+以合成的 SERP 項目比較：
+- legacy：原本寫死在 detect_page_type 的逐項 any() 掃描
+- rules.classify：規則引擎逐筆分類
+- rules.classify_series：整欄向量化分類
+並確認預設設定檔與原本的 any() 鏈在同一批項目上分類完全相同
+（包含 shopee.sg、amazon.co.uk 等區域網域，以及品牌字樣只出現在路徑中的網址）。
+
+執行方式：
+    python benchmarks/bench_page_types.py --items 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from page_types import get_page_type_rules
+
+HOSTS = [
+    "www.ptt.cc", "www.dcard.tw", "www.reddit.com", "www.mobile01.com",
+    "www.youtube.com", "www.instagram.com", "www.tiktok.com",
+    "shopee.tw", "www.momoshop.com.tw", "24h.pchome.com.tw", "www.amazon.com",
+    "udn.com", "news.ltn.com.tw", "www.ettoday.net", "zh.wikipedia.org",
+    "blog.example.com", "www.health.com.tw", "vocus.cc", "medium.com", "www.cool3c.com",
+    "shopee.sg", "shopee.com.my", "shopee.ph", "www.amazon.co.uk", "www.amazon.de",
+    "m.momoshop.com.tw", "forum.gamer.com.tw",
+]
+PATHS = [
+    "/article/{n}", "/product/{n}", "/news/{n}", "/wiki/{n}", "/p/{n}", "/bbs/post/{n}.html", "/",
+    "/share?from=dcard&id={n}", "/review/shopee-{n}", "/embed?src=youtube.com/{n}",
+]
+TITLES = [
+    "{n} 推薦 2024 最新整理", "{n} 價格比較", "{n} 優惠活動", "{n} 使用心得分享",
+    "{n} 是什麼？完整介紹", "{n} 評價 ptt dcard 討論", "{n} 開箱",
+]
+
+
+def legacy_detect_page_type(item):
+    """原本的實作（對照組）"""
+    link = (item.get("link") or "").lower()
+    title = (item.get("title") or "").lower()
+
+    if any(x in link for x in ["ptt.cc", "dcard", "reddit", "mobile01"]):
+        return "UGC / Forum"
+    if any(x in link for x in ["youtube.com", "instagram.com", "tiktok.com"]):
+        return "Social / Video"
+    if any(x in link for x in ["shopee", "momo", "pchome", "amazon", "/product/"]):
+        return "E-commerce"
+    if any(x in link for x in ["udn.com", "ltn.com", "ettoday", "/news/"]):
+        return "Media"
+    if "wiki" in link:
+        return "Wiki"
+    if any(x in title for x in ["價格", "優惠", "推薦"]):
+        return "Commercial Content"
+    return "General"
+
+
+def make_items(n, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        host = rng.choice(HOSTS)
+        path = rng.choice(PATHS).format(n=i)
+        items.append({
+            "link": f"https://{host}{path}",
+            "title": rng.choice(TITLES).format(n=f"關鍵字{i % 500}")
+        })
+    return items
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100_000, help="SERP 項目數")
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    rules = get_page_type_rules()
+    urls = pd.Series([it["link"] for it in items], dtype=object)
+    titles = pd.Series([it["title"] for it in items], dtype=object)
+
+    legacy, t_legacy = timed(lambda: [legacy_detect_page_type(it) for it in items])
+    per_item, t_item = timed(lambda: [rules.classify(it["link"], it["title"]) for it in items])
+    vectorized, t_vec = timed(lambda: rules.classify_series(urls, titles).tolist())
+
+    print(f"{args.items} 筆 SERP 項目")
+    print(f"{'方式':<28}{'耗時 (ms)':>12}{'每筆 (µs)':>12}")
+    for name, elapsed in [
+        ("legacy any() 鏈", t_legacy),
+        ("rules.classify（逐筆）", t_item),
+        ("rules.classify_series", t_vec),
+    ]:
+        print(f"{name:<28}{elapsed * 1000:>12.1f}{elapsed / args.items * 1e6:>12.2f}")
+
+    assert per_item == vectorized, "逐筆與向量化結果不一致"
+    diff = Counter((a, b) for a, b in zip(legacy, vectorized) if a != b)
+    for (old, new), count in diff.most_common(10):
+        print(f"  {old} → {new}: {count}")
+    assert not diff, f"與 legacy 不一致：{sum(diff.values())} 筆"
+    print("\n分類結果與 legacy 完全相同")
+
+
+if __name__ == "__main__":
+    main()
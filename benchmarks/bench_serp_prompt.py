@@ -0,0 +1,100 @@
+"""
+Benchmark：策略分析 prompt 的 SERP 序列化（df.to_string vs 精簡格式）
+
+比較 1~3 頁 SERP 的 prompt 字元數與估計 token 數；加上 --live 時以真實 Gemini
+（GEMINI_API_KEY）量測 count_tokens 與 generate_content 延遲。
+
+執行方式：
+    python benchmarks/bench_serp_prompt.py
+    GEMINI_API_KEY=... python benchmarks/bench_serp_prompt.py --live --repeat 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from clients import get_gemini_model
+from core import build_strategy_prompt, serp_table_text
+from limiter import estimate_tokens
+
+HOSTS = [
+    "www.ptt.cc", "www.dcard.tw", "www.youtube.com", "shopee.tw", "udn.com",
+    "www.mobile01.com", "www.ptt.cc", "vocus.cc", "www.health.com.tw", "www.dcard.tw",
+]
+TYPES = ["UGC / Forum", "UGC / Forum", "Social / Video", "E-commerce", "Media",
+         "UGC / Forum", "UGC / Forum", "General", "Commercial Content", "UGC / Forum"]
+
+
+def legacy_table_text(df):
+    """原本的格式（對照組）"""
+    return df[["Rank", "Type", "Title", "Description", "DisplayLink"]].to_string(index=False)
+
+
+def make_serp(keyword, pages):
+    rows = []
+    for rank in range(1, pages * 10 + 1):
+        i = (rank - 1) % len(HOSTS)
+        desc = f"{keyword}的挑選重點、實際使用心得與價格比較，整理網友評價與常見問題，幫你找到最適合的選擇。" * 2
+        rows.append({
+            "Rank": rank,
+            "Type": TYPES[i],
+            "Title": f"{keyword} 推薦 2024｜{rank} 款熱門型號實測比較與優缺點整理",
+            "Description": desc[:200] + "...",
+            "DisplayLink": HOSTS[i],
+            "URL": f"https://{HOSTS[i]}/article/{rank}"
+        })
+    return pd.DataFrame(rows)
+
+
+def prompts_for(keyword, df, gl):
+    compact = build_strategy_prompt(keyword, df, gl)
+    legacy = compact.replace(serp_table_text(df), legacy_table_text(df))
+    return legacy, compact
+
+
+def live_measure(model, prompt, repeat):
+    tokens = model.count_tokens(prompt).total_tokens
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.generate_content(prompt)
+        latencies.append(time.perf_counter() - start)
+    return tokens, statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keyword", default="空氣清淨機")
+    parser.add_argument("--gl", default="tw")
+    parser.add_argument("--live", action="store_true", help="以真實 Gemini 量測 token 與延遲")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    model = None
+    if args.live:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            sys.exit("--live 需要 GEMINI_API_KEY")
+        model = get_gemini_model(api_key, args.model)
+
+    print(f"{'頁數':<6}{'格式':<10}{'字元數':>10}{'估計 token':>12}", end="")
+    print(f"{'實際 token':>12}{'延遲中位數(s)':>16}" if model else "")
+    for pages in (1, 2, 3):
+        df = make_serp(args.keyword, pages)
+        for name, prompt in zip(("legacy", "compact"), prompts_for(args.keyword, df, args.gl)):
+            print(f"{pages:<6}{name:<10}{len(prompt):>10}{estimate_tokens(prompt):>12}", end="")
+            if model:
+                tokens, latency = live_measure(model, prompt, args.repeat)
+                print(f"{tokens:>12}{latency:>16.2f}")
+            else:
+                print()
+
+
+if __name__ == "__main__":
+    main()
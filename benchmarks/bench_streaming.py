@@ -0,0 +1,97 @@
+"""
+Benchmark：串流產生 vs 一次取得（策略分析與內容指引）
+
+以 benchmarks/fakes.py 的 Gemini 替身（或加上 --live 使用真實 Gemini）比較：
+- 第一個欄位出現的時間（time-to-first-insight）
+- 所有欄位完成的時間與總耗時
+並確認兩種模式解析出的最終結果相同。
+
+執行方式：
+    python benchmarks/bench_streaming.py --gemini-latency 20 --time-scale 0.1
+    GEMINI_API_KEY=... python benchmarks/bench_streaming.py --live --model gemini-2.5-pro
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeGenerativeModel, LatencyModel, install_fakes
+
+from bench_serp_prompt import make_serp
+from core import analyze_strategy_raw, generate_content_direction
+
+FAKE_KEY = "offline-gemini-key"
+
+
+def timed(call):
+    """執行 call(on_field)，回傳 (結果, 第一個欄位時間, 最後一個欄位時間, 總耗時)"""
+    start = time.perf_counter()
+    seen = []
+    result = call(lambda key, value: seen.append(time.perf_counter() - start))
+    total = time.perf_counter() - start
+    first = seen[0] if seen else total
+    last = seen[-1] if seen else total
+    return result, first, last, total
+
+
+def run_case(name, call, repeat):
+    rows = {"blocking": [], "stream": []}
+    outputs = {}
+    for _ in range(repeat):
+        result, _, _, total = timed(lambda on_field: call(None))
+        rows["blocking"].append((total, total, total))
+        outputs["blocking"] = result
+        result, first, last, total = timed(call)
+        rows["stream"].append((first, last, total))
+        outputs["stream"] = result
+
+    for mode, samples in rows.items():
+        first, last, total = (statistics.median(s[i] for s in samples) for i in range(3))
+        print(f"{name:<10}{mode:<10}{first:>12.2f}{last:>12.2f}{total:>10.2f}")
+    same = outputs["blocking"] == outputs["stream"]
+    print(f"{'':<10}最終結果{'相同' if same else '不同'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="使用真實 Gemini（GEMINI_API_KEY）")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--keyword", default="空氣清淨機")
+    parser.add_argument("--gemini-latency", default="20,0.2", help="替身的總產生時間（中位數秒數[,sigma]）")
+    parser.add_argument("--time-scale", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.live:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            sys.exit("--live 需要 GEMINI_API_KEY")
+    else:
+        api_key = FAKE_KEY
+        gemini = FakeGenerativeModel(LatencyModel.parse(args.gemini_latency, args.time_scale, seed=1))
+        install_fakes(None, api_key, [args.model, "gemini-2.0-flash"], gemini=gemini)
+
+    df = make_serp(args.keyword, 2)
+    strategy, _ = analyze_strategy_raw(api_key, args.keyword, df, "tw", args.model)
+    reports = [dict(strategy, Keyword=args.keyword)]
+
+    print(f"{'呼叫':<10}{'模式':<10}{'首欄位(s)':>12}{'全欄位(s)':>12}{'總計(s)':>10}")
+    run_case(
+        "strategy",
+        lambda on_field: analyze_strategy_raw(api_key, args.keyword, df, "tw", args.model, on_field=on_field)[0],
+        args.repeat
+    )
+    run_case(
+        "direction",
+        lambda on_field: generate_content_direction(api_key, reports, [args.keyword], args.model,
+                                                    on_field=on_field)[0],
+        args.repeat
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+離線 benchmark 用的 CSE / Gemini / Google Suggest 替身
+
+install_fakes() 直接放進 clients 的 registry（CSE service、GenerativeModel、HTTP session），
+core 的程式碼不需任何修改即可改打替身：
+- 延遲：固定值或 lognormal 分布（以中位數與 sigma 設定），可用 time_scale 整體縮放
+- 429：依機率隨機注入，或模擬 provider 端的 RPM 上限（滑動 60 秒視窗）
+每個替身都記錄實際的呼叫延遲與 429 次數，供 harness 統計。
+"""
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clients
+
+
+class FakeRateLimitError(Exception):
+    """訊息與真實 API 相同含 429，會被 is_rate_limit_error 判定為速率限制"""
+
+    def __init__(self, provider):
+        super().__init__(f"429 Resource exhausted: {provider} quota exceeded (fake)")
+
+
+class LatencyModel:
+    """延遲分布：sigma=0 為固定延遲，否則為 lognormal（median 即中位數）"""
+
+    def __init__(self, median=0.3, sigma=0.5, time_scale=1.0, seed=None):
+        self.median = median
+        self.sigma = sigma
+        self.time_scale = time_scale
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        with self.lock:
+            if self.sigma <= 0:
+                value = self.median
+            else:
+                value = self.rng.lognormvariate(math.log(self.median), self.sigma)
+        return value * self.time_scale
+
+    @classmethod
+    def parse(cls, spec, time_scale=1.0, seed=None):
+        """"0.4" 或 "0.4,0.6"（中位數秒數, sigma）"""
+        parts = [float(p) for p in spec.split(",")]
+        return cls(parts[0], parts[1] if len(parts) > 1 else 0.0, time_scale=time_scale, seed=seed)
+
+
+class FakeBackend:
+    """共用：延遲、429 注入與統計"""
+
+    def __init__(self, name, latency, error_rate=0.0, rpm_limit=None, seed=None):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rpm_limit = rpm_limit
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.in_flight = 0
+        self.stats = {"calls": 0, "throttled": 0, "max_in_flight": 0, "latencies": []}
+
+    def _throttled(self):
+        now = time.monotonic()
+        with self.lock:
+            self.stats["calls"] += 1
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.stats["throttled"] += 1
+                return True
+            if self.rpm_limit:
+                while self.window and now - self.window[0] > 60.0:
+                    self.window.popleft()
+                if len(self.window) >= self.rpm_limit:
+                    self.stats["throttled"] += 1
+                    return True
+                self.window.append(now)
+        return False
+
+    def serve(self, respond):
+        if self._throttled():
+            raise FakeRateLimitError(self.name)
+        with self.lock:
+            self.in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+        start = time.monotonic()
+        try:
+            time.sleep(self.latency.sample())
+            return respond()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.stats["latencies"].append(time.monotonic() - start)
+
+    def reset_stats(self):
+        with self.lock:
+            self.window.clear()
+            self.stats = {"calls": 0, "throttled": 0, "max_in_flight": 0, "latencies": []}
+
+
+# =================================================
+# Custom Search
+# =================================================
+FAKE_HOSTS = [
+    "www.ptt.cc", "www.dcard.tw", "www.youtube.com", "shopee.tw", "udn.com",
+    "zh.wikipedia.org", "blog.example.com", "www.mobile01.com", "vocus.cc", "www.health.com.tw",
+]
+
+
+class FakeCSERequest:
+    def __init__(self, backend, params):
+        self.backend = backend
+        self.params = params
+
+    def execute(self, http=None):
+        q = self.params.get("q", "")
+        start = self.params.get("start", 1)
+
+        def respond():
+            return {"items": [
+                {
+                    "title": f"{q} 推薦與比較 #{start + i}",
+                    "snippet": f"{q} 的使用心得、優缺點與價格整理。" * 3,
+                    "displayLink": FAKE_HOSTS[(start + i) % len(FAKE_HOSTS)],
+                    "link": f"https://{FAKE_HOSTS[(start + i) % len(FAKE_HOSTS)]}/article/{abs(hash(q)) % 10000}-{start + i}"
+                }
+                for i in range(self.params.get("num", 10))
+            ]}
+        return self.backend.serve(respond)
+
+
+class FakeCSEService(FakeBackend):
+    """build("customsearch") 的替身：service.cse().list(**params).execute()"""
+
+    def __init__(self, latency, **kwargs):
+        super().__init__("serp", latency, **kwargs)
+
+    def cse(self):
+        return self
+
+    def list(self, **params):
+        return FakeCSERequest(self, params)
+
+
+# =================================================
+# Gemini
+# =================================================
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt_tokens, len(text) // 2)
+
+
+class FakeStreamResponse(FakeResponse):
+    """stream=True 的回應：迭代時把總延遲平均分配到各段文字"""
+
+    def __init__(self, text, prompt_tokens, latency, chunk_chars=40):
+        super().__init__(text, prompt_tokens)
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+
+    def __iter__(self):
+        chunks = [self.text[i:i + self.chunk_chars] for i in range(0, len(self.text), self.chunk_chars)] or [""]
+        for chunk in chunks:
+            time.sleep(self.latency / len(chunks))
+            yield SimpleNamespace(text=chunk)
+
+
+def fake_strategy(keyword):
+    return {
+        "User_Intent": f"想了解「{keyword}」的選擇重點",
+        "Battlefield_Status": "論壇與電商混戰",
+        "Opportunity_Gap": "缺少實測數據",
+        "Recommended_Page_Type": "比較評測文",
+        "Winning_Angles": [{"angle": "實測數據", "target": "重視效能的使用者"}],
+        "Killer_Titles": [{"title": f"{keyword} 實測比較", "reason": "結合數據與情境"}]
+    }
+
+
+def fake_gemini_text(prompt):
+    """依 prompt 內容回傳對應格式的 JSON"""
+    if "content_theme" in prompt:
+        return json.dumps({
+            "content_theme": "以實測比較切入",
+            "target_audience": "正在比較產品的消費者",
+            "content_structure": [{"section": "比較表", "focus": "規格與價格", "keywords_to_use": []}],
+            "must_cover_topics": ["價格", "規格"],
+            "avoid_pitfalls": ["只列規格不給建議"],
+            "differentiation_angle": "長期使用心得",
+            "content_format_suggestion": "比較評測文"
+        }, ensure_ascii=False)
+    if "pain_point_keywords" in prompt:
+        return json.dumps({
+            group: [{"keyword": f"{group} {i}", "search_intent": "資訊蒐集"} for i in range(10)]
+            for group in ("pain_point_keywords", "product_keywords", "brand_keywords")
+        }, ensure_ascii=False)
+    batch_keywords = re.findall(r"^### 關鍵字：(.+)$", prompt, flags=re.MULTILINE)
+    if batch_keywords:
+        return json.dumps(
+            {"strategies": [dict(fake_strategy(kw), Keyword=kw) for kw in batch_keywords]},
+            ensure_ascii=False
+        )
+    match = re.search(r"關鍵字「(.+?)」", prompt)
+    return json.dumps(fake_strategy(match.group(1) if match else ""), ensure_ascii=False)
+
+
+class FakeGenerativeModel(FakeBackend):
+    """genai.GenerativeModel 的替身"""
+
+    def __init__(self, latency, **kwargs):
+        super().__init__("gemini", latency, **kwargs)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        prompt = contents if isinstance(contents, str) else next(
+            (c for c in contents if isinstance(c, str)), ""
+        )
+        if stream:
+            if self._throttled():
+                raise FakeRateLimitError(self.name)
+            latency = self.latency.sample()
+            with self.lock:
+                self.stats["latencies"].append(latency)
+            return FakeStreamResponse(fake_gemini_text(prompt), len(prompt) // 2, latency)
+        return self.serve(lambda: FakeResponse(fake_gemini_text(prompt), len(prompt) // 2))
+
+
+# =================================================
+# Google Suggest
+# =================================================
+class FakeHTTPResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+
+class FakeSuggestSession(FakeBackend):
+    """requests.Session 的替身（只處理 Suggest 的 GET）"""
+
+    def __init__(self, latency, **kwargs):
+        super().__init__("suggest", latency, **kwargs)
+
+    def get(self, url, params=None, timeout=None):
+        q = (params or {}).get("q", "")
+        try:
+            return self.serve(lambda: FakeHTTPResponse([q, [f"{q} {suffix}" for suffix in (
+                "推薦", "ptt", "dcard", "比較", "價格", "評價", "2024", "優缺點"
+            )]]))
+        except FakeRateLimitError:
+            return FakeHTTPResponse({}, status_code=429)
+
+    def close(self):
+        pass
+
+
+# =================================================
+# 安裝
+# =================================================
+def install_fakes(google_key, gemini_key, model_names, cse=None, gemini=None, suggest=None):
+    """將替身放進 clients registry（之後 core 的呼叫都會使用替身）"""
+    clients.reset_clients()
+    with clients._lock:
+        if cse is not None:
+            clients._cse_services[google_key] = cse
+        if gemini is not None:
+            for name in model_names:
+                clients._gemini_models[(gemini_key, name)] = gemini
+        if suggest is not None:
+            clients._http_session = suggest
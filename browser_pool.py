@@ -0,0 +1,263 @@
+"""
+常駐 Headless Chromium Pool
+
+Playwright 在背景 event loop thread 中啟動一次並常駐，之後每個網址只需開新分頁：
+- 預先建立多個 browser context；每個 context 只處理一頁，用完即關閉並在背景換上新的，
+  cookies / localStorage / 快取不會留給下一個網址（或其他 session）
+- 攔截圖片 / 字型 / 影音與追蹤碼請求，減少載入時間
+- 以 DOMContentLoaded + 短暫等待 load 取代 networkidle
+- 多個網址可同時處理（每個 context 一次處理一頁）
+
+Streamlit 每次 rerun 都在不同 thread，因此 Playwright 物件只在 pool 自己的 thread 內使用，
+外部一律透過同步方法呼叫。
+"""
+import asyncio
+import os
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+from playwright.async_api import async_playwright
+
+from clients import BROWSER_USER_AGENT
+
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+
+# 擷取主要內容：去除導覽/頁尾等雜訊後取 innerText（在瀏覽器端就截斷長度）
+EXTRACT_TEXT_JS = """
+(maxChars) => {
+    const root = document.querySelector('main') || document.querySelector('article') || document.body;
+    if (!root) return '';
+    root.querySelectorAll('script, style, nav, footer, header, aside, iframe, noscript')
+        .forEach((el) => el.remove());
+    const lines = (root.innerText || '').split('\\n').map((l) => l.trim()).filter(Boolean);
+    return lines.join('\\n').slice(0, maxChars);
+}
+"""
+
+# 渲染 PDF 前的頁面文字（不修改 DOM，作為 PDF 分析的快取 key；PDF 本身每次都含新的建立時間）
+PAGE_TEXT_JS = """
+() => (document.body ? document.body.innerText : '')
+"""
+
+# 主要內容區塊的位置（供截圖用）
+MAIN_RECT_JS = """
+() => {
+    const root = document.querySelector('main') || document.querySelector('article') || document.body;
+    if (!root) return null;
+    const r = root.getBoundingClientRect();
+    return {x: r.left + window.scrollX, y: r.top + window.scrollY, width: r.width, height: r.height};
+}
+"""
+
+BLOCKED_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "facebook.net",
+    "connect.facebook.net",
+    "hotjar.com",
+    "clarity.ms",
+    "criteo.com",
+    "scorecardresearch.com",
+    "adservice.google.com",
+)
+
+
+def is_blocked_host(url):
+    host = (urlparse(url).hostname or "").lower()
+    return any(host == h or host.endswith("." + h) for h in BLOCKED_HOSTS)
+
+
+class BrowserPool:
+    """常駐 Chromium，提供同步的 render_pdf / render_pdfs"""
+
+    def __init__(self, max_contexts=4, block_resources=True, nav_timeout_ms=15000, settle_timeout_ms=2500):
+        self.max_contexts = max_contexts
+        self.block_resources = block_resources
+        self.nav_timeout_ms = nav_timeout_ms
+        self.settle_timeout_ms = settle_timeout_ms
+
+        self._playwright = None
+        self._browser = None
+        self._contexts = None
+        self._recycling = set()
+        self._start_lock = threading.Lock()
+        self._start_guard = None
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="browser-pool", daemon=True)
+        self._thread.start()
+
+    # -------------------------------------------------
+    # 背景 loop 內執行
+    # -------------------------------------------------
+    def _submit(self, coro, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result(timeout)
+
+    async def _route(self, route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or is_blocked_host(request.url):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _new_context(self):
+        context = await self._browser.new_context(user_agent=BROWSER_USER_AGENT)
+        if self.block_resources:
+            await context.route("**/*", self._route)
+        return context
+
+    async def _start(self):
+        if self._start_guard is None:
+            self._start_guard = asyncio.Lock()
+        async with self._start_guard:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch()
+            self._contexts = asyncio.Queue()
+            for _ in range(self.max_contexts):
+                self._contexts.put_nowait(await self._new_context())
+
+    async def _recycle(self, contexts, context):
+        """關閉用過的 context 並放回一個新的；建立失敗時放回 None，下次取用時再建立（pool 大小不變）"""
+        try:
+            await context.close()
+        except Exception:
+            pass
+        try:
+            replacement = await self._new_context()
+        except Exception:
+            # browser 已失效，留待下次 _start() 重新啟動後建立
+            replacement = None
+        contexts.put_nowait(replacement)
+
+    async def _with_page(self, url, action):
+        await self._start()
+        # 記住取出的佇列：browser 重啟時 _start() 會換新的佇列，不可把 context 放進新佇列
+        contexts = self._contexts
+        context = await contexts.get()
+        if context is None:
+            try:
+                context = await self._new_context()
+            except Exception:
+                contexts.put_nowait(None)
+                raise
+        page = None
+        try:
+            page = await context.new_page()
+            try:
+                await page.goto(url, wait_until="domcontentloaded", timeout=self.nav_timeout_ms)
+            except Exception:
+                # 主文件逾時仍嘗試繼續（可能只是部分資源載入慢）
+                pass
+            try:
+                await page.wait_for_load_state("load", timeout=self.settle_timeout_ms)
+            except Exception:
+                pass
+            return await action(page)
+        finally:
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+            # 每取出一個 context 恰好放回一個；換新的動作在背景進行，不延遲本次結果
+            task = asyncio.ensure_future(self._recycle(contexts, context))
+            self._recycling.add(task)
+            task.add_done_callback(self._recycling.discard)
+
+    async def _pdf(self, url, pdf_path):
+        async def action(page):
+            text = await page.evaluate(PAGE_TEXT_JS)
+            await page.pdf(path=pdf_path, format="A4", print_background=True)
+            return pdf_path, text
+        return await self._with_page(url, action)
+
+    async def _content(self, url, max_chars, screenshots, quality):
+        async def action(page):
+            images = []
+            if screenshots:
+                # 先截圖再移除雜訊元素，避免版面變動
+                rect = await page.evaluate(MAIN_RECT_JS)
+                viewport = page.viewport_size or {"width": 1280, "height": 720}
+                if rect and rect["width"] > 0 and rect["height"] > 0:
+                    for i in range(screenshots):
+                        top = rect["y"] + i * viewport["height"]
+                        if top >= rect["y"] + rect["height"]:
+                            break
+                        clip = {
+                            "x": rect["x"],
+                            "y": top,
+                            "width": min(rect["width"], viewport["width"]),
+                            "height": min(viewport["height"], rect["y"] + rect["height"] - top)
+                        }
+                        images.append(await page.screenshot(clip=clip, type="jpeg", quality=quality, full_page=True))
+            text = await page.evaluate(EXTRACT_TEXT_JS, max_chars)
+            return text, images
+        return await self._with_page(url, action)
+
+    async def _pdf_many(self, urls):
+        async def one(url):
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_file:
+                pdf_path = tmp_file.name
+            try:
+                path, text = await self._pdf(url, pdf_path)
+                return path, text, None
+            except Exception as e:
+                try:
+                    os.unlink(pdf_path)
+                except OSError:
+                    pass
+                return None, None, str(e)
+        return await asyncio.gather(*(one(url) for url in urls))
+
+    async def _close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    # -------------------------------------------------
+    # 對外同步介面
+    # -------------------------------------------------
+    def _timeout(self, n=1):
+        rounds = -(-n // self.max_contexts)
+        return rounds * (self.nav_timeout_ms + self.settle_timeout_ms) / 1000 + 30
+
+    def warm_up(self):
+        """預先啟動 Chromium 與 contexts"""
+        with self._start_lock:
+            self._submit(self._start(), timeout=60)
+
+    def render_pdf(self, url):
+        """將單一網頁轉成 PDF，回傳 (暫存檔路徑, 頁面文字)"""
+        path, text, error = self.render_pdfs([url])[0]
+        if error:
+            raise RuntimeError(error)
+        return path, text
+
+    def render_pdfs(self, urls):
+        """同時將多個網頁轉成 PDF，回傳 [(pdf_path, page_text, error), ...]（順序與輸入相同）"""
+        self.warm_up()
+        return self._submit(self._pdf_many(list(urls)), timeout=self._timeout(len(urls)))
+
+    def extract_content(self, url, max_chars=20000, screenshots=0, quality=50):
+        """直接從渲染後的 DOM 取主要文字（可選主要區塊的 JPEG 截圖），回傳 (text, [jpeg bytes])"""
+        self.warm_up()
+        return self._submit(
+            self._content(url, max_chars, screenshots, quality),
+            timeout=self._timeout(1)
+        )
+
+    def close(self):
+        try:
+            self._submit(self._close(), timeout=30)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,206 @@
+"""
+磁碟快取（SQLite）
+
+提供 TTL 過期與容量上限淘汰的 key-value 快取，供 SERP 等外部 API 結果重複使用，
+避免同樣的查詢重複消耗配額。值以 JSON 儲存。
+
+DiskCache 可跨 session 共用；單次執行要用不同的 TTL / 容量上限或單獨統計命中數時，
+以 CacheView 包裝，不要直接修改共用實例的設定。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 預設快取目錄（可用環境變數覆寫）
+CACHE_DIR = os.environ.get(
+    "SERP_RADAR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+
+
+def make_cache_key(*parts):
+    """將多個欄位組合成穩定的雜湊 key"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """SQLite 磁碟快取，支援 TTL 與容量上限（依最久未使用淘汰）"""
+
+    def __init__(self, path, ttl_seconds=86400, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        # 統計用
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+            self.conn.commit()
+
+    def _lookup(self, key, ttl_seconds):
+        """回傳 (是否命中, 值)；過期的項目只視為未命中（其他 TTL 較長的使用者可能仍需要）"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or (ttl_seconds and now - row[1] > ttl_seconds):
+                self.stats["misses"] += 1
+                return False, None
+
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.stats["hits"] += 1
+
+        return True, json.loads(row[0])
+
+    def get(self, key, default=None, ttl=None):
+        """讀取快取，過期或不存在時回傳 default（ttl 未指定時使用 ttl_seconds）"""
+        hit, value = self._lookup(key, self.ttl_seconds if ttl is None else ttl)
+        return value if hit else default
+
+    def contains(self, key, ttl=None):
+        """檢查 key 是否存在且未過期（不計入命中統計）"""
+        ttl_seconds = self.ttl_seconds if ttl is None else ttl
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return False
+        return not (ttl_seconds and time.time() - row[0] > ttl_seconds)
+
+    def _store(self, key, value, ttl_seconds, max_bytes):
+        """寫入並淘汰，回傳淘汰的項目數"""
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode("utf-8")), now, now)
+            )
+            self.stats["writes"] += 1
+            evicted = self._evict(ttl_seconds, max_bytes)
+            self.conn.commit()
+        return evicted
+
+    def set(self, key, value):
+        """寫入快取，超過容量上限時淘汰最久未使用的項目"""
+        self._store(key, value, self.ttl_seconds, self.max_bytes)
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache")
+            self.conn.commit()
+
+    def _evict(self, ttl_seconds, max_bytes):
+        """清除過期項目，並依 accessed 由舊到新淘汰直到低於容量上限（需持有 lock），回傳淘汰數"""
+        evicted = 0
+        if ttl_seconds:
+            cur = self.conn.execute(
+                "DELETE FROM cache WHERE created < ?", (time.time() - ttl_seconds,)
+            )
+            evicted += max(cur.rowcount, 0)
+
+        if max_bytes:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > max_bytes:
+                rows = self.conn.execute("SELECT key, size FROM cache ORDER BY accessed ASC").fetchall()
+                to_delete = []
+                for key, size in rows:
+                    if total <= max_bytes:
+                        break
+                    to_delete.append((key,))
+                    total -= size
+
+                self.conn.executemany("DELETE FROM cache WHERE key = ?", to_delete)
+                evicted += len(to_delete)
+
+        self.stats["evictions"] += evicted
+        return evicted
+
+    def size_bytes(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def snapshot(self):
+        """取得目前統計的複本（用於計算單次執行的差值）"""
+        with self.lock:
+            return dict(self.stats)
+
+
+class CacheView:
+    """
+    共用 DiskCache 的單次執行視圖，不修改共用實例（多個 session 同時執行時互不影響）：
+    - ttl_seconds：只影響讀取（超過即視為未命中）；過期淘汰仍依共用實例的 ttl_seconds，
+      因此共用實例的 TTL 應設為任何執行可能要求的最長值
+    - max_bytes：此視圖寫入時的容量上限
+    - 命中 / 未命中等統計只計算經過此視圖的呼叫
+    """
+
+    def __init__(self, cache, ttl_seconds=None, max_bytes=None):
+        self.cache = cache
+        self.ttl_seconds = cache.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self.max_bytes = cache.max_bytes if max_bytes is None else max_bytes
+        self.lock = threading.Lock()
+
+        # 統計用（只含經過此視圖的呼叫）
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0
+        }
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def get(self, key, default=None):
+        hit, value = self.cache._lookup(key, self.ttl_seconds)
+        self._count("hits" if hit else "misses")
+        return value if hit else default
+
+    def contains(self, key):
+        return self.cache.contains(key, ttl=self.ttl_seconds)
+
+    def set(self, key, value):
+        evicted = self.cache._store(key, value, self.cache.ttl_seconds, self.max_bytes)
+        self._count("writes")
+        self._count("evictions", evicted)
+
+    def size_bytes(self):
+        return self.cache.size_bytes()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
@@ -0,0 +1,305 @@
+"""
+SERP 戰略雷達 - 第二階段批次 CLI（不需 Streamlit）
+
+從檔案或 stdin 讀入關鍵字（每行一個），執行 SERP 抓取 + Gemini 策略分析 +
+內容寫作方向指引，並將報告寫入輸出目錄。限制參數與 UI 側邊欄相同。
+Excel / NDJSON / Parquet 在每個關鍵字完成時即逐列寫出（依完成順序），不會在記憶體中累積 SERP 資料。
+
+範例：
+    export GOOGLE_API_KEY=... GEMINI_API_KEY=...
+    python cli.py keywords.txt --out reports/
+    cat keywords.txt | python cli.py - --out reports/ --batch --gemini-concurrency 3
+    python cli.py keywords.txt --formats xlsx,ndjson,parquet
+    python cli.py keywords.txt --record run.sqlite      # 錄製所有外部呼叫
+    python cli.py keywords.txt --replay run.sqlite      # 不連網重播（不需 API Key）
+"""
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from cache import CacheView
+from core import (
+    analyze_keyword_batch,
+    analyze_keyword_strategy,
+    attach_competitor_pages,
+    fetch_keyword_serp,
+    generate_content_direction,
+    keyword_error_result,
+    open_gemini_cache,
+    open_page_cache,
+    open_serp_cache,
+    strategy_batch_cost,
+)
+from journal import RunJournal, run_signature
+from limiter import RateLimitedExecutor
+from jsonfix import stats_since as json_stats_since, stats_snapshot as json_stats_snapshot
+from metrics import limiter_bound, to_json as metrics_to_json, to_prometheus
+from page_fetcher import PageFetcher
+from pipeline import StagedPipeline
+from quota import SharedQuota, get_quota_manager
+from replay import configure_replay, current_tape
+from report import EXPORT_FORMATS, StreamingExport, build_json_text, parquet_available
+
+
+def read_keywords(source):
+    """讀取關鍵字（- 代表 stdin），去除空白行並保留順序去重"""
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return list(dict.fromkeys(k.strip() for k in lines if k.strip()))
+
+
+def parse_formats(value):
+    """逗號分隔的輸出格式（xlsx / ndjson / parquet）"""
+    formats = list(dict.fromkeys(f.strip().lower() for f in value.split(",") if f.strip()))
+    unknown = [f for f in formats if f not in EXPORT_FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"不支援的格式：{', '.join(unknown)}（可用：{', '.join(EXPORT_FORMATS)}）")
+    return formats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("keywords", help="關鍵字檔案路徑（每行一個），- 代表 stdin")
+    parser.add_argument("--out", default="reports", help="輸出目錄")
+    parser.add_argument("--google-key", default=os.environ.get("GOOGLE_API_KEY"), help="Google API Key（預設讀 GOOGLE_API_KEY）")
+    parser.add_argument("--gemini-key", default=os.environ.get("GEMINI_API_KEY"), help="Gemini API Key（預設讀 GEMINI_API_KEY）")
+    parser.add_argument("--model", default="gemini-2.5-flash", help="分析模型")
+    parser.add_argument("--gl", default="tw", help="地區 (gl)")
+    parser.add_argument("--hl", default="zh-TW", help="語言 (hl)")
+    parser.add_argument("--pages", type=int, default=2, choices=[1, 2, 3], help="抓取頁數")
+    parser.add_argument("--competitor-pages", type=int, default=0, metavar="N",
+                        help="抓取每個關鍵字前 N 名的頁面內容一併分析（0 = 不抓）")
+    parser.add_argument("--formats", type=parse_formats, default=["xlsx"],
+                        help="逗號分隔的輸出格式：xlsx,ndjson,parquet（JSON 策略備份一律輸出）")
+
+    limits = parser.add_argument_group("效能設定")
+    limits.add_argument("--serp-concurrency", type=int, default=3, help="SERP 同時請求數")
+    limits.add_argument("--gemini-concurrency", type=int, default=2, help="Gemini 同時請求數")
+    limits.add_argument("--gemini-interval", type=float, default=1.0, help="Gemini 請求間隔（秒）")
+    limits.add_argument("--gemini-tpm", type=int, default=1_000_000, help="Gemini TPM 上限（0 表示不限制）")
+    limits.add_argument("--serp-rpm", type=int, default=300, help="SERP 每分鐘請求上限")
+    limits.add_argument("--queue-size", type=int, default=10, help="SERP → 分析 佇列上限")
+
+    shared = parser.add_argument_group("共用額度（與 Streamlit 及其他 CLI 共同遵守，見 quota.py）")
+    shared.add_argument("--shared-quota", action="store_true", help="啟用跨 process 共用額度")
+    shared.add_argument("--shared-gemini-rpm", type=int, default=60, help="Gemini 共用 RPM")
+    shared.add_argument("--shared-serp-rpm", type=int, default=300, help="SERP 共用 RPM")
+    shared.add_argument("--gemini-daily-budget", type=int, default=0, help="Gemini 每日預算（0 表示不限制）")
+    shared.add_argument("--serp-daily-budget", type=int, default=0, help="SERP 每日預算（0 表示不限制）")
+
+    batch = parser.add_argument_group("批次分析")
+    batch.add_argument("--batch", action="store_true", help="啟用批次策略分析")
+    batch.add_argument("--batch-size", type=int, default=8, help="每批最多關鍵字數")
+    batch.add_argument("--batch-token-budget", type=int, default=32_000, help="每批 token 預算")
+
+    cache = parser.add_argument_group("快取")
+    cache.add_argument("--serp-cache-ttl-hours", type=int, default=24, help="SERP 快取有效期（0 停用，最多 168）")
+    cache.add_argument("--bypass-gemini-cache", action="store_true", help="略過 Gemini 快取讀取")
+
+    tape = parser.add_argument_group("錄製 / 重播（停用快取）").add_mutually_exclusive_group()
+    tape.add_argument("--record", metavar="ARCHIVE", help="將所有外部呼叫錄製到此檔案")
+    tape.add_argument("--replay", metavar="ARCHIVE", help="從錄製檔重播，不連網")
+
+    parser.add_argument("--resume", action="store_true", help="從上次中斷處續跑（相同關鍵字與設定）")
+    parser.add_argument("--no-content-direction", action="store_true", help="不產生內容寫作方向指引")
+    return parser.parse_args(argv)
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.record:
+        configure_replay("record", args.record)
+    elif args.replay:
+        configure_replay("replay", args.replay)
+        args.google_key = args.google_key or "replay"
+        args.gemini_key = args.gemini_key or "replay"
+    replaying = bool(args.record or args.replay)
+
+    if not (args.google_key and args.gemini_key):
+        log("❌ 請提供 Google API Key 與 Gemini API Key（--google-key / --gemini-key 或環境變數）")
+        return 2
+
+    keywords = read_keywords(args.keywords)
+    if not keywords:
+        log("❌ 沒有任何關鍵字")
+        return 2
+
+    if "parquet" in args.formats and not parquet_available():
+        log("❌ 輸出 Parquet 需要安裝 pyarrow")
+        return 2
+
+    os.makedirs(args.out, exist_ok=True)
+
+    serp_quota, gemini_quota = None, None
+    if args.shared_quota and not args.replay:
+        quota_manager = get_quota_manager()
+        session_id = f"cli-{os.getpid()}"
+        serp_quota = SharedQuota(quota_manager, args.google_key, "serp", session_id,
+                                 args.shared_serp_rpm, args.serp_daily_budget)
+        gemini_quota = SharedQuota(quota_manager, args.gemini_key, "gemini", session_id,
+                                   args.shared_gemini_rpm, args.gemini_daily_budget)
+
+    executor = RateLimitedExecutor(
+        max_concurrent_serp=args.serp_concurrency,
+        max_concurrent_gemini=args.gemini_concurrency,
+        gemini_min_interval=args.gemini_interval,
+        serp_rpm=args.serp_rpm,
+        gemini_tpm=args.gemini_tpm or None,
+        serp_quota=serp_quota,
+        gemini_quota=gemini_quota
+    )
+
+    # 錄製 / 重播時不使用快取，確保每個外部呼叫都經過錄製檔
+    if replaying:
+        args.serp_cache_ttl_hours = 0
+        args.bypass_gemini_cache = True
+
+    serp_cache = None
+    if args.serp_cache_ttl_hours > 0:
+        serp_cache = CacheView(open_serp_cache(), ttl_seconds=args.serp_cache_ttl_hours * 3600)
+    gemini_cache = open_gemini_cache()
+    page_fetcher = None
+    if args.competitor_pages > 0:
+        page_fetcher = PageFetcher(cache=None if replaying else open_page_cache())
+
+    def fetch_keyword(kw):
+        result = fetch_keyword_serp(kw, executor, args.google_key, args.gl, args.hl, args.pages, serp_cache)
+        if page_fetcher:
+            attach_competitor_pages(result, page_fetcher, args.competitor_pages)
+        return result
+
+    # 執行紀錄：每個關鍵字完成即寫入磁碟
+    signature = run_signature(keywords, args.gl, args.hl, args.pages, args.model, args.competitor_pages)
+    journal = RunJournal.start(signature)
+    restored = OrderedDict()
+    if args.resume:
+        previous = RunJournal.latest(signature)
+        restored = journal.resume_from(previous)
+        restored = OrderedDict((kw, restored[kw]) for kw in keywords if kw in restored)
+        if previous is not None:
+            log(f"♻️ 已從執行紀錄恢復 {len(restored)} 組關鍵字（{previous.path}）")
+    pending_keywords = [kw for kw in keywords if kw not in restored]
+    json_stats_before = json_stats_snapshot()
+
+    pipeline = StagedPipeline(
+        fetch_fn=fetch_keyword,
+        analyze_fn=lambda r: analyze_keyword_strategy(
+            r, executor, args.gemini_key, args.gl, args.model,
+            gemini_cache, args.bypass_gemini_cache
+        ),
+        fetch_workers=args.serp_concurrency,
+        analyze_workers=args.gemini_concurrency,
+        queue_size=args.queue_size,
+        error_result=keyword_error_result,
+        analyze_batch_fn=(lambda rs: analyze_keyword_batch(
+            rs, executor, args.gemini_key, args.gl, args.model,
+            gemini_cache, args.bypass_gemini_cache
+        )) if args.batch else None,
+        batch_cost=strategy_batch_cost,
+        batch_budget=args.batch_token_budget,
+        max_batch=args.batch_size,
+        on_result=journal.append
+    )
+
+    # 串流輸出：每個關鍵字完成即寫入，之後只保留策略（SERP 資料不留在記憶體）
+    stem = f"seo_strategy_{int(time.time())}"
+    export = StreamingExport(args.out, stem, args.formats)
+    reports = []
+
+    def collect(kw, result):
+        export.add(kw, result)
+        strategy = result.get("strategy")
+        if not result.get("error") and strategy and "error" not in strategy:
+            strategy["Keyword"] = kw
+            reports.append(strategy)
+        result.pop("serp_df", None)
+        result.pop("serp_raw", None)
+
+    for kw, result in restored.items():
+        collect(kw, result)
+
+    log(f"⚡ 開始分析 {len(pending_keywords)} 組關鍵字（SERP×{args.serp_concurrency} / Gemini×{args.gemini_concurrency}）")
+    start = time.time()
+    for done, result in enumerate(pipeline.run(pending_keywords), start=len(restored) + 1):
+        kw = result["keyword"]
+        collect(kw, result)
+        status = "❌ " + result["error"] if result.get("error") else "✅"
+        log(f"[{done}/{len(keywords)}] {kw} {status}")
+
+    # 策略依輸入順序排列（內容指引與 JSON 備份使用）
+    order = {kw: i for i, kw in enumerate(keywords)}
+    reports.sort(key=lambda s: order[s["Keyword"]])
+    if page_fetcher:
+        page_fetcher.close()
+        page_stats = page_fetcher.stats
+        log(f"📄 競品頁面：{page_stats['requested']} 個排名網址，去重 {page_stats['deduplicated']}，"
+            f"快取 {page_stats['cache_fresh']} / 304 {page_stats['not_modified']}，"
+            f"下載 {page_stats['downloaded']}，失敗 {page_stats['errors']}")
+    log(f"✅ SERP 分析完成：成功 {len(reports)} / {len(keywords)}，耗時 {time.time() - start:.1f} 秒")
+
+    content_direction = None
+    if reports and not args.no_content_direction:
+        log("🤖 產生內容寫作方向指引...")
+        content_direction, error = generate_content_direction(
+            args.gemini_key, reports, keywords, args.model,
+            cache=gemini_cache, bypass_cache=args.bypass_gemini_cache
+        )
+        if error:
+            log(f"❌ {error}")
+
+    paths = export.close(content_direction)
+    json_path = os.path.join(args.out, f"{stem}.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        f.write(build_json_text(reports, content_direction))
+
+    for path in list(paths.values()) + [json_path]:
+        log(f"📥 已輸出：{path}")
+    log(f"📊 SERP 呼叫 {executor.stats['serp_calls']} 次 / Gemini 呼叫 {executor.stats['gemini_calls']} 次 / "
+        f"Gemini 重試 {executor.stats['gemini_retries']} 次 / 錯誤 {len(executor.stats['errors'])} 個")
+    for provider, q in executor.quota_stats().items():
+        budget = f"/{q['daily_budget']}" if q["daily_budget"] else ""
+        log(f"🤝 {provider.upper()} 共用額度：最近 60 秒占比 {q['share']:.0%}（{q['active_sessions']} 個 session），"
+            f"今日 {q['daily_used']}{budget}")
+    json_stats = json_stats_since(json_stats_before)
+    log(f"🧩 JSON：直接解析 {json_stats['strict']} / 本地修復 {json_stats['local_repair']} / "
+        f"Gemini 修復 {json_stats['remote_repair']} / 失敗 {json_stats['failed']} / "
+        f"結構不符 {json_stats['schema_invalid']}")
+
+    # 延遲指標（JSON + Prometheus 文字格式）
+    metrics = executor.metrics.snapshot()
+    metrics_path = os.path.join(args.out, f"{stem}_metrics.json")
+    prom_path = os.path.join(args.out, f"{stem}_metrics.prom")
+    with open(metrics_path, "w", encoding="utf-8") as f:
+        f.write(metrics_to_json(metrics))
+    with open(prom_path, "w", encoding="utf-8") as f:
+        f.write(to_prometheus(metrics))
+    for provider, snap in metrics["providers"].items():
+        if not snap["requests"]:
+            continue
+        wait, elapsed = snap["queue_wait"], snap["exec"]
+        log(f"⏱️ {provider.upper()}：等待 p50 {wait['p50']:.2f}s / p95 {wait['p95']:.2f}s，"
+            f"執行 p50 {elapsed['p50']:.2f}s / p95 {elapsed['p95']:.2f}s，429 比例 {snap['throttle_rate']:.1%}，"
+            f"{'本地限速' if limiter_bound(snap) else 'Provider 回應'}為主要瓶頸")
+    log(f"📥 已輸出：{metrics_path}")
+    log(f"📥 已輸出：{prom_path}")
+    if replaying:
+        tape = current_tape()
+        log(f"🎞️ {'錄製' if args.record else '重播'}：{tape.path} {tape.stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+API Client Registry
+
+Google CSE 的 discovery service 與 Gemini 的 GenerativeModel 建立一次後重複使用，
+避免每個關鍵字都重新解析 discovery 文件、重新建立連線。
+所有物件可在 ThreadPoolExecutor 的 worker 之間共用。
+
+Gemini 不使用全域的 genai.configure：每組 API Key 各自建立 GenerativeServiceClient /
+FileServiceClient，GenerativeModel 與檔案上傳都綁定該 key 的 client，
+多個 session 使用不同的 key 時互不影響，也不會清掉其他 key 已建立的 model。
+
+對外呼叫一律經過本模組的入口（execute_cse_list / http_get / generate_content / stream_content / upload_file ...），
+錄製與重播（replay.py）只需在這裡處理。
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.generativeai.client import FileServiceClient
+from google.generativeai.types import file_types
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from googleapiclient.discovery import build_from_document
+
+from cache import CACHE_DIR
+from metrics import record_usage
+from replay import through_tape
+
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+DISCOVERY_DIR = os.path.join(CACHE_DIR, "discovery")
+HTTP_TIMEOUT = 30
+
+_lock = threading.Lock()
+_thread_local = threading.local()
+_discovery_docs = {}
+_cse_services = {}
+_gemini_clients = {}
+_gemini_models = {}
+_http_session = None
+_uploaded_hashes = {}
+
+BROWSER_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+HTTP_POOL_SIZE = 32
+
+
+# =================================================
+# Google CSE
+# =================================================
+def load_discovery_doc(api="customsearch", version="v1"):
+    """取得 discovery 文件：記憶體 → 本地檔案 → 套件內建 → 網路下載"""
+    key = (api, version)
+    with _lock:
+        if key in _discovery_docs:
+            return _discovery_docs[key]
+
+        path = os.path.join(DISCOVERY_DIR, f"{api}_{version}.json")
+        doc = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                doc = f.read()
+
+        if doc is None:
+            try:
+                from googleapiclient.discovery_cache import get_static_doc
+                doc = get_static_doc(api, version)
+            except ImportError:
+                doc = None
+
+        if doc is None:
+            res = requests.get(DISCOVERY_URL.format(api=api, version=version), timeout=HTTP_TIMEOUT)
+            res.raise_for_status()
+            doc = res.text
+
+        if not os.path.exists(path):
+            os.makedirs(DISCOVERY_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(doc)
+
+        _discovery_docs[key] = doc
+        return doc
+
+
+def get_cse_service(api_key):
+    """取得（或建立）指定 API Key 的 Custom Search service"""
+    with _lock:
+        service = _cse_services.get(api_key)
+    if service is not None:
+        return service
+
+    doc = load_discovery_doc("customsearch", "v1")
+    service = build_from_document(json.loads(doc), developerKey=api_key)
+
+    with _lock:
+        # 其他 thread 可能已先建立，以先建立者為準
+        return _cse_services.setdefault(api_key, service)
+
+
+def get_thread_http():
+    """每個 thread 各自一個 httplib2.Http（httplib2 非 thread-safe）"""
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = httplib2.Http(timeout=HTTP_TIMEOUT)
+        _thread_local.http = http
+    return http
+
+
+def execute_cse_list(api_key, **params):
+    """執行 cse().list(...)，使用共用 service 與 thread 專屬連線"""
+    def live():
+        service = get_cse_service(api_key)
+        return service.cse().list(**params).execute(http=get_thread_http())
+    return through_tape("cse", params, live, encode=lambda r: r, decode=lambda d: d)
+
+
+# =================================================
+# Gemini
+# =================================================
+def get_gemini_clients(api_key):
+    """取得（或建立）此 API Key 專用的 Gemini client（generative / file），不經過 genai.configure"""
+    with _lock:
+        gemini_clients = _gemini_clients.get(api_key)
+        if gemini_clients is None:
+            options = {"api_key": api_key}
+            gemini_clients = SimpleNamespace(
+                generative=glm.GenerativeServiceClient(client_options=options),
+                file=FileServiceClient(client_options=options)
+            )
+            _gemini_clients[api_key] = gemini_clients
+        return gemini_clients
+
+
+def get_gemini_model(api_key, model_name):
+    """取得（或建立）GenerativeModel，依 (api_key, model_name) 重複使用，請求一律使用該 key 的 client"""
+    key = (api_key, model_name)
+    with _lock:
+        model = _gemini_models.get(key)
+    if model is not None:
+        return model
+
+    model = genai.GenerativeModel(model_name)
+    # GenerativeModel 在 _client 為 None 時才會改用全域預設的 client
+    model._client = get_gemini_clients(api_key).generative
+    with _lock:
+        return _gemini_models.setdefault(key, model)
+
+
+def _content_parts_key(contents):
+    """prompt 內容的錄製 key：文字原樣、圖片與上傳檔以內容雜湊表示"""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    key = []
+    for part in parts:
+        if isinstance(part, str):
+            key.append(part)
+        elif isinstance(part, dict) and "data" in part:
+            key.append({"mime_type": part.get("mime_type"), "sha256": hashlib.sha256(part["data"]).hexdigest()})
+        else:
+            name = getattr(part, "name", None)
+            key.append({"file": _uploaded_hashes.get(name, name)})
+    return key
+
+
+def _encode_gemini_response(response):
+    try:
+        text = response.text
+    except ValueError:
+        # 被安全機制擋下等沒有文字的回應
+        text = None
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "text": text,
+        "usage": {
+            "prompt_token_count": getattr(usage, "prompt_token_count", 0),
+            "candidates_token_count": getattr(usage, "candidates_token_count", 0),
+            "total_token_count": getattr(usage, "total_token_count", 0)
+        } if usage is not None else None
+    }
+
+
+class RecordedGeminiResponse:
+    """重播用的 Gemini 回應（text / usage_metadata）"""
+
+    def __init__(self, data):
+        self._text = data.get("text")
+        usage = data.get("usage")
+        self.usage_metadata = SimpleNamespace(**usage) if usage else None
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("錄製的回應沒有文字內容")
+        return self._text
+
+
+def generate_content(model, contents, **kwargs):
+    """所有 Gemini 呼叫的共同入口（記錄 usage_metadata token 用量，支援錄製 / 重播）"""
+    request = {
+        "model": getattr(model, "model_name", str(model)),
+        "contents": _content_parts_key(contents),
+        "options": kwargs
+    }
+    response = through_tape(
+        "gemini", request,
+        lambda: model.generate_content(contents, **kwargs),
+        encode=_encode_gemini_response,
+        decode=RecordedGeminiResponse
+    )
+    record_usage(response)
+    return response
+
+
+def stream_content(model, contents, on_text=None, **kwargs):
+    """
+    串流版 generate_content：每收到一段文字即呼叫 on_text(chunk)，回傳完整回應。
+    錄製 key 與 generate_content 相同（最終內容一致）；重播時整段文字一次送給 on_text
+    """
+    request = {
+        "model": getattr(model, "model_name", str(model)),
+        "contents": _content_parts_key(contents),
+        "options": kwargs
+    }
+    streamed = []
+
+    def live():
+        response = model.generate_content(contents, stream=True, **kwargs)
+        streamed.append(True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text and on_text is not None:
+                on_text(text)
+        return response
+
+    response = through_tape(
+        "gemini", request, live,
+        encode=_encode_gemini_response,
+        decode=RecordedGeminiResponse
+    )
+    if not streamed and on_text is not None:
+        try:
+            on_text(response.text)
+        except ValueError:
+            pass
+    record_usage(response)
+    return response
+
+
+def upload_file(api_key, path, mime_type):
+    """以此 API Key 的 client 上傳檔案給 Gemini；重播時不上傳，以檔案內容雜湊代表"""
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    def live():
+        client = get_gemini_clients(api_key).file
+        return file_types.File(client.create_file(
+            path=path, mime_type=mime_type, display_name=os.path.basename(path)
+        ))
+
+    uploaded = through_tape(
+        "upload", {"sha256": digest, "mime_type": mime_type},
+        live,
+        encode=lambda f: {"name": f.name},
+        decode=lambda d: SimpleNamespace(name=d["name"], state=SimpleNamespace(name="ACTIVE"))
+    )
+    with _lock:
+        _uploaded_hashes[uploaded.name] = digest
+    return uploaded
+
+
+def get_file(api_key, name):
+    return through_tape(
+        "get_file", {"name": name},
+        lambda: file_types.File(get_gemini_clients(api_key).file.get_file(name=name)),
+        encode=lambda f: {"name": f.name, "state": f.state.name},
+        decode=lambda d: SimpleNamespace(name=d["name"], state=SimpleNamespace(name=d["state"]))
+    )
+
+
+def delete_file(api_key, name):
+    through_tape(
+        "delete_file", {"name": name},
+        lambda: get_gemini_clients(api_key).file.delete_file(name=name),
+        encode=lambda _: {}, decode=lambda _: None
+    )
+
+
+# =================================================
+# HTTP（Suggest / 網頁抓取）
+# =================================================
+def get_http_session():
+    """共用的 keep-alive requests.Session（連線池可供多個 thread 同時使用）"""
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"User-Agent": BROWSER_USER_AGENT})
+            _http_session = session
+        return _http_session
+
+
+def _encode_http_response(response):
+    return {
+        "url": response.url,
+        "status_code": response.status_code,
+        "headers": {k: v for k, v in response.headers.items()
+                    if k.lower() in ("content-type", "etag", "last-modified")},
+        "content": base64.b64encode(response.content).decode("ascii")
+    }
+
+
+def _decode_http_response(data):
+    response = requests.Response()
+    response.url = data["url"]
+    response.status_code = data["status_code"]
+    response.headers = CaseInsensitiveDict(data["headers"])
+    response._content = base64.b64decode(data["content"])
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+def _read_bounded(response, max_bytes):
+    """串流讀取 body，超過 max_bytes 即停止並關閉連線（response.content 為讀到的部分）"""
+    chunks = []
+    size = 0
+    try:
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                break
+    finally:
+        response.close()
+    response._content = b"".join(chunks)[:max_bytes]
+    response._content_consumed = True
+    return response
+
+
+def http_get(url, params=None, headers=None, timeout=HTTP_TIMEOUT, max_bytes=None):
+    """
+    共用 session 的 GET（Suggest / 網頁抓取），支援錄製 / 重播。
+    max_bytes：以串流方式最多讀取的位元組數（網頁抓取用，避免下載過大的頁面）
+    """
+    def live():
+        if max_bytes is None:
+            return get_http_session().get(url, params=params, headers=headers, timeout=timeout)
+        response = get_http_session().get(url, params=params, headers=headers, timeout=timeout, stream=True)
+        return _read_bounded(response, max_bytes)
+
+    request = {"url": url, "params": params}
+    return through_tape("http", request, live, encode=_encode_http_response, decode=_decode_http_response)
+
+
+def reset_clients():
+    """清除所有已建立的 client（測試或換設定時使用）"""
+    global _http_session
+    with _lock:
+        _cse_services.clear()
+        _gemini_clients.clear()
+        _gemini_models.clear()
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
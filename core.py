@@ -0,0 +1,1014 @@
+"""
+SERP 戰略雷達核心邏輯（不依賴 Streamlit）
+
+第一階段（關鍵字探索）與第二階段（SERP 戰略分析）的 helper functions，
+供 app.py（Streamlit UI）與 cli.py（批次執行）共用。
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+
+from cache import DiskCache, make_cache_key, CACHE_DIR
+from clients import (
+    delete_file,
+    execute_cse_list,
+    generate_content,
+    get_file,
+    get_gemini_model,
+    http_get,
+    stream_content,
+    upload_file,
+)
+from html_extract import MAX_DOWNLOAD_BYTES, decode_html, extract_main_text
+from jsonfix import (
+    BATCH_STRATEGY_SCHEMA,
+    CONTENT_DIRECTION_SCHEMA,
+    KEYWORD_SCHEMA,
+    STRATEGY_SCHEMA,
+    IncrementalJSONParser,
+    JSONRepairError,
+    json_generation_config,
+    parse_json_tolerant,
+    record as record_json,
+    validate as validate_schema,
+)
+from limiter import estimate_tokens, is_rate_limit_error
+from page_types import get_page_type_rules
+
+# =================================================
+# 0. 固定設定
+# =================================================
+SEARCH_ENGINE_ID = "23e43fb5e029f4b50"  # CX 寫死（非機密）
+
+# =================================================
+# 1. Phase 1: 關鍵字探索 Helper Functions
+# =================================================
+KEYWORD_PROMPT_SPEC = """
+請將關鍵字分為三類：
+1. **痛點字（Pain Point Keywords）**：使用者可能遇到的問題、困擾、需求（例如：「失眠怎麼辦」「肩頸痠痛」）
+2. **產品字（Product Keywords）**：與產品/服務直接相關的搜尋詞（例如：「保健食品推薦」「按摩椅功能」）
+3. **品牌字（Brand Keywords）**：品牌名稱、競品名稱、商品型號（例如：「XXX品牌評價」「YYY vs ZZZ」）
+
+每類至少 8 組，總共 30 組關鍵字。
+
+請只用 JSON 回傳，不要任何 markdown 格式、不要 ```json```、不要任何前後說明文字：
+{
+  "pain_point_keywords": [
+    {"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"},
+    {"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}
+  ],
+  "product_keywords": [
+    {"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"},
+    {"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}
+  ],
+  "brand_keywords": [
+    {"keyword": "關鍵字1", "search_intent": "搜尋意圖說明"},
+    {"keyword": "關鍵字2", "search_intent": "搜尋意圖說明"}
+  ]
+}
+"""
+
+
+def build_pdf_keyword_prompt(product_name):
+    """PDF 關鍵字萃取 prompt"""
+    return f"""
+你是一位專業的 SEO 關鍵字研究專家。
+
+請分析這份 PDF 文件的內容，針對產品/服務「{product_name}」萃取 30 組具有 SEO 價值的關鍵字。
+""" + KEYWORD_PROMPT_SPEC
+
+
+def build_content_keyword_prompt(content, product_name):
+    """網頁內容關鍵字萃取 prompt"""
+    return f"""
+你是一位專業的 SEO 關鍵字研究專家。
+
+請分析以下網頁內容，針對產品/服務「{product_name}」萃取 30 組具有 SEO 價值的關鍵字。
+
+網頁內容：
+---
+{content}
+---
+""" + KEYWORD_PROMPT_SPEC
+
+
+def gemini_cache_key(model_name, prompt, file_hash=None):
+    """Gemini 回應快取 key：(model_name, prompt, 附件雜湊)"""
+    return make_cache_key("gemini", model_name, prompt, file_hash)
+
+
+def convert_url_to_pdf(url, pool):
+    """將網頁轉換為 PDF 檔案（使用常駐的 Playwright browser pool），回傳 (pdf_path, page_text, error)"""
+    try:
+        pdf_path, page_text = pool.render_pdf(url)
+        return pdf_path, page_text, None
+    except Exception as e:
+        return None, None, f"PDF 轉換失敗：{str(e)}"
+
+
+def convert_urls_to_pdf(urls, pool):
+    """同時將多個網頁轉換為 PDF，回傳 [(pdf_path, page_text, error), ...]"""
+    try:
+        return [
+            (path, text, f"PDF 轉換失敗：{error}" if error else None)
+            for path, text, error in pool.render_pdfs(urls)
+        ]
+    except Exception as e:
+        return [(None, None, f"PDF 轉換失敗：{str(e)}") for _ in urls]
+
+
+def pdf_source_hash(pdf_path, source_url=None, page_text=None):
+    """
+    PDF 分析的快取 key：有來源網址與頁面文字時以兩者為準
+    （Chromium 每次產生的 PDF 都含新的 CreationDate 等中繼資料，檔案雜湊幾乎不會重複）；
+    否則退回 PDF 內容雜湊
+    """
+    if source_url and page_text:
+        return make_cache_key("pdf-source", source_url, page_text)
+    with open(pdf_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def extract_dom_content(url, pool, screenshots=0):
+    """從渲染後的頁面直接擷取主要文字（可選截圖），回傳 (text, images, error)"""
+    try:
+        text, images = pool.extract_content(url, max_chars=20000, screenshots=screenshots)
+        if not text or not text.strip():
+            return None, [], "頁面沒有可擷取的文字內容"
+        return text, images, None
+    except Exception as e:
+        return None, [], f"頁面擷取失敗：{str(e)}"
+
+
+def extract_keywords_with_pdf(api_key, pdf_path, product_name, model_name, cache=None, bypass_cache=False,
+                              source_url=None, page_text=None):
+    """使用 Gemini 讀取 PDF 並萃取關鍵字（source_url / page_text：見 pdf_source_hash）"""
+    try:
+        prompt = build_pdf_keyword_prompt(product_name)
+        
+        # 快取：以來源網址 + 頁面文字（或 PDF 內容雜湊）+ prompt 為 key，命中時連上傳都省略
+        cache_key = gemini_cache_key(model_name, prompt, pdf_source_hash(pdf_path, source_url, page_text))
+        cached = cache.get(cache_key) if (cache is not None and not bypass_cache) else None
+        if cached is not None and schema_error(cached, KEYWORD_SCHEMA) is None:
+            try:
+                os.unlink(pdf_path)
+            except:
+                pass
+            return cached, None
+        
+        # 上傳 PDF 到 Gemini
+        uploaded_file = upload_file(api_key, pdf_path, mime_type="application/pdf")
+        
+        # 等待處理完成
+        while uploaded_file.state.name == "PROCESSING":
+            time.sleep(1)
+            uploaded_file = get_file(api_key, uploaded_file.name)
+        
+        if uploaded_file.state.name == "FAILED":
+            return None, "PDF 上傳處理失敗"
+        
+        # 使用模型分析
+        model = get_gemini_model(api_key, model_name)
+        
+        response = generate_content(model, [uploaded_file, prompt],
+                                    generation_config=json_generation_config(KEYWORD_SCHEMA))
+        raw = response.text.strip()
+        
+        # 清理暫存檔
+        try:
+            os.unlink(pdf_path)
+            delete_file(api_key, uploaded_file.name)
+        except:
+            pass
+        
+        parsed = parse_gemini_json(api_key, raw, KEYWORD_SCHEMA)
+        error = schema_error(parsed, KEYWORD_SCHEMA)
+        if error:
+            return None, error
+        if cache is not None:
+            cache.set(cache_key, parsed)
+        return parsed, None
+        
+    except JSONRepairError as e:
+        return None, f"JSON 解析失敗：{str(e)}"
+    except Exception as e:
+        return None, f"AI 分析 PDF 失敗：{str(e)}"
+
+
+def fetch_webpage_content(url):
+    """抓取網頁內容並轉換為純文字（優化版）"""
+    try:
+        # 共用 keep-alive session（已帶瀏覽器 User-Agent），只讀取前 MAX_DOWNLOAD_BYTES
+        response = http_get(url, timeout=15, max_bytes=MAX_DOWNLOAD_BYTES)
+        response.raise_for_status()
+        return extract_webpage_text(response)
+    except requests.exceptions.RequestException as e:
+        return None, f"網頁抓取失敗：{str(e)}"
+    except Exception as e:
+        return None, f"內容解析錯誤：{str(e)}"
+
+
+def extract_webpage_text(response):
+    """將已取得的 HTTP 回應轉換為主要內容的純文字，回傳 (text, error)"""
+    content_type = response.headers.get("Content-Type", "")
+    if content_type and not any(t in content_type.lower() for t in ("html", "text", "xml")):
+        return None, f"不支援的內容類型：{content_type}"
+    try:
+        # 編碼由 header / <meta> 決定，必要時只取樣偵測；解析後依字元上限擷取
+        return extract_main_text(decode_html(response.content, content_type))
+    except Exception as e:
+        return None, f"內容解析錯誤：{str(e)}"
+
+
+def extract_keywords_from_content(api_key, content, product_name, model_name, cache=None, bypass_cache=False,
+                                  images=None):
+    """AI 分析頁面內容（可附頁面截圖），萃取 30 組關鍵字"""
+    prompt = build_content_keyword_prompt(content, product_name)
+    images = images or []
+    
+    images_hash = None
+    if images:
+        images_hash = hashlib.sha256(b"".join(images)).hexdigest()
+    cache_key = gemini_cache_key(model_name, prompt, images_hash)
+    cached = cache.get(cache_key) if (cache is not None and not bypass_cache) else None
+    if cached is not None and schema_error(cached, KEYWORD_SCHEMA) is None:
+        return cached, None
+    
+    model = get_gemini_model(api_key, model_name)
+    
+    contents = [prompt] + [{"mime_type": "image/jpeg", "data": image} for image in images]
+    
+    try:
+        res = generate_content(model, contents if images else prompt,
+                               generation_config=json_generation_config(KEYWORD_SCHEMA))
+        raw = res.text.strip()
+        parsed = parse_gemini_json(api_key, raw, KEYWORD_SCHEMA)
+        error = schema_error(parsed, KEYWORD_SCHEMA)
+        if error:
+            return None, error
+        if cache is not None:
+            cache.set(cache_key, parsed)
+        return parsed, None
+    except JSONRepairError as e:
+        return None, f"JSON 解析失敗：{str(e)}"
+    except Exception as e:
+        return None, f"AI 分析失敗：{str(e)}"
+
+
+SUGGEST_URL = "https://www.google.com/complete/search"
+
+
+def get_google_suggestions(keyword, gl, hl, cache=None):
+    """取得 Google 搜尋建議 (Autocomplete)"""
+    cache_key = make_cache_key("suggest", keyword, gl, hl)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached, None
+    
+    try:
+        # 使用 Google Suggest API (Client=chrome 格式較好解析)，共用 keep-alive 連線
+        response = http_get(
+            SUGGEST_URL,
+            params={"client": "chrome", "q": keyword, "gl": gl, "hl": hl},
+            timeout=5
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            # data[0] 是 query, data[1] 是 suggestions list
+            if len(data) >= 2 and isinstance(data[1], list):
+                suggestions = data[1][:8]  # 取前 8 個建議
+                if cache is not None:
+                    cache.set(cache_key, suggestions)
+                return suggestions, None
+        
+        return [], None
+        
+    except Exception as e:
+        return [], str(e)
+
+
+def fetch_suggestions_bulk(keywords, gl, hl, max_workers=8, depth=1, cache=None,
+                           max_expansions=300, on_progress=None):
+    """並行取得多個關鍵字的搜尋建議，depth=2 時再展開一層（回傳 {keyword: [建議...]})"""
+    seeds = list(dict.fromkeys(k for k in keywords if k))
+    fetched = {}
+    
+    def run_level(level_keywords):
+        done = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            future_to_kw = {
+                pool.submit(get_google_suggestions, kw, gl, hl, cache): kw
+                for kw in level_keywords
+            }
+            for future in as_completed(future_to_kw):
+                suggestions, _ = future.result()
+                fetched[future_to_kw[future]] = suggestions
+                done += 1
+                if on_progress:
+                    on_progress(done, len(level_keywords))
+    
+    run_level(seeds)
+    
+    results = {kw: list(fetched.get(kw, [])) for kw in seeds}
+    if depth < 2:
+        return results
+    
+    # 第二層：展開第一層的建議字（排除已查過的，並設上限避免請求量爆增）
+    second = []
+    seen = set(seeds)
+    for kw in seeds:
+        for suggestion in results[kw]:
+            if suggestion not in seen:
+                seen.add(suggestion)
+                second.append(suggestion)
+    second = second[:max_expansions]
+    run_level(second)
+    
+    for kw in seeds:
+        expanded = list(results[kw])
+        for suggestion in results[kw]:
+            for child in fetched.get(suggestion, []):
+                if child not in expanded and child != kw:
+                    expanded.append(child)
+        results[kw] = expanded
+    return results
+
+
+# =================================================
+# 2. Phase 2: SERP 分析 Helper Functions
+# =================================================
+def detect_page_type(item):
+    """判斷單一 SERP 結果的頁面類型（規則見 page_types.json）"""
+    return get_page_type_rules().classify(item.get("link"), item.get("title"))
+
+
+def serp_cache_key(keyword, gl, hl, page):
+    """SERP 快取 key：(keyword, gl, hl, page, cx)"""
+    return make_cache_key("serp", keyword, gl, hl, page, SEARCH_ENGINE_ID)
+
+
+def fetch_serp_page(api_key, keyword, gl, hl, page):
+    """抓取單一 SERP 頁面的原始 items"""
+    res = execute_cse_list(
+        api_key,
+        q=keyword,
+        cx=SEARCH_ENGINE_ID,
+        num=10,
+        start=page * 10 + 1,
+        gl=gl,
+        hl=hl
+    )
+    return res.get("items", [])
+
+
+def get_serp_raw(api_key, keyword, gl, hl, pages, cache=None, executor=None):
+    """抓取 SERP 資料（有快取時優先使用快取，未命中的頁面並行抓取）"""
+    page_items = {}
+    missing = []
+
+    for page in range(pages):
+        items = cache.get(serp_cache_key(keyword, gl, hl, page)) if cache is not None else None
+        if items is None:
+            missing.append(page)
+        else:
+            page_items[page] = items
+
+    if missing:
+        # 各頁同時送出，並發與速率由 executor 的 SERP 限制統一控管
+        def fetch(page):
+            if executor is not None:
+                return executor.call_serp(fetch_serp_page, api_key, keyword, gl, hl, page)
+            return fetch_serp_page(api_key, keyword, gl, hl, page)
+
+        with ThreadPoolExecutor(max_workers=len(missing)) as page_pool:
+            future_to_page = {page_pool.submit(fetch, page): page for page in missing}
+            for future in as_completed(future_to_page):
+                page = future_to_page[future]
+                items = future.result()
+                page_items[page] = items
+                if cache is not None:
+                    cache.set(serp_cache_key(keyword, gl, hl, page), items)
+
+    results = []
+    for page in range(pages):
+        start = page * 10 + 1
+        for i, item in enumerate(page_items[page]):
+            desc = item.get("snippet", "") or ""
+            if len(desc) > 200:
+                desc = desc[:200] + "..."
+
+            results.append({
+                "Rank": start + i,
+                "Type": None,
+                "Title": item.get("title"),
+                "Description": desc,
+                "DisplayLink": item.get("displayLink"),
+                "URL": item.get("link")
+            })
+
+    # 頁面類型：整份 SERP 一次分類
+    page_types = get_page_type_rules().classify_many(
+        [r["URL"] for r in results], [r["Title"] for r in results]
+    )
+    for r, page_type in zip(results, page_types):
+        r["Type"] = page_type
+
+    return results
+
+
+def repair_json(api_key, broken_text, error, schema=None):
+    """請 Gemini 修復壞 JSON（本地修復失敗時的最後手段）"""
+    model = get_gemini_model(api_key, "gemini-2.0-flash")
+
+    prompt = f"""
+Fix the JSON below and return ONLY valid JSON. No markdown, no explanation.
+
+Error: {error}
+
+Broken JSON:
+{broken_text}
+"""
+    try:
+        options = {"generation_config": json_generation_config(schema)} if schema else {}
+        res = generate_content(model, prompt, **options)
+        return parse_json_tolerant(res.text.strip())[0]
+    except Exception:
+        return None
+
+
+def generate_json_text(model, contents, schema, on_field=None):
+    """
+    以 schema 限制輸出呼叫 Gemini，回傳完整文字。
+    有 on_field 時改用串流：最外層欄位一完成就呼叫 on_field(key, value)，最終文字與非串流相同
+    """
+    config = json_generation_config(schema)
+    if on_field is None:
+        return generate_content(model, contents, generation_config=config).text.strip()
+
+    parser = IncrementalJSONParser()
+
+    def on_text(chunk):
+        for key, value in parser.feed(chunk):
+            on_field(key, value)
+
+    return stream_content(model, contents, on_text=on_text, generation_config=config).text.strip()
+
+
+def parse_gemini_json(api_key, raw, schema):
+    """
+    解析 Gemini 的 JSON 回應：先在本地容錯解析，仍失敗才呼叫 repair_json；
+    結構不符 schema 時照常回傳（由呼叫端決定是否採用），只計入統計。
+    無法解析時拋出 JSONRepairError
+    """
+    try:
+        parsed, repaired = parse_json_tolerant(raw)
+        record_json("local_repair" if repaired else "strict")
+    except JSONRepairError as e:
+        parsed = repair_json(api_key, raw, str(e), schema)
+        if parsed is None:
+            record_json("failed")
+            raise
+        record_json("remote_repair")
+    if validate_schema(parsed, schema):
+        record_json("schema_invalid")
+    return parsed
+
+
+def schema_error(value, schema):
+    """
+    不符 schema 時回傳錯誤訊息，否則回傳 None。
+    截斷後在本地補齊的 JSON 可能缺欄位，這類結果應視為失敗（不寫入快取）
+    """
+    errors = validate_schema(value, schema)
+    if errors:
+        return "JSON 不符格式：" + "；".join(errors[:3])
+    return None
+
+
+# 批次模式下每個關鍵字預估的輸出 token（計入批次預算）
+BATCH_OUTPUT_TOKENS_PER_KEYWORD = 800
+
+
+# SERP 在 prompt 中的精簡格式：每個關鍵字的 token 上限（超過時先刪除價值最低的列）
+SERP_PROMPT_TOKEN_BUDGET = 2500
+SERP_PROMPT_MIN_ROWS = 3
+SERP_SNIPPET_CHARS = 100
+
+# 競品頁面（選用）：每頁放進 prompt 的字元上限
+COMPETITOR_PAGE_CHARS = 1500
+
+
+def page_type_codes():
+    """頁面類型 → 短代碼（依 page_types.json 的規則順序，撞字時加數字）"""
+    rules = get_page_type_rules()
+    codes = {}
+    for page_type in rules.types + [rules.default]:
+        base = next((c.upper() for c in page_type if c.isalnum()), "T")
+        code, n = base, 2
+        while code in codes.values():
+            code = f"{base}{n}"
+            n += 1
+        codes[page_type] = code
+    return codes
+
+
+def _compact_cell(value, limit=None):
+    """壓縮空白、避開分隔符號，必要時截斷"""
+    text = " ".join(str(value or "").split()).replace("|", "／")
+    if text.endswith("..."):
+        text = text[:-3]
+    if limit and len(text) > limit:
+        text = text[:limit] + "…"
+    return text
+
+
+def _render_serp_rows(rows, omitted=0):
+    codes = page_type_codes()
+    domain_counts = {}
+    for r in rows:
+        domain_counts[r["domain"]] = domain_counts.get(r["domain"], 0) + 1
+    # 出現多次的網域以代號表示
+    aliases = {}
+    for domain, count in domain_counts.items():
+        if count > 1 and domain:
+            aliases[domain] = f"@{len(aliases) + 1}"
+
+    used_types = list(dict.fromkeys(r["type"] for r in rows))
+    lines = [
+        "欄位：排名|類型|網域|標題|摘要",
+        "類型：" + "；".join(f"{codes.get(t, t)}={t}" for t in used_types)
+    ]
+    if aliases:
+        lines.append("網域：" + "；".join(f"{alias}={domain}" for domain, alias in aliases.items()))
+    for r in rows:
+        lines.append("|".join([
+            str(r["rank"]), codes.get(r["type"], r["type"]),
+            aliases.get(r["domain"], r["domain"]), r["title"], r["snippet"]
+        ]))
+    if omitted:
+        lines.append(f"（另有 {omitted} 筆低排名結果已省略）")
+    return "\n".join(lines)
+
+
+def serp_table_text(df, budget_tokens=SERP_PROMPT_TOKEN_BUDGET):
+    """
+    SERP 表格轉成 prompt 用的精簡文字（| 分隔、網域去重、類型代碼）。
+    超過 budget_tokens 時依價值由低到高刪列：排名越後越低，同網域的非首筆再減半，至少保留前幾名。
+    """
+    if df is None or df.empty:
+        return "（無搜尋結果）"
+
+    rows = []
+    seen_domains = set()
+    for record in df.to_dict("records"):
+        domain = _compact_cell(record.get("DisplayLink"))
+        if domain.startswith("www."):
+            domain = domain[4:]
+        rank = int(record.get("Rank") or len(rows) + 1)
+        value = 1.0 / rank
+        if domain in seen_domains:
+            value *= 0.5
+        seen_domains.add(domain)
+        rows.append({
+            "rank": rank,
+            "type": record.get("Type") or "",
+            "domain": domain,
+            "title": _compact_cell(record.get("Title")),
+            "snippet": _compact_cell(record.get("Description"), SERP_SNIPPET_CHARS),
+            "value": value
+        })
+
+    text = _render_serp_rows(rows)
+    if not budget_tokens or estimate_tokens(text) <= budget_tokens:
+        return text
+
+    # 依價值由低到高刪除，直到符合預算（保留原本的排名順序）
+    drop_order = sorted(rows, key=lambda r: r["value"])
+    kept = list(rows)
+    for victim in drop_order:
+        if len(kept) <= SERP_PROMPT_MIN_ROWS:
+            break
+        kept.remove(victim)
+        text = _render_serp_rows(kept, omitted=len(rows) - len(kept))
+        if estimate_tokens(text) <= budget_tokens:
+            break
+    return text
+
+
+def validate_strategy(strategy):
+    """檢查策略 JSON 是否符合 STRATEGY_SCHEMA"""
+    if not isinstance(strategy, dict) or "error" in strategy:
+        return False
+    return not validate_schema(strategy, STRATEGY_SCHEMA)
+
+
+def competitor_pages_text(pages):
+    """前 N 名頁面內容摘錄（抓取失敗的頁面略過）"""
+    blocks = []
+    for page in pages or []:
+        if page.get("text"):
+            blocks.append(f"#{page['rank']} {page['url']}\n{page['text'][:COMPETITOR_PAGE_CHARS]}")
+    if not blocks:
+        return ""
+    return "\n\n前幾名頁面內容摘錄：\n" + "\n\n".join(blocks)
+
+
+def build_strategy_prompt(keyword, df, gl, pages=None):
+    """策略分析 prompt（pages：選用的競品頁面內容，見 attach_competitor_pages）"""
+    data = serp_table_text(df) + competitor_pages_text(pages)
+
+    return f"""
+你是 SEO 策略顧問。
+請分析關鍵字「{keyword}」在 Google（{gl}）的 SERP 戰場。
+
+資料：
+{data}
+
+請只用 JSON 回傳，不要任何 markdown 格式、不要 ```json```、不要任何前後說明文字：
+{{
+  "User_Intent": "描述使用者搜尋此關鍵字的意圖",
+  "Battlefield_Status": "目前 SERP 戰場的競爭狀態分析",
+  "Opportunity_Gap": "發現的機會缺口",
+  "Recommended_Page_Type": "建議製作的頁面類型",
+  "Winning_Angles": [
+    {{ "angle": "切角1", "target": "目標受眾" }},
+    {{ "angle": "切角2", "target": "目標受眾" }}
+  ],
+  "Killer_Titles": [
+    {{ "title": "標題1", "reason": "為何有效" }},
+    {{ "title": "標題2", "reason": "為何有效" }}
+  ]
+}}
+"""
+
+
+def analyze_strategy_raw(api_key, keyword, df, gl, model_name, prompt=None, on_field=None):
+    """執行 Gemini 策略分析（on_field：串流時每個欄位完成即回呼）"""
+    model = get_gemini_model(api_key, model_name)
+
+    if prompt is None:
+        prompt = build_strategy_prompt(keyword, df, gl)
+
+    try:
+        raw = generate_json_text(model, prompt, STRATEGY_SCHEMA, on_field)
+        strategy = parse_gemini_json(api_key, raw, STRATEGY_SCHEMA)
+        # 不符格式視為失敗（不寫入快取、不算完成）
+        error = schema_error(strategy, STRATEGY_SCHEMA)
+        if error:
+            return {"error": f"策略{error}", "raw_response": raw}, raw
+        return strategy, raw
+    except JSONRepairError as e:
+        return {"error": str(e), "raw_response": raw}, raw
+    except Exception as e:
+        # 速率限制交給 executor 降速重試
+        if is_rate_limit_error(e):
+            raise
+        return {"error": str(e)}, str(e)
+
+
+def build_batch_strategy_prompt(items, gl):
+    """批次策略分析 prompt：items 為 [(keyword, df, pages), ...]（pages 可為 None）"""
+    sections = []
+    for keyword, df, pages in items:
+        sections.append(f"### 關鍵字：{keyword}\n{serp_table_text(df)}{competitor_pages_text(pages)}")
+    data = "\n\n".join(sections)
+
+    return f"""
+你是 SEO 策略顧問。
+請分別分析以下 {len(items)} 個關鍵字在 Google（{gl}）的 SERP 戰場，每個關鍵字各自獨立分析。
+
+資料：
+{data}
+
+請只用 JSON 陣列回傳，每個關鍵字一個物件，"Keyword" 必須與上方關鍵字完全相同。
+不要任何 markdown 格式、不要 ```json```、不要任何前後說明文字：
+[
+  {{
+    "Keyword": "關鍵字",
+    "User_Intent": "描述使用者搜尋此關鍵字的意圖",
+    "Battlefield_Status": "目前 SERP 戰場的競爭狀態分析",
+    "Opportunity_Gap": "發現的機會缺口",
+    "Recommended_Page_Type": "建議製作的頁面類型",
+    "Winning_Angles": [
+      {{ "angle": "切角1", "target": "目標受眾" }},
+      {{ "angle": "切角2", "target": "目標受眾" }}
+    ],
+    "Killer_Titles": [
+      {{ "title": "標題1", "reason": "為何有效" }},
+      {{ "title": "標題2", "reason": "為何有效" }}
+    ]
+  }}
+]
+"""
+
+
+def analyze_strategy_batch_raw(api_key, items, gl, model_name, prompt=None):
+    """執行批次策略分析，回傳 ({keyword: strategy}, raw)"""
+    model = get_gemini_model(api_key, model_name)
+
+    if prompt is None:
+        prompt = build_batch_strategy_prompt(items, gl)
+
+    try:
+        res = generate_content(model, prompt, generation_config=json_generation_config(BATCH_STRATEGY_SCHEMA))
+        raw = res.text.strip()
+        parsed = parse_gemini_json(api_key, raw, BATCH_STRATEGY_SCHEMA)
+    except JSONRepairError:
+        # 無法解析：全部交由逐筆重跑處理
+        return {}, raw
+    except Exception as e:
+        # 速率限制交給 executor 降速重試，其他錯誤交由逐筆重跑處理
+        if is_rate_limit_error(e):
+            raise
+        return {}, str(e)
+
+    if isinstance(parsed, dict):
+        parsed = parsed.get("strategies") or [parsed]
+    if not isinstance(parsed, list):
+        return {}, raw
+
+    strategies = {}
+    for entry in parsed:
+        if isinstance(entry, dict) and entry.get("Keyword"):
+            keyword = str(entry.pop("Keyword")).strip()
+            strategies[keyword] = entry
+    return strategies, raw
+
+
+def build_content_direction_prompt(all_strategies, selected_keywords):
+    """內容寫作指引 prompt"""
+    # 整理所有策略資訊
+    strategy_summary = []
+    for s in all_strategies:
+        if "error" not in s:
+            strategy_summary.append({
+                "keyword": s.get("Keyword", ""),
+                "intent": s.get("User_Intent", ""),
+                "opportunity": s.get("Opportunity_Gap", ""),
+                "page_type": s.get("Recommended_Page_Type", "")
+            })
+    
+    return f"""
+你是一位資深內容策略顧問。
+
+根據以下關鍵字的 SERP 戰場分析結果，請產生一份「內容寫作方向綜合指引」。
+
+分析的關鍵字：
+{json.dumps(selected_keywords, ensure_ascii=False)}
+
+各關鍵字的 SERP 分析摘要：
+{json.dumps(strategy_summary, ensure_ascii=False, indent=2)}
+
+請提供具體、可執行的內容策略建議。
+
+請只用 JSON 回傳，不要任何 markdown 格式、不要 ```json```、不要任何前後說明文字：
+{{
+  "content_theme": "核心主題方向（一句話描述這篇內容的核心定位）",
+  "target_audience": "目標受眾描述（他們是誰？在什麼情境下會搜尋？）",
+  "content_structure": [
+    {{"section": "建議段落標題1", "focus": "這段要涵蓋的重點內容", "keywords_to_use": ["建議使用的關鍵字"]}},
+    {{"section": "建議段落標題2", "focus": "這段要涵蓋的重點內容", "keywords_to_use": ["建議使用的關鍵字"]}},
+    {{"section": "建議段落標題3", "focus": "這段要涵蓋的重點內容", "keywords_to_use": ["建議使用的關鍵字"]}}
+  ],
+  "must_cover_topics": ["必須涵蓋的主題1", "必須涵蓋的主題2", "必須涵蓋的主題3"],
+  "differentiation_angle": "差異化切角（如何讓這篇內容與現有 SERP 結果不同）",
+  "content_format_suggestion": "建議的內容格式（例如：比較表、步驟教學、案例分析等）",
+  "avoid_pitfalls": ["需避免的寫作陷阱1", "需避免的寫作陷阱2"]
+}}
+"""
+
+
+def generate_content_direction(api_key, all_strategies, selected_keywords, model_name, cache=None, bypass_cache=False,
+                               on_field=None):
+    """根據所有關鍵字的 SERP 分析，產生內容寫作綜合指引（on_field：串流時每個欄位完成即回呼）"""
+    prompt = build_content_direction_prompt(all_strategies, selected_keywords)
+    
+    cache_key = gemini_cache_key(model_name, prompt)
+    cached = cache.get(cache_key) if (cache is not None and not bypass_cache) else None
+    if cached is not None and schema_error(cached, CONTENT_DIRECTION_SCHEMA) is None:
+        return cached, None
+    
+    model = get_gemini_model(api_key, model_name)
+    
+    try:
+        raw = generate_json_text(model, prompt, CONTENT_DIRECTION_SCHEMA, on_field)
+        parsed = parse_gemini_json(api_key, raw, CONTENT_DIRECTION_SCHEMA)
+        error = schema_error(parsed, CONTENT_DIRECTION_SCHEMA)
+        if error:
+            return None, error
+        if cache is not None:
+            cache.set(cache_key, parsed)
+        return parsed, None
+    except JSONRepairError as e:
+        return None, f"JSON 解析失敗：{str(e)}"
+    except Exception as e:
+        return None, f"內容指引產生失敗：{str(e)}"
+
+
+def fetch_keyword_serp(kw, executor, google_key, gl, hl, pages, serp_cache=None):
+    """管線第一段：抓取單一關鍵字的 SERP"""
+    result = {
+        "keyword": kw,
+        "serp_df": None,
+        "serp_raw": None,
+        "strategy": None,
+        "raw_response": None,
+        "error": None,
+        "timing": {}
+    }
+    
+    try:
+        start_serp = time.time()
+        # 命中快取的頁面不佔用 SERP 並發名額，其餘頁面逐頁交給 executor
+        serp_data = get_serp_raw(
+            google_key, kw, gl, hl, pages, cache=serp_cache, executor=executor
+        )
+        result["timing"]["serp"] = time.time() - start_serp
+        result["serp_raw"] = serp_data
+        result["serp_df"] = pd.DataFrame(serp_data)
+    except Exception as e:
+        result["error"] = str(e)
+    
+    return result
+
+
+def attach_competitor_pages(result, fetcher, top_n):
+    """
+    管線第一段的選用步驟：抓取 SERP 前 top_n 名的頁面內容（fetcher 為 page_fetcher.PageFetcher，
+    跨關鍵字去重並使用 HTTP 快取）。結果只保留 prompt 用得到的摘錄長度
+    """
+    if result.get("error") or not result.get("serp_raw") or top_n <= 0:
+        return result
+    start_pages = time.time()
+    top = [row for row in sorted(result["serp_raw"], key=lambda row: row["Rank"]) if row.get("URL")][:top_n]
+    entries = fetcher.fetch_many([row["URL"] for row in top])
+    result["competitor_pages"] = [
+        {
+            "rank": row["Rank"],
+            "url": row["URL"],
+            "text": (entries[row["URL"]].get("text") or "")[:COMPETITOR_PAGE_CHARS] or None,
+            "error": entries[row["URL"]].get("error")
+        }
+        for row in top
+    ]
+    result["timing"]["pages"] = time.time() - start_pages
+    return result
+
+
+def analyze_keyword_strategy(result, executor, gemini_key, gl, model_name,
+                             gemini_cache=None, bypass_gemini_cache=False, on_field=None):
+    """管線第二段：對已抓好的 SERP 做 Gemini 策略分析（on_field 見 analyze_strategy_raw）"""
+    kw = result["keyword"]
+    
+    try:
+        # 命中快取時不進入 Gemini 並發/間隔控制
+        start_gemini = time.time()
+        prompt = build_strategy_prompt(kw, result["serp_df"], gl, result.get("competitor_pages"))
+        cache_key = gemini_cache_key(model_name, prompt)
+        cached = None
+        if gemini_cache is not None and not bypass_gemini_cache:
+            cached = gemini_cache.get(cache_key)
+        
+        if validate_strategy(cached):
+            strategy, raw = cached, json.dumps(cached, ensure_ascii=False)
+        else:
+            strategy, raw = executor.call_gemini(
+                analyze_strategy_raw, gemini_key, kw, result["serp_df"], gl, model_name, prompt, on_field,
+                est_tokens=estimate_tokens(prompt)
+            )
+            if gemini_cache is not None and validate_strategy(strategy):
+                gemini_cache.set(cache_key, strategy)
+        result["timing"]["gemini"] = time.time() - start_gemini
+        result["strategy"] = strategy
+        result["raw_response"] = raw
+        
+    except Exception as e:
+        result["error"] = str(e)
+    
+    return result
+
+
+def strategy_batch_cost(result):
+    """批次預算：輸入 token 估算 + 預估輸出 token"""
+    prompt_text = serp_table_text(result["serp_df"]) + competitor_pages_text(result.get("competitor_pages"))
+    return estimate_tokens(prompt_text) + BATCH_OUTPUT_TOKENS_PER_KEYWORD
+
+
+def analyze_keyword_batch(results, executor, gemini_key, gl, model_name,
+                          gemini_cache=None, bypass_gemini_cache=False):
+    """批次策略分析：快取命中者直接使用，其餘合併成一次請求，驗證失敗的再逐筆重跑"""
+    pending = []
+    for result in results:
+        prompt = build_strategy_prompt(result["keyword"], result["serp_df"], gl, result.get("competitor_pages"))
+        cached = None
+        if gemini_cache is not None and not bypass_gemini_cache:
+            cached = gemini_cache.get(gemini_cache_key(model_name, prompt))
+        if validate_strategy(cached):
+            result["strategy"] = cached
+            result["raw_response"] = json.dumps(cached, ensure_ascii=False)
+            result["timing"]["gemini"] = 0.0
+        else:
+            pending.append((result, prompt))
+
+    if len(pending) == 1:
+        result, _ = pending[0]
+        analyze_keyword_strategy(result, executor, gemini_key, gl, model_name, gemini_cache, bypass_gemini_cache=True)
+        return results
+
+    if pending:
+        batch_prompt = build_batch_strategy_prompt(
+            [(result["keyword"], result["serp_df"], result.get("competitor_pages")) for result, _ in pending], gl
+        )
+        start_gemini = time.time()
+        try:
+            strategies, raw = executor.call_gemini(
+                analyze_strategy_batch_raw, gemini_key, None, gl, model_name, batch_prompt,
+                est_tokens=estimate_tokens(batch_prompt)
+            )
+        except Exception:
+            strategies, raw = {}, None
+        elapsed = time.time() - start_gemini
+
+        for result, prompt in pending:
+            strategy = strategies.get(result["keyword"].strip())
+            if validate_strategy(strategy):
+                result["strategy"] = strategy
+                result["raw_response"] = raw
+                result["timing"]["gemini"] = elapsed
+                if gemini_cache is not None:
+                    gemini_cache.set(gemini_cache_key(model_name, prompt), strategy)
+            else:
+                # 只重跑這一筆
+                analyze_keyword_strategy(
+                    result, executor, gemini_key, gl, model_name, gemini_cache, bypass_gemini_cache=True
+                )
+                result["timing"]["gemini"] = result["timing"].get("gemini", 0) + elapsed
+
+    return results
+
+
+def process_single_keyword(kw, executor, google_key, gemini_key, gl, hl, pages, model_name,
+                           serp_cache=None, gemini_cache=None, bypass_gemini_cache=False):
+    """處理單一關鍵字的完整流程（SERP + 分析）"""
+    result = fetch_keyword_serp(kw, executor, google_key, gl, hl, pages, serp_cache)
+    if result["error"]:
+        return result
+    return analyze_keyword_strategy(
+        result, executor, gemini_key, gl, model_name, gemini_cache, bypass_gemini_cache
+    )
+
+
+def keyword_error_result(kw, e):
+    """管線中未預期例外時的結果格式"""
+    return {
+        "keyword": kw,
+        "error": str(e),
+        "serp_df": None,
+        "strategy": None
+    }
+
+
+# =================================================
+# 3. 快取
+# =================================================
+# SERP 快取保留時間上限（各次執行的有效期以 CacheView 指定，不超過此值）
+SERP_CACHE_MAX_TTL_HOURS = 168
+
+
+def open_serp_cache():
+    """SERP 磁碟快取（保留 SERP_CACHE_MAX_TTL_HOURS；實際有效期由每次執行的 CacheView 決定）"""
+    return DiskCache(os.path.join(CACHE_DIR, "serp_cache.sqlite"), ttl_seconds=SERP_CACHE_MAX_TTL_HOURS * 3600)
+
+
+def open_suggest_cache():
+    """Google Suggest 快取（依 keyword/gl/hl，保留 7 天）"""
+    return DiskCache(
+        os.path.join(CACHE_DIR, "suggest_cache.sqlite"),
+        ttl_seconds=7 * 86400,
+        max_bytes=20 * 1024 * 1024
+    )
+
+
+def open_page_cache():
+    """競品頁面的 HTTP 快取（擷取後的純文字 + ETag / Last-Modified，重新驗證由 PageFetcher 處理）"""
+    return DiskCache(
+        os.path.join(CACHE_DIR, "page_cache.sqlite"),
+        ttl_seconds=30 * 86400,
+        max_bytes=200 * 1024 * 1024
+    )
+
+
+def open_gemini_cache():
+    """Gemini 回應快取（內容定址，不設 TTL，依容量淘汰最久未使用）"""
+    return DiskCache(
+        os.path.join(CACHE_DIR, "gemini_cache.sqlite"),
+        ttl_seconds=0,
+        max_bytes=100 * 1024 * 1024
+    )
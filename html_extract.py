@@ -0,0 +1,171 @@
+"""
+網頁 → 純文字（有上限的擷取）
+
+- 編碼：依序採用 BOM、Content-Type 的 charset、HTML 開頭的 <meta charset>；
+  都沒有時先試 UTF-8，再只取開頭一段交給 charset 偵測（不掃描整份內容）
+- 解析：使用 lxml（C 實作，列於 requirements.txt）；環境中缺少 lxml 時退回內建的 html.parser
+- 擷取：在主要內容區塊內依文件順序收集文字，以區塊元素分行、標題加 #、清單加 -，
+  累積到字元上限即停止（不需先把整個子樹轉成字串再截斷）
+"""
+import codecs
+import importlib.util
+import re
+
+from bs4 import BeautifulSoup
+from bs4.element import NavigableString, PreformattedString
+
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+try:
+    from charset_normalizer import from_bytes as _detect_bytes
+except ImportError:
+    _detect_bytes = None
+
+# 下載上限（超過的部分不讀取）與擷取的文字上限
+MAX_DOWNLOAD_BYTES = 2 * 1024 * 1024
+MAX_TEXT_CHARS = 20000
+
+_META_SNIFF_BYTES = 4096
+_DETECT_SAMPLE_BYTES = 32 * 1024
+
+_HEADER_CHARSET = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.I)
+_META_CHARSET = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?([\w.:-]+)", re.I)
+_WHITESPACE = re.compile(r"\s+")
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# 與瀏覽器相同，以常見編碼的超集合解碼
+_SUPERSETS = {
+    "gb2312": "gb18030",
+    "gbk": "gb18030",
+    "big5": "cp950",
+    "latin-1": "cp1252",
+    "iso8859-1": "cp1252",
+    "ascii": "cp1252",
+}
+
+REMOVED_TAGS = ['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe', 'noscript']
+
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "dd", "div", "dl", "dt", "figcaption", "figure",
+    "form", "h1", "h2", "h3", "h4", "h5", "h6", "li", "main", "ol", "p", "pre", "section",
+    "table", "tbody", "td", "th", "thead", "tr", "ul", "body",
+}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+
+
+def _codec(name):
+    """正規化編碼名稱，不認得時回傳 None"""
+    try:
+        codec = codecs.lookup(name.decode("ascii") if isinstance(name, bytes) else name).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+    return _SUPERSETS.get(codec, codec)
+
+
+def detect_charset(content, content_type=None):
+    """BOM → Content-Type → <meta> → UTF-8 → 取樣偵測"""
+    for bom, encoding in _BOMS:
+        if content.startswith(bom):
+            return encoding
+
+    if content_type:
+        match = _HEADER_CHARSET.search(content_type)
+        if match and _codec(match.group(1)):
+            return _codec(match.group(1))
+
+    match = _META_CHARSET.search(content[:_META_SNIFF_BYTES])
+    if match and _codec(match.group(1)):
+        return _codec(match.group(1))
+
+    sample = content[:_DETECT_SAMPLE_BYTES]
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # 取樣剛好切在多位元組字元中間
+        if e.start >= len(sample) - 3:
+            return "utf-8"
+
+    if _detect_bytes is not None:
+        best = _detect_bytes(sample).best()
+        if best is not None and _codec(best.encoding):
+            return _codec(best.encoding)
+    return "utf-8"
+
+
+def decode_html(content, content_type=None):
+    return content.decode(detect_charset(content, content_type), errors="replace")
+
+
+def budgeted_text(root, max_chars=MAX_TEXT_CHARS):
+    """
+    依文件順序收集 root 內的文字：同一個區塊元素內的文字合併成一行，
+    超過 max_chars 即停止並在結尾加上 "..."
+    """
+    lines = []
+    total = 0
+    blocks = {}
+    current, current_len, current_block, prefix = [], 0, None, ""
+    truncated = False
+
+    def block_of(node):
+        parent = node.parent
+        key = id(parent)
+        block = blocks.get(key)
+        if block is None:
+            block = parent
+            while block is not root and block.name not in BLOCK_TAGS:
+                block = block.parent
+            blocks[key] = block
+        return block
+
+    def flush():
+        nonlocal total
+        line = _WHITESPACE.sub(" ", "".join(current)).strip()
+        if line:
+            lines.append(prefix + line)
+            total += len(prefix) + len(line) + 1
+
+    for node in root.descendants:
+        if not isinstance(node, NavigableString) or isinstance(node, PreformattedString):
+            continue
+        block = block_of(node)
+        if block is not current_block:
+            flush()
+            if total >= max_chars:
+                truncated = True
+                break
+            current, current_len, current_block = [], 0, block
+            if block.name in HEADING_TAGS:
+                prefix = "#" * HEADING_TAGS[block.name] + " "
+            elif block.name == "li":
+                prefix = "- "
+            else:
+                prefix = ""
+        if current_len < max_chars:
+            current.append(str(node))
+            current_len += len(node)
+    else:
+        flush()
+
+    text = "\n".join(lines)
+    if truncated or len(text) > max_chars:
+        text = text[:max_chars] + "..."
+    return text
+
+
+def extract_main_text(html, max_chars=MAX_TEXT_CHARS):
+    """HTML → 主要內容（main / article / body）的純文字，回傳 (text, error)"""
+    soup = BeautifulSoup(html, HTML_PARSER)
+    for tag in soup(REMOVED_TAGS):
+        tag.decompose()
+
+    main_content = soup.find('main') or soup.find('article') or soup.find('body')
+    if main_content is None:
+        return None, "無法找到主要內容區塊"
+    return budgeted_text(main_content, max_chars), None
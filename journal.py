@@ -0,0 +1,151 @@
+"""
+第二階段執行紀錄（JSONL checkpoint）
+
+每個關鍵字完成後立即 append 一行並 fsync，session 中斷或程式崩潰後，
+可依相同設定（關鍵字集合 / gl / hl / 頁數 / 模型）找回紀錄，只重跑尚未完成的關鍵字。
+
+每次執行各自寫入 {signature}-{run_id}.jsonl，多個 session 同時以相同設定執行時不會互相覆蓋；
+續跑時從最新一份有完成結果的紀錄讀回，並複製到本次的紀錄檔。
+超過 JOURNAL_TTL_SECONDS 或超過 JOURNAL_MAX_FILES 份的舊紀錄在建立新紀錄時清除。
+"""
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+from cache import CACHE_DIR, make_cache_key
+from jsonfix import STRATEGY_SCHEMA, validate as validate_schema
+
+JOURNAL_DIR = os.path.join(CACHE_DIR, "runs")
+JOURNAL_TTL_SECONDS = 7 * 86400
+JOURNAL_MAX_FILES = 200
+
+
+def run_signature(keywords, gl, hl, pages, model_name, competitor_pages=0):
+    """同一組設定對應同一份紀錄（關鍵字順序不影響；未抓競品頁面時與舊紀錄相容）"""
+    parts = ["run", sorted(set(keywords)), gl, hl, pages, model_name]
+    if competitor_pages:
+        parts.append(competitor_pages)
+    return make_cache_key(*parts)[:16]
+
+
+def is_completed(result):
+    """SERP 與策略分析都成功（且策略符合 STRATEGY_SCHEMA）才算完成"""
+    strategy = result.get("strategy")
+    return (not result.get("error") and isinstance(strategy, dict) and "error" not in strategy
+            and not validate_schema(strategy, STRATEGY_SCHEMA))
+
+
+def prune_journals(directory=JOURNAL_DIR, ttl_seconds=JOURNAL_TTL_SECONDS, max_files=JOURNAL_MAX_FILES, keep=()):
+    """刪除過期的紀錄，並只保留最近修改的 max_files 份（keep 中的路徑不刪），回傳刪除數"""
+    paths = []
+    for path in glob.glob(os.path.join(directory, "*.jsonl")):
+        try:
+            paths.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    paths.sort(reverse=True)
+
+    now = time.time()
+    removed = 0
+    for index, (mtime, path) in enumerate(paths):
+        if path in keep:
+            continue
+        if (ttl_seconds and now - mtime > ttl_seconds) or (max_files and index >= max_files):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+class RunJournal:
+    """單次執行的 append-only JSONL 紀錄，同一關鍵字以最後一筆為準"""
+
+    def __init__(self, signature, directory=JOURNAL_DIR, run_id=None, path=None):
+        """path 指定時開啟既有紀錄（續跑讀取用），否則以 run_id 建立本次執行的紀錄檔"""
+        os.makedirs(directory, exist_ok=True)
+        self.signature = signature
+        self.run_id = run_id or f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        self.path = path or os.path.join(directory, f"{signature}-{self.run_id}.jsonl")
+        self.lock = threading.Lock()
+
+    @classmethod
+    def start(cls, signature, directory=JOURNAL_DIR):
+        """開始新的執行（新的紀錄檔），順便清除過期的舊紀錄"""
+        journal = cls(signature, directory)
+        prune_journals(directory, keep=(journal.path,))
+        return journal
+
+    @classmethod
+    def latest(cls, signature, directory=JOURNAL_DIR):
+        """相同設定中最近修改、且至少有一組已完成關鍵字的紀錄；沒有時回傳 None"""
+        paths = []
+        for path in glob.glob(os.path.join(directory, f"{signature}*.jsonl")):
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        for _, path in sorted(paths, reverse=True):
+            journal = cls(signature, directory, path=path)
+            if journal.completed():
+                return journal
+        return None
+
+    def exists(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def resume_from(self, previous):
+        """讀回 previous 中已完成的結果並寫入本次紀錄，回傳 {keyword: result}"""
+        restored = previous.completed() if previous is not None else OrderedDict()
+        for result in restored.values():
+            self.append(result)
+        return restored
+
+    def append(self, result):
+        """寫入單一關鍵字結果（DataFrame 以 serp_raw 保存，讀回時重建）"""
+        entry = {
+            "keyword": result.get("keyword"),
+            "serp_raw": result.get("serp_raw"),
+            "competitor_pages": result.get("competitor_pages"),
+            "strategy": result.get("strategy"),
+            "raw_response": result.get("raw_response"),
+            "error": result.get("error"),
+            "timing": result.get("timing") or {},
+            "saved_at": time.time()
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def load(self):
+        """讀回所有結果 {keyword: result}；最後一行若因崩潰而不完整則略過"""
+        results = OrderedDict()
+        if not os.path.exists(self.path):
+            return results
+
+        with self.lock:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    entry.pop("saved_at", None)
+                    serp_raw = entry.get("serp_raw")
+                    entry["serp_df"] = pd.DataFrame(serp_raw) if serp_raw is not None else None
+                    results[entry["keyword"]] = entry
+        return results
+
+    def completed(self):
+        """已完成的關鍵字結果"""
+        return OrderedDict((kw, r) for kw, r in self.load().items() if is_completed(r))
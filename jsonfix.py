@@ -0,0 +1,338 @@
+"""
+Gemini JSON 回應處理（本地容錯解析 + schema）
+
+- parse_json_tolerant：先嚴格解析，失敗時在本地修復常見問題再解析，不需再呼叫 Gemini：
+  markdown code fence / 前後說明文字、尾端多餘逗號、字串內未跳脫的引號與換行、
+  回應被截斷（補上未結束的字串與括號，必要時退回最後一個完整元素）
+- *_SCHEMA：策略 / 批次策略 / 關鍵字 / 內容指引的回應結構，
+  同時用於 Gemini 的 response_schema（要求模型直接輸出符合結構的 JSON）與本地驗證
+- IncrementalJSONParser：串流回應逐段餵入，最外層物件的欄位一結束即取出（先行顯示用）
+- stats：嚴格解析成功、本地修復、呼叫 Gemini 修復（最後手段）、失敗與結構不符的次數
+"""
+import json
+import re
+import threading
+
+# =================================================
+# Schema
+# =================================================
+_STRING = {"type": "STRING"}
+_STRING_LIST = {"type": "ARRAY", "items": _STRING}
+
+
+def _object(properties, required=None):
+    return {
+        "type": "OBJECT",
+        "properties": properties,
+        "required": list(required if required is not None else properties)
+    }
+
+
+STRATEGY_PROPERTIES = {
+    "User_Intent": _STRING,
+    "Battlefield_Status": _STRING,
+    "Opportunity_Gap": _STRING,
+    "Recommended_Page_Type": _STRING,
+    "Winning_Angles": {"type": "ARRAY", "items": _object({"angle": _STRING, "target": _STRING})},
+    "Killer_Titles": {"type": "ARRAY", "items": _object({"title": _STRING, "reason": _STRING})},
+}
+STRATEGY_SCHEMA = _object(STRATEGY_PROPERTIES)
+
+BATCH_STRATEGY_SCHEMA = {
+    "type": "ARRAY",
+    "items": _object(dict({"Keyword": _STRING}, **STRATEGY_PROPERTIES))
+}
+
+_KEYWORD_LIST = {"type": "ARRAY", "items": _object({"keyword": _STRING, "search_intent": _STRING})}
+KEYWORD_SCHEMA = _object({
+    "pain_point_keywords": _KEYWORD_LIST,
+    "product_keywords": _KEYWORD_LIST,
+    "brand_keywords": _KEYWORD_LIST,
+})
+
+CONTENT_DIRECTION_SCHEMA = _object({
+    "content_theme": _STRING,
+    "target_audience": _STRING,
+    "content_structure": {
+        "type": "ARRAY",
+        "items": _object(
+            {"section": _STRING, "focus": _STRING, "keywords_to_use": _STRING_LIST},
+            required=["section", "focus"]
+        )
+    },
+    "must_cover_topics": _STRING_LIST,
+    "avoid_pitfalls": _STRING_LIST,
+    "differentiation_angle": _STRING,
+    "content_format_suggestion": _STRING,
+})
+
+# Gemini 的 response_schema 使用大寫型別名稱
+_TYPES = {
+    "OBJECT": dict,
+    "ARRAY": list,
+    "STRING": str,
+    "NUMBER": (int, float),
+    "INTEGER": int,
+    "BOOLEAN": bool,
+}
+
+
+def json_generation_config(schema):
+    """要求 Gemini 以 JSON 並依 schema 輸出"""
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def validate(value, schema, path="$"):
+    """依 schema（type / properties / required / items）檢查，回傳錯誤訊息 list（空 list 表示通過）"""
+    schema_type = str(schema.get("type", "")).upper()
+    expected = _TYPES.get(schema_type)
+    if expected is not None and (not isinstance(value, expected) or
+                                 (schema_type != "BOOLEAN" and isinstance(value, bool))):
+        return [f"{path}：應為 {schema_type.lower()}"]
+
+    errors = []
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key}：缺少欄位")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate(value[key], sub_schema, f"{path}.{key}"))
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+# =================================================
+# 統計
+# =================================================
+_lock = threading.Lock()
+stats = {
+    "strict": 0,
+    "local_repair": 0,
+    "remote_repair": 0,
+    "failed": 0,
+    "schema_invalid": 0,
+}
+
+
+def record(event):
+    with _lock:
+        stats[event] += 1
+
+
+def stats_snapshot():
+    with _lock:
+        return dict(stats)
+
+
+def stats_since(before):
+    """與先前 stats_snapshot() 的差值（單次執行的統計）"""
+    now = stats_snapshot()
+    return {key: now[key] - before.get(key, 0) for key in now}
+
+
+# =================================================
+# 容錯解析
+# =================================================
+class JSONRepairError(ValueError):
+    """本地修復後仍無法解析"""
+
+
+_FENCE = re.compile(r"```[a-zA-Z]*")
+
+
+def _strip_wrapping(text):
+    """去除 code fence 與第一個 { / [ 之前的說明文字"""
+    text = _FENCE.sub("", text).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return text[min(starts):] if starts else text
+
+
+def _drop_trailing_comma(out):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _close(out, stack):
+    """補上被截斷的結尾：懸空的 key 補 null、去除尾端逗號，再依序關閉括號"""
+    out = list(out)
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ":":
+        out.append("null")
+    for closer in reversed(stack):
+        _drop_trailing_comma(out)
+        out.append(closer)
+    return "".join(out)
+
+
+def _next_significant(text, i):
+    n = len(text)
+    while i < n and text[i].isspace():
+        i += 1
+    return text[i] if i < n else ""
+
+
+def repair_text(text):
+    """
+    逐字掃描修復，回傳候選字串 list（依可信度排序）：
+    第一個為直接補齊結尾的結果，其後為退回到較早完整元素的版本（處理截斷在 key 或數值中間）
+    """
+    text = _strip_wrapping(text)
+    out = []
+    stack = []
+    checkpoints = []  # (len(out), stack) — 每個逗號之前的位置
+    in_string = False
+    escape = False
+
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                out.append(ch)
+                escape = False
+            elif ch == "\\":
+                out.append(ch)
+                escape = True
+            elif ch == '"':
+                # 後面接的不是 , : } ] 或結尾時，視為字串內未跳脫的引號
+                if _next_significant(text, i + 1) in (",", ":", "}", "]", ""):
+                    out.append('"')
+                    in_string = False
+                else:
+                    out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch == "\r":
+                out.append("\\r")
+            elif ch == "\t":
+                out.append("\\t")
+            elif ord(ch) >= 0x20:
+                out.append(ch)
+            continue
+
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            if not stack:
+                continue
+            _drop_trailing_comma(out)
+            out.append(stack.pop())
+            if not stack:
+                # 最外層已結束，之後的文字忽略
+                return ["".join(out)]
+        elif ch == ",":
+            checkpoints.append((len(out), list(stack)))
+            out.append(ch)
+        else:
+            out.append(ch)
+
+    # 走到結尾仍未結束：回應被截斷
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    candidates = [_close(out, stack)]
+    for length, snapshot in reversed(checkpoints[-5:]):
+        candidates.append(_close(out[:length], snapshot))
+    return candidates
+
+
+def parse_json_tolerant(text):
+    """嚴格解析 → 本地修復；回傳 (value, repaired)，都失敗時拋出 JSONRepairError"""
+    try:
+        return json.loads(text), False
+    except (TypeError, ValueError) as e:
+        first_error = e
+    if not text:
+        raise JSONRepairError(f"空白回應：{first_error}")
+
+    for candidate in repair_text(text):
+        try:
+            return json.loads(candidate), True
+        except ValueError:
+            continue
+    raise JSONRepairError(str(first_error))
+
+
+# =================================================
+# 串流解析
+# =================================================
+class IncrementalJSONParser:
+    """
+    逐段餵入串流文字，最外層物件的每個欄位（"key": value）一結束就回傳。
+    只用於先行顯示：最終結果仍以完整文字交給 parse_json_tolerant 解析
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.fields = {}
+        self._member = []
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def feed(self, chunk):
+        """回傳這段文字中完成的 [(key, value), ...]"""
+        self.chunks.append(chunk)
+        completed = []
+        for ch in chunk:
+            if self._done:
+                break
+            if not self._started:
+                # 略過 code fence 等前置文字
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                self._member.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_member(completed)
+                    self._done = True
+                    continue
+            elif ch == "," and self._depth == 1:
+                self._finish_member(completed)
+                continue
+            self._member.append(ch)
+        return completed
+
+    def _finish_member(self, completed):
+        member = "".join(self._member).strip()
+        self._member = []
+        if not member:
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except ValueError:
+            return
+        for key, value in parsed.items():
+            self.fields[key] = value
+            completed.append((key, value))
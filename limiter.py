@@ -0,0 +1,260 @@
+"""
+Rate Limiter（核心平行控制）
+
+- TokenBucket：以「預約」方式扣除 token，lock 內只做計算，等待一律在 lock 外
+- AIMDController：撞到 429 時倍數降速，成功時線性回升
+- ProviderLimiter：單一 provider 的 RPM / TPM / 並發上限（可再加上跨 session 共用的額度，見 quota.py）
+- RateLimitedExecutor：SERP 與 Gemini 的執行器（統計 + 重試 + 延遲指標，見 metrics.py）
+
+clock / sleep 皆可注入，方便以假時鐘做確定性的驗證。
+"""
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import MetricsRegistry, usage_scope
+
+try:
+    from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+    RATE_LIMIT_EXCEPTIONS = (ResourceExhausted, TooManyRequests)
+except ImportError:
+    RATE_LIMIT_EXCEPTIONS = ()
+
+# 沒有 HTTP 狀態碼可判斷時（例如重播的錯誤）才比對訊息；
+# 不使用 "rate" / "limit" 等字樣，避免 "generateContent"、"exceeds the limit" 被誤判為 429
+RATE_LIMIT_MARKERS = ["429", "resource exhausted", "too many requests"]
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """粗估 token 數：CJK 字元約 1 token，其餘約 4 字元 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _status_code(e):
+    """取出例外附帶的 HTTP 狀態碼（google.api_core 的 code、HttpError.resp.status、requests 的 response）"""
+    candidates = [
+        getattr(e, "code", None),
+        getattr(e, "status_code", None),
+        getattr(getattr(e, "resp", None), "status", None),
+        getattr(getattr(e, "response", None), "status_code", None),
+    ]
+    for value in candidates:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def is_rate_limit_error(e):
+    """判斷例外是否為速率 / 配額限制（HTTP 429 / ResourceExhausted）"""
+    if RATE_LIMIT_EXCEPTIONS and isinstance(e, RATE_LIMIT_EXCEPTIONS):
+        return True
+    status = _status_code(e)
+    if status is not None:
+        return status == 429
+    error_str = str(e).lower()
+    return any(x in error_str for x in RATE_LIMIT_MARKERS)
+
+
+class TokenBucket:
+    """Token bucket（允許預約成負值，回傳需等待的秒數）"""
+
+    def __init__(self, rate_per_sec, capacity, clock=time.monotonic):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def reserve(self, amount=1.0):
+        """扣除 amount 個 token，回傳呼叫端需要等待的秒數（不在此 sleep）"""
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            # 單次請求超過容量時，最多扣到容量為止，避免永遠等不到
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def set_rate(self, rate_per_sec):
+        with self.lock:
+            self._refill(self.clock())
+            self.rate = rate_per_sec
+
+
+class AIMDController:
+    """AIMD 速率調整：成功 +increase，限流 ×decrease（冷卻期內只降一次）"""
+
+    def __init__(self, max_rate, min_rate, increase, decrease=0.5, cooldown=5.0, clock=time.monotonic):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.clock = clock
+        self.rate = max_rate
+        self.last_decrease = None
+        self.lock = threading.Lock()
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            return self.rate
+
+    def on_throttle(self):
+        with self.lock:
+            now = self.clock()
+            # 同一波 429 通常同時回來，冷卻期內不重複降速
+            if self.last_decrease is None or now - self.last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.last_decrease = now
+            return self.rate
+
+
+class ProviderLimiter:
+    """單一 provider 的限制：RPM（AIMD 調整）+ TPM + 並發數"""
+
+    def __init__(self, name, rpm, max_concurrent, tpm=None, burst=1, quota=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.name = name
+        self.quota = quota
+        self.clock = clock
+        self.sleep = sleep
+        self.semaphore = threading.Semaphore(max_concurrent)
+        self.requests = TokenBucket(rpm / 60.0, burst, clock=clock)
+        self.tokens = TokenBucket(tpm / 60.0, tpm, clock=clock) if tpm else None
+        self.aimd = AIMDController(
+            max_rate=rpm,
+            min_rate=max(1.0, rpm / 20.0),
+            increase=max(1.0, rpm / 20.0),
+            clock=clock
+        )
+
+    @property
+    def current_rpm(self):
+        return self.aimd.rate
+
+    def acquire(self, tokens=0):
+        """等待 RPM / TPM 額度（lock 外 sleep），回傳實際等待秒數"""
+        wait = self.requests.reserve(1)
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    @contextmanager
+    def slot(self, tokens=0):
+        """
+        先佔用並發名額，再在名額內等待 RPM / TPM 額度，確保實際送出請求時仍符合最小間隔；
+        有共用額度時同樣在名額內排隊（每個 session 最多並發數個等待者）
+        """
+        with self.semaphore:
+            self.acquire(tokens)
+            if self.quota is not None:
+                self.quota.acquire()
+            yield
+
+    def report_success(self):
+        self.requests.set_rate(self.aimd.on_success() / 60.0)
+
+    def report_throttle(self):
+        self.requests.set_rate(self.aimd.on_throttle() / 60.0)
+
+
+class RateLimitedExecutor:
+    """帶 rate limit 的平行執行器，防止 API 過載"""
+
+    def __init__(self, max_concurrent_serp=3, max_concurrent_gemini=2, gemini_min_interval=1.0,
+                 serp_rpm=300, gemini_tpm=None, max_retries=3, serp_quota=None, gemini_quota=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.serp = ProviderLimiter(
+            "serp", rpm=serp_rpm, max_concurrent=max_concurrent_serp,
+            quota=serp_quota, clock=clock, sleep=sleep
+        )
+        self.gemini = ProviderLimiter(
+            "gemini", rpm=60.0 / gemini_min_interval, max_concurrent=max_concurrent_gemini,
+            tpm=gemini_tpm, quota=gemini_quota, clock=clock, sleep=sleep
+        )
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.metrics = MetricsRegistry(("serp", "gemini"))
+
+        # 統計用
+        self.stats = {
+            "serp_calls": 0,
+            "gemini_calls": 0,
+            "gemini_retries": 0,
+            "serp_retries": 0,
+            "errors": []
+        }
+
+    def _call(self, limiter, label, func, args, kwargs, tokens=0):
+        """共用流程：取得額度 → 執行 → 429 時 AIMD 降速並退避重試（每次嘗試都記錄等待/執行時間）"""
+        metrics = self.metrics[label]
+        for attempt in range(self.max_retries):
+            queued = self.clock()
+            started = None
+            try:
+                with limiter.slot(tokens):
+                    started = self.clock()
+                    with usage_scope(metrics):
+                        result = func(*args, **kwargs)
+                metrics.observe_call(started - queued, self.clock() - started)
+                limiter.report_success()
+                with self.lock:
+                    self.stats[f"{label}_calls"] += 1
+                return result
+            except Exception as e:
+                # 呼叫前的錯誤（例如共用額度的每日預算用完）不是 provider 的 429，不重試
+                throttled = started is not None and is_rate_limit_error(e)
+                if started is not None:
+                    metrics.observe_call(started - queued, self.clock() - started,
+                                         throttled=throttled, error=not throttled)
+                if throttled and attempt < self.max_retries - 1:
+                    limiter.report_throttle()
+                    with self.lock:
+                        self.stats[f"{label}_retries"] += 1
+                    # Exponential backoff（不持有任何 lock / 並發名額）
+                    self.sleep((2 ** attempt) + random.uniform(0.5, 1.5))
+                else:
+                    if throttled:
+                        limiter.report_throttle()
+                    with self.lock:
+                        self.stats["errors"].append(f"{'SERP' if label == 'serp' else 'Gemini'}: {str(e)}")
+                    raise
+
+    def call_serp(self, func, *args, **kwargs):
+        """執行 SERP API 呼叫，帶並發控制 + 速率限制 + 重試"""
+        return self._call(self.serp, "serp", func, args, kwargs)
+
+    def call_gemini(self, func, *args, est_tokens=0, **kwargs):
+        """執行 Gemini API 呼叫，帶並發控制 + RPM/TPM 限制 + 重試"""
+        return self._call(self.gemini, "gemini", func, args, kwargs, tokens=est_tokens)
+
+    def quota_stats(self):
+        """共用額度下此 session 的占比與排隊順位（未啟用共用額度的 provider 不列出）"""
+        return {
+            label: limiter.quota.stats()
+            for label, limiter in (("serp", self.serp), ("gemini", self.gemini))
+            if limiter.quota is not None
+        }
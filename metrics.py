@@ -0,0 +1,218 @@
+"""
+執行指標（延遲直方圖 / 429 比例 / token 用量）
+
+每個 provider（serp / gemini）分別記錄：
+- queue_wait：從送出到真正開始呼叫的時間（RPM / TPM 等待 + 並發名額等待）
+- exec：API 呼叫本身的時間
+兩者比較即可看出瓶頸在本地限速（limiter-bound）還是 provider 回應（provider-bound）。
+
+直方圖使用固定 bucket（與 Prometheus histogram 相同），p50 / p95 / p99 由 bucket 內插估計。
+snapshot() 為純 dict，可存入 run store，再轉成 JSON 或 Prometheus 文字格式。
+"""
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0
+)
+PERCENTILES = (0.5, 0.95, 0.99)
+
+_active = threading.local()
+
+
+class Histogram:
+    """固定 bucket 的延遲直方圖（非 thread-safe，由 ProviderMetrics 的 lock 保護）"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # 最後一格為 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        value = max(0.0, value)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def snapshot(self):
+        cumulative = []
+        running = 0
+        for bound, n in zip(self.bounds + (math.inf,), self.counts):
+            running += n
+            cumulative.append(["+Inf" if bound == math.inf else bound, running])
+        snap = {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "buckets": cumulative
+        }
+        for q in PERCENTILES:
+            snap[f"p{int(q * 100)}"] = histogram_quantile(snap, q)
+        return snap
+
+
+def histogram_quantile(snap, q):
+    """由累積 bucket 內插估計分位數（結果限制在實際 min / max 之間）"""
+    count = snap["count"]
+    if not count:
+        return None
+    rank = q * count
+    lower, prev = 0.0, 0
+    for bound, cumulative in snap["buckets"]:
+        if cumulative >= rank:
+            upper = snap["max"] if bound == "+Inf" else bound
+            in_bucket = cumulative - prev
+            value = lower + (upper - lower) * ((rank - prev) / in_bucket if in_bucket else 0)
+            return min(max(value, snap["min"]), snap["max"])
+        lower, prev = bound, cumulative
+    return snap["max"]
+
+
+class ProviderMetrics:
+    """單一 provider 的指標"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.queue_wait = Histogram()
+        self.exec = Histogram()
+        self.counters = {
+            "requests": 0,
+            "throttled": 0,
+            "errors": 0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0
+        }
+
+    def observe_call(self, wait, elapsed, throttled=False, error=False):
+        with self.lock:
+            self.queue_wait.observe(wait)
+            self.exec.observe(elapsed)
+            self.counters["requests"] += 1
+            if throttled:
+                self.counters["throttled"] += 1
+            elif error:
+                self.counters["errors"] += 1
+
+    def add_usage(self, prompt_tokens=0, output_tokens=0, total_tokens=0):
+        with self.lock:
+            self.counters["prompt_tokens"] += prompt_tokens or 0
+            self.counters["output_tokens"] += output_tokens or 0
+            self.counters["total_tokens"] += total_tokens or (prompt_tokens or 0) + (output_tokens or 0)
+
+    def snapshot(self):
+        with self.lock:
+            snap = dict(self.counters)
+            snap["queue_wait"] = self.queue_wait.snapshot()
+            snap["exec"] = self.exec.snapshot()
+        snap["throttle_rate"] = snap["throttled"] / snap["requests"] if snap["requests"] else 0.0
+        return snap
+
+
+class MetricsRegistry:
+    """各 provider 的 ProviderMetrics"""
+
+    def __init__(self, providers=("serp", "gemini")):
+        self.providers = {name: ProviderMetrics(name) for name in providers}
+        self.started = time.time()
+
+    def __getitem__(self, name):
+        return self.providers[name]
+
+    def snapshot(self):
+        return {
+            "started": self.started,
+            "providers": {name: m.snapshot() for name, m in self.providers.items()}
+        }
+
+
+# =================================================
+# Token 用量（Gemini usage_metadata）
+# =================================================
+@contextmanager
+def usage_scope(provider_metrics):
+    """在此範圍內（同一 thread）的 record_usage 都記到 provider_metrics"""
+    previous = getattr(_active, "sink", None)
+    _active.sink = provider_metrics
+    try:
+        yield
+    finally:
+        _active.sink = previous
+
+
+def record_usage(response):
+    """讀取 Gemini 回應的 usage_metadata（不在 usage_scope 內時忽略）"""
+    sink = getattr(_active, "sink", None)
+    usage = getattr(response, "usage_metadata", None)
+    if sink is None or usage is None:
+        return
+    sink.add_usage(
+        prompt_tokens=getattr(usage, "prompt_token_count", 0),
+        output_tokens=getattr(usage, "candidates_token_count", 0),
+        total_tokens=getattr(usage, "total_token_count", 0)
+    )
+
+
+# =================================================
+# 匯出
+# =================================================
+def limiter_bound(provider_snapshot):
+    """等待時間中位數大於執行時間中位數時，瓶頸在本地限速而非 provider"""
+    wait = provider_snapshot["queue_wait"].get("p50") or 0
+    elapsed = provider_snapshot["exec"].get("p50") or 0
+    return wait > elapsed
+
+
+def to_json(snapshot):
+    return json.dumps(snapshot, ensure_ascii=False, indent=2)
+
+
+def to_prometheus(snapshot, prefix="serp_radar"):
+    """Prometheus text exposition format"""
+    lines = []
+
+    for metric, help_text in [
+        ("queue_wait_seconds", "Time from submission until the provider call starts"),
+        ("exec_seconds", "Provider call duration"),
+    ]:
+        name = f"{prefix}_{metric}"
+        key = "queue_wait" if metric.startswith("queue_wait") else "exec"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for provider, snap in snapshot["providers"].items():
+            hist = snap[key]
+            for bound, cumulative in hist["buckets"]:
+                lines.append(f'{name}_bucket{{provider="{provider}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{provider="{provider}"}} {hist["sum"]}')
+            lines.append(f'{name}_count{{provider="{provider}"}} {hist["count"]}')
+
+    for counter, help_text in [
+        ("requests", "Provider call attempts"),
+        ("throttled", "Attempts rejected with a rate-limit error (429)"),
+        ("errors", "Attempts that failed with other errors"),
+        ("prompt_tokens", "Prompt tokens reported by usage_metadata"),
+        ("output_tokens", "Output tokens reported by usage_metadata"),
+        ("total_tokens", "Total tokens reported by usage_metadata"),
+    ]:
+        name = f"{prefix}_{counter}_total"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for provider, snap in snapshot["providers"].items():
+            lines.append(f'{name}{{provider="{provider}"}} {snap[counter]}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,133 @@
+"""
+競品頁面抓取（SERP 前 N 名）
+
+- 去重：同一次執行中多個關鍵字共用的排名網址只抓一次（抓取中的網址共用同一個 Future）
+- 連線：共用 clients 的 keep-alive session，另以每個 host 的 semaphore 限制同時連線數，
+  避免同一個網站（例如論壇）同時被大量請求
+- HTTP 快取：磁碟保存擷取後的純文字與 ETag / Last-Modified，
+  fresh_seconds 內直接使用，過期後以 If-None-Match / If-Modified-Since 重新驗證（304 時沿用）
+- 內容擷取與 fetch_webpage_content 相同（core.extract_webpage_text，下載有位元組上限），
+  只保留 prompt 用得到的前 max_chars 字（預設 COMPETITOR_PAGE_CHARS），
+  整次執行都留在 futures 裡的內容不會隨關鍵字數量無限制成長
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from cache import make_cache_key
+from clients import http_get
+from core import COMPETITOR_PAGE_CHARS, extract_webpage_text
+from html_extract import MAX_DOWNLOAD_BYTES
+
+PAGE_FETCH_TIMEOUT = 15
+
+
+class PageFetcher:
+    """以執行緒池抓取頁面，跨關鍵字去重並限制每個 host 的並發數"""
+
+    def __init__(self, cache=None, max_workers=8, per_host=2, fresh_seconds=3600,
+                 timeout=PAGE_FETCH_TIMEOUT, max_chars=COMPETITOR_PAGE_CHARS, clock=time.time):
+        self.cache = cache
+        self.max_chars = max_chars
+        self.per_host = max(1, per_host)
+        self.fresh_seconds = fresh_seconds
+        self.timeout = timeout
+        self.clock = clock
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="page-fetch")
+        self.lock = threading.Lock()
+        self.host_slots = {}
+        self.futures = {}
+
+        # 統計用
+        self.stats = {
+            "requested": 0,
+            "deduplicated": 0,
+            "cache_fresh": 0,
+            "not_modified": 0,
+            "downloaded": 0,
+            "errors": 0
+        }
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self.lock:
+            slot = self.host_slots.get(host)
+            if slot is None:
+                slot = threading.Semaphore(self.per_host)
+                self.host_slots[host] = slot
+            return slot
+
+    def _trim(self, entry):
+        """只保留前 max_chars 字（舊版快取可能存有完整擷取結果）"""
+        text = entry.get("text")
+        if text and len(text) > self.max_chars:
+            entry = dict(entry, text=text[:self.max_chars])
+        return entry
+
+    def _fetch(self, url):
+        """回傳 {"url", "text", "error", "etag", "last_modified", "checked"}"""
+        cache_key = make_cache_key("page", url)
+        cached = self.cache.get(cache_key) if self.cache is not None else None
+        now = self.clock()
+        if cached is not None and now - cached.get("checked", 0) < self.fresh_seconds:
+            self._count("cache_fresh")
+            return self._trim(cached)
+
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with self._host_slot(url):
+                response = http_get(url, headers=headers or None, timeout=self.timeout,
+                                    max_bytes=MAX_DOWNLOAD_BYTES)
+            if response.status_code == 304 and cached is not None:
+                self._count("not_modified")
+                entry = self._trim(dict(cached, checked=now))
+            else:
+                response.raise_for_status()
+                self._count("downloaded")
+                text, error = extract_webpage_text(response)
+                entry = {
+                    "url": url,
+                    "text": text[:self.max_chars] if text else text,
+                    "error": error,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "checked": now
+                }
+        except Exception as e:
+            self._count("errors")
+            return {"url": url, "text": None, "error": f"網頁抓取失敗：{str(e)}"}
+
+        if self.cache is not None and entry.get("text"):
+            self.cache.set(cache_key, entry)
+        return entry
+
+    def submit(self, url):
+        """排入抓取（同一網址只抓一次），回傳 Future"""
+        with self.lock:
+            self.stats["requested"] += 1
+            future = self.futures.get(url)
+            if future is not None:
+                self.stats["deduplicated"] += 1
+                return future
+            future = self.pool.submit(self._fetch, url)
+            self.futures[url] = future
+            return future
+
+    def fetch_many(self, urls):
+        """抓取多個網址，回傳 {url: entry}（依輸入順序）"""
+        futures = [(url, self.submit(url)) for url in dict.fromkeys(urls)]
+        return {url: future.result() for url, future in futures}
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
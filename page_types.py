@@ -0,0 +1,172 @@
+"""
+SERP 頁面類型規則引擎
+
+規則由 JSON 設定檔載入（預設 page_types.json，可用環境變數 SERP_RADAR_PAGE_TYPES 指定），
+rules 的排列順序即優先順序（越前面越優先），新增類型只需修改設定檔：
+- hosts：網域後綴，編譯成 hash index，以 host 的各層後綴查表（www.ptt.cc → ptt.cc → cc）
+- url_patterns / title_patterns：正規表示式，所有規則合併成單一 regex，
+  各規則是依優先順序排列的 lookahead 分支，第一個成立的分支即為最高優先的規則
+整欄分類（classify_frame / classify_many）以 pandas 向量化字串運算一次處理，
+相同 host 只查一次表。
+"""
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+PAGE_TYPES_PATH = os.environ.get(
+    "SERP_RADAR_PAGE_TYPES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "page_types.json")
+)
+
+# scheme://[userinfo@]host
+HOST_RE = r"^[a-z][a-z0-9+.\-]*://(?:[^/@?#]*@)?([^/:?#]+)"
+_HOST_PATTERN = re.compile(HOST_RE)
+
+_lock = threading.Lock()
+_compiled = {}
+
+
+def _group_name(priority):
+    return f"_rule{priority}"
+
+
+class PageTypeRules:
+    """已編譯的頁面類型規則"""
+
+    def __init__(self, rules, default="General"):
+        self.default = default
+        self.types = []
+        self.host_index = {}
+        self.pattern_priorities = []
+        branches = []
+
+        for priority, rule in enumerate(rules):
+            type_name = rule.get("type")
+            if not type_name:
+                raise ValueError(f"第 {priority + 1} 條規則缺少 type")
+            self.types.append(type_name)
+
+            for host in rule.get("hosts", []):
+                # 同一網域出現在多條規則時以優先者為準
+                self.host_index.setdefault(host.lower().strip("."), priority)
+
+            # 比對對象為 "url\ntitle"：URL 分支只看第一行，標題分支只看第二行
+            alternatives = []
+            url_patterns = self._check_patterns(type_name, rule.get("url_patterns", []))
+            title_patterns = self._check_patterns(type_name, rule.get("title_patterns", []))
+            if url_patterns:
+                alternatives.append(r"(?=[^\n]*?(?:%s))" % "|".join(url_patterns))
+            if title_patterns:
+                alternatives.append(r"(?=[^\n]*\n[^\n]*?(?:%s))" % "|".join(title_patterns))
+            if alternatives:
+                branches.append(f"(?:{'|'.join(alternatives)})(?P<{_group_name(priority)}>)")
+                self.pattern_priorities.append(priority)
+
+        self.pattern = re.compile("^(?:%s)" % "|".join(branches)) if branches else None
+        self._labels = np.array(self.types + [self.default], dtype=object)
+
+    @staticmethod
+    def _check_patterns(type_name, patterns):
+        compiled = []
+        for p in patterns:
+            try:
+                re.compile(p)
+            except re.error as e:
+                raise ValueError(f"規則「{type_name}」的 pattern 無效：{p!r}（{e}）") from e
+            compiled.append(f"(?:{p})")
+        return compiled
+
+    # -------------------------------------------------
+    # 單筆
+    # -------------------------------------------------
+    def host_priority(self, host):
+        """host 各層後綴在 index 中的最高優先權，沒有則回傳 None"""
+        best = None
+        labels = host.split(".")
+        for i in range(len(labels)):
+            priority = self.host_index.get(".".join(labels[i:]))
+            if priority is not None and (best is None or priority < best):
+                best = priority
+        return best
+
+    def pattern_priority(self, url, title):
+        if self.pattern is None:
+            return None
+        match = self.pattern.match(f"{url}\n{title}")
+        if match is None:
+            return None
+        return int(match.lastgroup[len("_rule"):])
+
+    def classify(self, url, title=""):
+        url = (url or "").lower().replace("\n", " ")
+        title = (title or "").lower().replace("\n", " ")
+        host_match = _HOST_PATTERN.match(url)
+        candidates = [
+            self.host_priority(host_match.group(1)) if host_match else None,
+            self.pattern_priority(url, title)
+        ]
+        candidates = [p for p in candidates if p is not None]
+        return self.types[min(candidates)] if candidates else self.default
+
+    # -------------------------------------------------
+    # 向量化
+    # -------------------------------------------------
+    def classify_series(self, urls, titles):
+        """對整欄 URL / 標題分類，回傳與 urls 同 index 的 Series"""
+        urls = urls.fillna("").astype(str).str.lower().str.replace("\n", " ", regex=False)
+        titles = pd.Series(titles.to_numpy(), index=urls.index)
+        titles = titles.fillna("").astype(str).str.lower().str.replace("\n", " ", regex=False)
+
+        # 網域：每個不同的 host 只查一次
+        hosts = urls.str.extract(HOST_RE, expand=False).fillna("")
+        lookup = {host: self.host_priority(host) for host in hosts.unique()}
+        host_rank = hosts.map(lookup).astype(float).to_numpy()
+
+        # URL / 標題 pattern：單一 regex，命中的規則對應唯一非空的 named group
+        pattern_rank = np.full(len(urls), np.nan)
+        if self.pattern is not None and len(urls):
+            groups = (urls + "\n" + titles).str.extract(self.pattern)
+            hits = groups[[_group_name(p) for p in self.pattern_priorities]].notna().to_numpy()
+            matched = hits.any(axis=1)
+            priorities = np.array(self.pattern_priorities, dtype=float)
+            pattern_rank[matched] = priorities[hits[matched].argmax(axis=1)]
+
+        rank = np.fmin(host_rank, pattern_rank)
+        index = np.where(np.isnan(rank), len(self.types), rank).astype(int)
+        return pd.Series(self._labels[index], index=urls.index)
+
+    def classify_frame(self, df, url_col="URL", title_col="Title"):
+        return self.classify_series(df[url_col], df[title_col])
+
+    def classify_many(self, urls, titles):
+        """list 版本（SERP 原始資料建構時使用）"""
+        if not urls:
+            return []
+        return self.classify_series(pd.Series(list(urls), dtype=object), pd.Series(list(titles), dtype=object)).tolist()
+
+
+def load_page_type_rules(path=PAGE_TYPES_PATH):
+    """讀取設定檔並編譯規則"""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    return PageTypeRules(config.get("rules", []), config.get("default", "General"))
+
+
+def get_page_type_rules(path=PAGE_TYPES_PATH):
+    """取得已編譯的規則（依設定檔路徑快取）"""
+    with _lock:
+        rules = _compiled.get(path)
+        if rules is None:
+            rules = load_page_type_rules(path)
+            _compiled[path] = rules
+        return rules
+
+
+def reset_page_type_rules():
+    """清除已編譯的規則（修改設定檔後重新載入）"""
+    with _lock:
+        _compiled.clear()
@@ -0,0 +1,244 @@
+"""
+分段管線（SERP 抓取 → 策略分析）
+
+兩個階段各自有獨立的 worker，中間以有界佇列銜接：
+- SERP 階段只受 SERP 限制，不會因等待 Gemini 名額而閒置
+- 佇列滿時 SERP 階段自然暫停（backpressure），避免無限制地堆積結果
+- 主 thread 透過 run() 逐筆取得完成的結果，方便更新 UI
+"""
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class StagedPipeline:
+    """兩段式管線：fetch_fn(item) → state，analyze_fn(state) → result"""
+
+    def __init__(self, fetch_fn, analyze_fn, fetch_workers, analyze_workers, queue_size=10,
+                 needs_analysis=None, error_result=None, analyze_batch_fn=None,
+                 batch_cost=None, batch_budget=None, max_batch=1, batch_wait=0.5,
+                 on_result=None, clock=time.monotonic):
+        self.fetch_fn = fetch_fn
+        self.analyze_fn = analyze_fn
+        self.fetch_workers = max(1, fetch_workers)
+        self.analyze_workers = max(1, analyze_workers)
+        self.queue_size = max(1, queue_size)
+        self.needs_analysis = needs_analysis or (lambda state: not state.get("error"))
+        self.error_result = error_result or (lambda item, e: {"item": item, "error": str(e)})
+        # 批次模式：analyze_batch_fn(states) → results，依 batch_cost 的總和不超過 batch_budget
+        self.analyze_batch_fn = analyze_batch_fn
+        self.batch_cost = batch_cost or (lambda state: 0)
+        self.batch_budget = batch_budget if batch_budget is not None else float("inf")
+        self.max_batch = max(1, max_batch)
+        self.batch_wait = batch_wait
+        # 在 worker thread 內對每筆最終結果呼叫（例如寫入 checkpoint），即使呼叫端已中斷也會執行
+        self.on_result = on_result
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        # 統計用
+        self.stats = {
+            "fetch_busy": 0.0,
+            "analyze_busy": 0.0,
+            "fetch_done": 0,
+            "analyze_done": 0,
+            "analyze_batches": 0,
+            "queue_max": 0,
+            "queue_area": 0.0,
+            "queue_depth": 0,
+            "wall_time": 0.0
+        }
+        self._depth_updated = None
+        self._started = None
+
+    # -------------------------------------------------
+    # 佇列深度（時間加權）
+    # -------------------------------------------------
+    def _record_depth(self, depth):
+        with self.lock:
+            now = self.clock()
+            self.stats["queue_area"] += self.stats["queue_depth"] * (now - self._depth_updated)
+            self._depth_updated = now
+            self.stats["queue_depth"] = depth
+            self.stats["queue_max"] = max(self.stats["queue_max"], depth)
+
+    def _emit(self, results, result):
+        if self.on_result is not None:
+            try:
+                self.on_result(result)
+            except Exception:
+                pass
+        results.put(result)
+
+    def _add_busy(self, key, seconds, done_key):
+        with self.lock:
+            self.stats[key] += seconds
+            self.stats[done_key] += 1
+
+    def _entry_cost(self, entry, results):
+        """
+        batch_cost 出錯時直接送出該筆的 error_result 並回傳 None，
+        避免例外結束 analyze worker（run() 會一直等不到結果）
+        """
+        item, state = entry
+        try:
+            return self.batch_cost(state)
+        except Exception as e:
+            with self.lock:
+                self.stats["analyze_done"] += 1
+            self._emit(results, self.error_result(item, e))
+            return None
+
+    # -------------------------------------------------
+    # Workers
+    # -------------------------------------------------
+    def _fetch_worker(self, inbox, handoff, results):
+        while True:
+            try:
+                item = inbox.get_nowait()
+            except queue.Empty:
+                return
+
+            start = self.clock()
+            try:
+                state = self.fetch_fn(item)
+            except Exception as e:
+                state = self.error_result(item, e)
+            self._add_busy("fetch_busy", self.clock() - start, "fetch_done")
+
+            if self.needs_analysis(state):
+                # 佇列滿時在此等待（backpressure）
+                handoff.put((item, state))
+                self._record_depth(handoff.qsize())
+            else:
+                self._emit(results, state)
+
+    def _analyze_worker(self, handoff, results):
+        carry = None
+        stopping = False
+        while not stopping:
+            entry = carry if carry is not None else handoff.get()
+            carry = None
+            if entry is _STOP:
+                return
+
+            # 批次模式：在 token 預算與批次上限內盡量多取幾筆
+            batch = [entry]
+            if self.analyze_batch_fn is not None:
+                cost = self._entry_cost(entry, results)
+                if cost is None:
+                    continue
+                while len(batch) < self.max_batch:
+                    try:
+                        nxt = handoff.get(timeout=self.batch_wait)
+                    except queue.Empty:
+                        break
+                    if nxt is _STOP:
+                        stopping = True
+                        break
+                    next_cost = self._entry_cost(nxt, results)
+                    if next_cost is None:
+                        continue
+                    if cost + next_cost > self.batch_budget:
+                        carry = nxt
+                        break
+                    batch.append(nxt)
+                    cost += next_cost
+            self._record_depth(handoff.qsize())
+
+            start = self.clock()
+            if len(batch) == 1 or self.analyze_batch_fn is None:
+                outputs = []
+                for item, state in batch:
+                    try:
+                        outputs.append(self.analyze_fn(state))
+                    except Exception as e:
+                        outputs.append(self.error_result(item, e))
+            else:
+                try:
+                    outputs = self.analyze_batch_fn([state for _, state in batch])
+                except Exception as e:
+                    outputs = [self.error_result(item, e) for item, _ in batch]
+            elapsed = self.clock() - start
+
+            with self.lock:
+                self.stats["analyze_busy"] += elapsed
+                self.stats["analyze_done"] += len(outputs)
+                self.stats["analyze_batches"] += 1
+            for result in outputs:
+                self._emit(results, result)
+
+    # -------------------------------------------------
+    # 執行
+    # -------------------------------------------------
+    def run(self, items, on_idle=None, idle_interval=0.2):
+        """
+        啟動管線，依完成順序逐筆 yield 結果（在呼叫端 thread 執行）。
+        on_idle：等待結果期間每 idle_interval 秒在呼叫端 thread 呼叫一次（例如更新串流中的 UI）
+        """
+        items = list(items)
+        inbox = queue.Queue()
+        for item in items:
+            inbox.put(item)
+        handoff = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue()
+
+        self._started = self.clock()
+        self._depth_updated = self._started
+
+        fetchers = [
+            threading.Thread(target=self._fetch_worker, args=(inbox, handoff, results), daemon=True)
+            for _ in range(self.fetch_workers)
+        ]
+        analyzers = [
+            threading.Thread(target=self._analyze_worker, args=(handoff, results), daemon=True)
+            for _ in range(self.analyze_workers)
+        ]
+        for t in fetchers + analyzers:
+            t.start()
+
+        def close_handoff():
+            for t in fetchers:
+                t.join()
+            for _ in analyzers:
+                handoff.put(_STOP)
+
+        closer = threading.Thread(target=close_handoff, daemon=True)
+        closer.start()
+
+        try:
+            for _ in range(len(items)):
+                while True:
+                    try:
+                        result = results.get(timeout=idle_interval if on_idle else None)
+                        break
+                    except queue.Empty:
+                        on_idle()
+                yield result
+        finally:
+            closer.join()
+            for t in analyzers:
+                t.join()
+            self._record_depth(handoff.qsize())
+            with self.lock:
+                self.stats["wall_time"] = self.clock() - self._started
+
+    def summary(self):
+        """整理統計：平均/最大佇列深度與各階段使用率"""
+        with self.lock:
+            stats = dict(self.stats)
+        wall = stats["wall_time"] or (self.clock() - self._started if self._started else 0)
+        if not wall:
+            wall = 1e-9
+        return {
+            "queue_max": stats["queue_max"],
+            "queue_avg": stats["queue_area"] / wall,
+            "fetch_utilization": stats["fetch_busy"] / (self.fetch_workers * wall),
+            "analyze_utilization": stats["analyze_busy"] / (self.analyze_workers * wall),
+            "fetch_done": stats["fetch_done"],
+            "analyze_done": stats["analyze_done"],
+            "analyze_batches": stats["analyze_batches"],
+            "wall_time": wall
+        }
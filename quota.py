@@ -0,0 +1,218 @@
+"""
+跨 session / 跨 process 共用的 API 額度
+
+RateLimitedExecutor 每次執行都會重新建立，多位使用者同時在同一台 Streamlit 伺服器
+（甚至多個 server process、CLI）執行第二階段時，各自的限速互不知情，實際請求數會倍增。
+QuotaManager 以本地 SQLite（BEGIN IMMEDIATE 作為跨 process 的鎖）記錄每次請求，
+依 (API Key, provider) 共同執行：
+- RPM：最近 60 秒的請求數
+- 每日預算：當天（本地日期）的請求數，用完時拋出 QuotaExceeded
+- 公平分配：同時等待的 session 中，最近 60 秒取得最少額度者優先（同數時先到先得），
+  新加入的 session 不會被已在跑大量關鍵字的 session 擠到最後
+API Key 只以雜湊值保存。
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from cache import CACHE_DIR
+
+DEFAULT_QUOTA_PATH = os.path.join(CACHE_DIR, "quota.sqlite")
+WINDOW_SECONDS = 60.0
+# 等待者超過此秒數沒有更新即視為已離開（session 關閉、process 結束）
+STALE_WAITER_SECONDS = 30.0
+
+
+class QuotaExceeded(Exception):
+    """當日預算已用完（不應重試）"""
+
+
+def _key_id(api_key):
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class QuotaManager:
+    """以 SQLite 共用的請求紀錄與等待佇列"""
+
+    def __init__(self, path=DEFAULT_QUOTA_PATH, poll_interval=0.05,
+                 clock=time.time, sleep=time.sleep):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 自行控制交易（BEGIN IMMEDIATE 同時鎖住其他 process）
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS grants (
+                    key TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    session TEXT NOT NULL,
+                    ts REAL NOT NULL,
+                    day TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_grants_ts ON grants(key, provider, ts)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_grants_day ON grants(key, provider, day)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS waiters (
+                    ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    session TEXT NOT NULL,
+                    heartbeat REAL NOT NULL
+                )
+            """)
+            self.conn.execute("DELETE FROM grants WHERE ts < ?", (self.clock() - 2 * 86400,))
+
+    def _day(self, now):
+        return time.strftime("%Y-%m-%d", time.localtime(now))
+
+    def _transaction(self, work):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def _session_order(self, conn, key, provider, now):
+        """等待中的 session 依 (最近 60 秒已取得數, 最早排隊序號) 排序"""
+        rows = conn.execute("""
+            SELECT w.session, MIN(w.ticket),
+                   (SELECT COUNT(*) FROM grants g
+                    WHERE g.key = w.key AND g.provider = w.provider AND g.session = w.session AND g.ts > ?)
+            FROM waiters w
+            WHERE w.key = ? AND w.provider = ? AND w.heartbeat > ?
+            GROUP BY w.session
+        """, (now - WINDOW_SECONDS, key, provider, now - STALE_WAITER_SECONDS)).fetchall()
+        rows.sort(key=lambda row: (row[2], row[1]))
+        return rows
+
+    def _try_grant(self, key, provider, session, ticket, rpm, daily_budget):
+        """取得額度時回傳 None，否則回傳建議的等待秒數"""
+        def work(conn):
+            now = self.clock()
+            conn.execute("DELETE FROM waiters WHERE heartbeat < ?", (now - STALE_WAITER_SECONDS,))
+            conn.execute("UPDATE waiters SET heartbeat = ? WHERE ticket = ?", (now, ticket))
+
+            if daily_budget:
+                used = conn.execute(
+                    "SELECT COUNT(*) FROM grants WHERE key = ? AND provider = ? AND day = ?",
+                    (key, provider, self._day(now))
+                ).fetchone()[0]
+                if used >= daily_budget:
+                    raise QuotaExceeded(f"{provider} 今日預算已用完（{used}/{daily_budget}）")
+
+            count, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(ts) FROM grants WHERE key = ? AND provider = ? AND ts > ?",
+                (key, provider, now - WINDOW_SECONDS)
+            ).fetchone()
+            if count >= rpm:
+                return max(self.poll_interval, oldest + WINDOW_SECONDS - now)
+
+            order = self._session_order(conn, key, provider, now)
+            if order and (order[0][0] != session or order[0][1] != ticket):
+                return self.poll_interval
+
+            conn.execute(
+                "INSERT INTO grants (key, provider, session, ts, day) VALUES (?, ?, ?, ?, ?)",
+                (key, provider, session, now, self._day(now))
+            )
+            return None
+
+        return self._transaction(work)
+
+    def acquire(self, api_key, provider, session, rpm, daily_budget=None):
+        """排隊等待共用額度，回傳等待秒數；當日預算用完時拋出 QuotaExceeded"""
+        key = _key_id(api_key)
+        start = self.clock()
+        ticket = self._transaction(lambda conn: conn.execute(
+            "INSERT INTO waiters (key, provider, session, heartbeat) VALUES (?, ?, ?, ?)",
+            (key, provider, session, start)
+        ).lastrowid)
+        try:
+            while True:
+                wait = self._try_grant(key, provider, session, ticket, rpm, daily_budget)
+                if wait is None:
+                    return self.clock() - start
+                # 至少每秒更新一次 heartbeat
+                self.sleep(min(wait, 1.0))
+        finally:
+            self._transaction(lambda conn: conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,)))
+
+    def session_stats(self, api_key, provider, session, daily_budget=None):
+        """此 session 在最近 60 秒的額度占比、排隊順位（0 表示未在等待）與當日用量"""
+        key = _key_id(api_key)
+
+        def work(conn):
+            now = self.clock()
+            rows = conn.execute("""
+                SELECT session, COUNT(*) FROM grants
+                WHERE key = ? AND provider = ? AND ts > ?
+                GROUP BY session
+            """, (key, provider, now - WINDOW_SECONDS)).fetchall()
+            per_session = dict(rows)
+            total = sum(per_session.values())
+            order = [row[0] for row in self._session_order(conn, key, provider, now)]
+            daily_used = conn.execute(
+                "SELECT COUNT(*) FROM grants WHERE key = ? AND provider = ? AND day = ?",
+                (key, provider, self._day(now))
+            ).fetchone()[0]
+            return {
+                "window_requests": total,
+                "session_requests": per_session.get(session, 0),
+                "share": per_session.get(session, 0) / total if total else 0.0,
+                "queue_position": order.index(session) + 1 if session in order else 0,
+                "waiting_sessions": len(order),
+                "active_sessions": len(set(per_session) | set(order)),
+                "daily_used": daily_used,
+                "daily_budget": daily_budget or 0
+            }
+
+        return self._transaction(work)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class SharedQuota:
+    """綁定 (API Key, provider, session) 與限制的額度，供 ProviderLimiter 使用"""
+
+    def __init__(self, manager, api_key, provider, session, rpm, daily_budget=None):
+        self.manager = manager
+        self.api_key = api_key
+        self.provider = provider
+        self.session = session
+        self.rpm = rpm
+        self.daily_budget = daily_budget or None
+
+    def acquire(self):
+        return self.manager.acquire(self.api_key, self.provider, self.session, self.rpm, self.daily_budget)
+
+    def stats(self):
+        return self.manager.session_stats(self.api_key, self.provider, self.session, self.daily_budget)
+
+
+_lock = threading.Lock()
+_managers = {}
+
+
+def get_quota_manager(path=DEFAULT_QUOTA_PATH):
+    """取得共用的 QuotaManager（同一 process 內依路徑重複使用）"""
+    with _lock:
+        manager = _managers.get(path)
+        if manager is None:
+            manager = QuotaManager(path)
+            _managers[path] = manager
+        return manager
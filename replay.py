@@ -0,0 +1,160 @@
+"""
+外部呼叫錄製 / 重播
+
+所有對外呼叫（CSE、Suggest、網頁抓取、Gemini）都經過 clients 的同一組入口，
+入口再透過 through_tape() 依模式處理：
+- off：直接呼叫
+- record：呼叫後把請求與回應（含錯誤）寫入 archive
+- replay：只從 archive 讀回，完全不連網；找不到紀錄時拋出 ReplayMiss
+
+archive 為 SQLite，回應以 zlib 壓縮的 JSON 保存。同一個請求可能出現多次（例如 429 後重試），
+依發生順序保存成序列，重播時依序回放，最後一筆重複使用，因此重試行為也能重現。
+請求內容不含 API Key。
+
+模式可用環境變數 SERP_RADAR_REPLAY（off / record / replay）與 SERP_RADAR_REPLAY_ARCHIVE 設定，
+或在程式中呼叫 configure_replay()（cli.py 的 --record / --replay）。模式為整個 process 共用，
+因此 Streamlit 介面只顯示目前模式，不提供切換（多個 session 同時切換會互相干擾）。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from cache import CACHE_DIR, make_cache_key
+
+MODES = ("off", "record", "replay")
+DEFAULT_ARCHIVE = os.path.join(CACHE_DIR, "replay.sqlite")
+
+
+class ReplayMiss(LookupError):
+    """重播模式下找不到對應的錄製紀錄"""
+
+
+class ReplayedError(Exception):
+    """重播錄製時發生的錯誤（訊息與原本相同，429 仍會被判定為速率限制）"""
+
+
+class Tape:
+    """錄製檔：(key, seq) → 壓縮後的回應"""
+
+    def __init__(self, path, reset=False):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS tape (
+                    key TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    recorded REAL NOT NULL,
+                    PRIMARY KEY (key, seq)
+                )
+            """)
+            if reset:
+                self.conn.execute("DELETE FROM tape")
+            self.conn.commit()
+        self._next_seq = {}
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    def append(self, key, kind, request, outcome):
+        blob = zlib.compress(json.dumps(outcome, ensure_ascii=False).encode("utf-8"))
+        with self.lock:
+            seq = self._next_seq.get(key)
+            if seq is None:
+                row = self.conn.execute("SELECT MAX(seq) FROM tape WHERE key = ?", (key,)).fetchone()
+                seq = (row[0] + 1) if row[0] is not None else 0
+            self.conn.execute(
+                "INSERT INTO tape (key, seq, kind, request, payload, recorded) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, seq, kind, json.dumps(request, ensure_ascii=False, default=str)[:2000], blob, time.time())
+            )
+            self.conn.commit()
+            self._next_seq[key] = seq + 1
+            self.stats["recorded"] += 1
+
+    def next(self, key):
+        """依序取出下一筆；序列用完後重複最後一筆，沒有任何紀錄時回傳 None"""
+        with self.lock:
+            seq = self._next_seq.get(key, 0)
+            row = self.conn.execute(
+                "SELECT payload, seq FROM tape WHERE key = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+                (key, seq)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._next_seq[key] = seq + 1
+            self.stats["replayed"] += 1
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def summary(self):
+        """各類型的錄製筆數"""
+        with self.lock:
+            rows = self.conn.execute("SELECT kind, COUNT(*) FROM tape GROUP BY kind").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_lock = threading.Lock()
+_state = {"mode": "off", "tape": None}
+
+
+def configure_replay(mode, path=DEFAULT_ARCHIVE):
+    """切換錄製 / 重播模式（off 時關閉 archive；record 會清空既有的 archive 重新錄製）"""
+    if mode not in MODES:
+        raise ValueError(f"未知的模式：{mode}（可用：{', '.join(MODES)}）")
+    with _lock:
+        if _state["tape"] is not None:
+            _state["tape"].close()
+        _state["tape"] = Tape(path, reset=(mode == "record")) if mode != "off" else None
+        _state["mode"] = mode
+
+
+def replay_mode():
+    return _state["mode"]
+
+
+def current_tape():
+    return _state["tape"]
+
+
+def through_tape(kind, request, live, encode, decode):
+    """
+    依目前模式執行 live()：
+    - encode(response) → 可 JSON 序列化的 dict；decode(dict) → 呼叫端預期的回應物件
+    - live() 拋出的例外在錄製時一併保存，重播時以 ReplayedError 拋出
+    """
+    mode, tape = _state["mode"], _state["tape"]
+    if mode == "off" or tape is None:
+        return live()
+
+    key = make_cache_key("replay", kind, request)
+    if mode == "replay":
+        outcome = tape.next(key)
+        if outcome is None:
+            raise ReplayMiss(f"沒有 {kind} 的錄製紀錄：{json.dumps(request, ensure_ascii=False, default=str)[:200]}")
+        if "error" in outcome:
+            raise ReplayedError(outcome["error"])
+        return decode(outcome["response"])
+
+    try:
+        response = live()
+    except Exception as e:
+        tape.append(key, kind, request, {"error": str(e), "type": type(e).__name__})
+        raise
+    tape.append(key, kind, request, {"response": encode(response)})
+    return response
+
+
+_env_mode = os.environ.get("SERP_RADAR_REPLAY", "off")
+if _env_mode != "off":
+    configure_replay(_env_mode, os.environ.get("SERP_RADAR_REPLAY_ARCHIVE", DEFAULT_ARCHIVE))
@@ -0,0 +1,314 @@
+"""
+報告輸出（Excel / JSON / NDJSON / Parquet）
+
+app.py 與 cli.py 共用的報告建構函式。
+大量關鍵字時使用 StreamingExport：每個關鍵字完成即逐列寫出，不需先組成整張 DataFrame。
+"""
+import io
+import json
+import os
+
+import pandas as pd
+import xlsxwriter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+SERP_COLUMNS = ["Keyword", "Rank", "Type", "Title", "Description", "DisplayLink", "URL"]
+STRATEGY_COLUMNS = [
+    "Keyword", "User_Intent", "Battlefield_Status", "Opportunity_Gap",
+    "Recommended_Page_Type", "Winning_Angles", "Killer_Titles", "Raw_JSON"
+]
+CONTENT_DIRECTION_COLUMNS = [
+    "Content_Theme", "Target_Audience", "Differentiation_Angle", "Content_Format",
+    "Must_Cover_Topics", "Avoid_Pitfalls", "Content_Structure"
+]
+# Parquet：每列 SERP 結果附上該關鍵字的策略摘要，方便直接做分析
+PARQUET_STRATEGY_COLUMNS = ["User_Intent", "Battlefield_Status", "Opportunity_Gap", "Recommended_Page_Type"]
+EXPORT_FORMATS = ("xlsx", "ndjson", "parquet")
+
+
+def collect_reports(keywords, all_results):
+    """依關鍵字順序整理成功的策略與 SERP 原始資料，回傳 (reports, serp_frames)"""
+    reports = []
+    serp_frames = []
+
+    for kw in keywords:
+        r = all_results.get(kw)
+        if not r or r.get("error"):
+            continue
+
+        df = r.get("serp_df")
+        if df is not None and not df.empty:
+            serp_frames.append(serp_frame(kw, df))
+
+        strategy = r.get("strategy")
+        if strategy and "error" not in strategy:
+            strategy["Keyword"] = kw
+            reports.append(strategy)
+
+    return reports, serp_frames
+
+
+def serp_frame(kw, df):
+    """SERP 原始資料加上 Keyword 欄"""
+    serp_copy = df.copy()
+    serp_copy.insert(0, "Keyword", kw)
+    return serp_copy
+
+
+def strategy_row(r):
+    """策略工作表的一列"""
+    return {
+        "Keyword": r.get("Keyword", ""),
+        "User_Intent": r.get("User_Intent", ""),
+        "Battlefield_Status": r.get("Battlefield_Status", ""),
+        "Opportunity_Gap": r.get("Opportunity_Gap", ""),
+        "Recommended_Page_Type": r.get("Recommended_Page_Type", ""),
+        "Winning_Angles": "\n".join(
+            [f"- {a.get('angle', '')}（{a.get('target', '')}）"
+             for a in r.get("Winning_Angles", [])]
+        ),
+        "Killer_Titles": "\n".join(
+            [f"- {t.get('title', '')}｜{t.get('reason', '')}"
+             for t in r.get("Killer_Titles", [])]
+        ),
+        "Raw_JSON": json.dumps(r, ensure_ascii=False)
+    }
+
+
+def content_direction_row(content_direction):
+    """內容指引工作表的一列"""
+    return {
+        "Content_Theme": content_direction.get("content_theme", ""),
+        "Target_Audience": content_direction.get("target_audience", ""),
+        "Differentiation_Angle": content_direction.get("differentiation_angle", ""),
+        "Content_Format": content_direction.get("content_format_suggestion", ""),
+        "Must_Cover_Topics": "\n".join(content_direction.get("must_cover_topics", [])),
+        "Avoid_Pitfalls": "\n".join(content_direction.get("avoid_pitfalls", [])),
+        "Content_Structure": json.dumps(content_direction.get("content_structure", []), ensure_ascii=False)
+    }
+
+
+def build_excel_bytes(reports, serp_frames, content_direction=None):
+    """產生完整 Excel 報告（Strategy / SERP_Raw / Content_Direction）"""
+    # 策略工作表
+    df_strategy = pd.DataFrame([strategy_row(r) for r in reports])
+
+    # SERP 原始資料工作表
+    df_serp_all = pd.concat(serp_frames, ignore_index=True) if serp_frames else pd.DataFrame()
+
+    # 內容指引工作表
+    df_content_direction = pd.DataFrame()
+    if content_direction:
+        df_content_direction = pd.DataFrame([content_direction_row(content_direction)])
+
+    # 寫入 Excel
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+        df_strategy.to_excel(writer, sheet_name="Strategy", index=False)
+
+        if not df_serp_all.empty:
+            df_serp_all.to_excel(writer, sheet_name="SERP_Raw", index=False)
+
+        if not df_content_direction.empty:
+            df_content_direction.to_excel(writer, sheet_name="Content_Direction", index=False)
+
+        # 調整欄寬
+        for sheet_name in writer.sheets:
+            worksheet = writer.sheets[sheet_name]
+            worksheet.set_column('A:A', 20)
+            worksheet.set_column('B:H', 40)
+
+    return buffer.getvalue()
+
+
+def build_json_text(reports, content_direction=None):
+    """JSON 備份"""
+    full_json = {
+        "strategies": reports,
+        "content_direction": content_direction
+    }
+    return json.dumps(full_json, ensure_ascii=False, indent=2)
+
+
+# =================================================
+# 串流輸出（逐個關鍵字寫入）
+# =================================================
+def is_reportable(result):
+    """有 SERP 或策略可輸出的結果（與 collect_reports 的條件相同）"""
+    return bool(result) and not result.get("error")
+
+
+def valid_strategy(result):
+    strategy = result.get("strategy")
+    if strategy and "error" not in strategy:
+        return strategy
+    return None
+
+
+def serp_rows(kw, result):
+    """單一關鍵字的 SERP 列（優先使用 serp_raw，避免經過 DataFrame）"""
+    rows = result.get("serp_raw")
+    if rows is None:
+        df = result.get("serp_df")
+        rows = df.to_dict("records") if df is not None else []
+    for row in rows:
+        yield [kw if col == "Keyword" else row.get(col) for col in SERP_COLUMNS]
+
+
+def parquet_available():
+    return pq is not None
+
+
+class ExcelStreamWriter:
+    """xlsxwriter constant_memory 模式：每列寫完即落到暫存檔，記憶體用量與列數無關"""
+
+    def __init__(self, target):
+        self.workbook = xlsxwriter.Workbook(target, {"constant_memory": True})
+        self.strategy_sheet = self._add_sheet("Strategy", STRATEGY_COLUMNS)
+        self.serp_sheet = self._add_sheet("SERP_Raw", SERP_COLUMNS)
+        self.strategy_row = 1
+        self.serp_row = 1
+
+    def _add_sheet(self, name, columns):
+        sheet = self.workbook.add_worksheet(name)
+        sheet.set_column("A:A", 20)
+        sheet.set_column("B:H", 40)
+        sheet.write_row(0, 0, columns)
+        return sheet
+
+    def add(self, kw, result):
+        if not is_reportable(result):
+            return
+        for row in serp_rows(kw, result):
+            self.serp_sheet.write_row(self.serp_row, 0, row)
+            self.serp_row += 1
+
+        strategy = valid_strategy(result)
+        if strategy:
+            strategy["Keyword"] = kw
+            row = strategy_row(strategy)
+            self.strategy_sheet.write_row(self.strategy_row, 0, [row[c] for c in STRATEGY_COLUMNS])
+            self.strategy_row += 1
+
+    def close(self, content_direction=None):
+        if content_direction:
+            sheet = self._add_sheet("Content_Direction", CONTENT_DIRECTION_COLUMNS)
+            row = content_direction_row(content_direction)
+            sheet.write_row(1, 0, [row[c] for c in CONTENT_DIRECTION_COLUMNS])
+        self.workbook.close()
+
+
+class NdjsonStreamWriter:
+    """每個關鍵字一行 JSON（type=keyword），內容指引為最後一行（type=content_direction）"""
+
+    def __init__(self, target):
+        self._owns_file = isinstance(target, (str, os.PathLike))
+        self.file = open(target, "wb") if self._owns_file else target
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+
+    def add(self, kw, result):
+        self._write({
+            "type": "keyword",
+            "keyword": kw,
+            "error": result.get("error"),
+            "strategy": valid_strategy(result),
+            "serp": [dict(zip(SERP_COLUMNS, row)) for row in serp_rows(kw, result)] if is_reportable(result) else []
+        })
+
+    def close(self, content_direction=None):
+        if content_direction:
+            self._write({"type": "content_direction", "content_direction": content_direction})
+        if self._owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+class ParquetStreamWriter:
+    """SERP 列（附策略摘要）以 row group 為單位寫入 Parquet（需要 pyarrow）"""
+
+    def __init__(self, target, row_group_size=10000):
+        if pq is None:
+            raise RuntimeError("輸出 Parquet 需要安裝 pyarrow")
+        fields = [(col, pa.int64() if col == "Rank" else pa.string()) for col in SERP_COLUMNS]
+        fields += [(col, pa.string()) for col in PARQUET_STRATEGY_COLUMNS]
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(target, self.schema)
+        self.row_group_size = row_group_size
+        self._buffer = {name: [] for name in self.schema.names}
+        self._rows = 0
+
+    def add(self, kw, result):
+        if not is_reportable(result):
+            return
+        strategy = valid_strategy(result) or {}
+        summary = [strategy.get(col) for col in PARQUET_STRATEGY_COLUMNS]
+        for row in serp_rows(kw, result):
+            values = row + summary
+            for name, value in zip(self.schema.names, values):
+                if name == "Rank":
+                    value = int(value) if value is not None else None
+                elif value is not None:
+                    value = str(value)
+                self._buffer[name].append(value)
+            self._rows += 1
+            if self._rows >= self.row_group_size:
+                self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self.writer.write_table(pa.Table.from_pydict(self._buffer, schema=self.schema))
+            self._buffer = {name: [] for name in self.schema.names}
+            self._rows = 0
+
+    def close(self, content_direction=None):
+        self._flush()
+        self.writer.close()
+
+
+STREAM_WRITERS = {
+    "xlsx": ExcelStreamWriter,
+    "ndjson": NdjsonStreamWriter,
+    "parquet": ParquetStreamWriter,
+}
+
+
+class StreamingExport:
+    """同時寫出多種格式：add() 依完成順序逐筆寫入，close() 補上內容指引並回傳各檔路徑"""
+
+    def __init__(self, out_dir, stem, formats=("xlsx",)):
+        self.paths = {}
+        self.writers = {}
+        for fmt in formats:
+            path = os.path.join(out_dir, f"{stem}.{fmt}")
+            self.writers[fmt] = STREAM_WRITERS[fmt](path)
+            self.paths[fmt] = path
+
+    def add(self, kw, result):
+        for writer in self.writers.values():
+            writer.add(kw, result)
+
+    def close(self, content_direction=None):
+        for writer in self.writers.values():
+            writer.close(content_direction)
+        return self.paths
+
+
+def build_stream_bytes(fmt, keywords, all_results, content_direction=None):
+    """依關鍵字順序以串流 writer 產生單一格式的檔案內容（供下載按鈕使用）"""
+    buffer = io.BytesIO()
+    writer = STREAM_WRITERS[fmt](buffer)
+    for kw in keywords:
+        r = all_results.get(kw)
+        if r:
+            writer.add(kw, r)
+    writer.close(content_direction)
+    return buffer.getvalue()
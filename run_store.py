@@ -0,0 +1,182 @@
+"""
+第二階段執行結果儲存（run store）
+
+完成的執行依 run id 保存，之後的 Streamlit rerun（點下載按鈕、展開項目）直接從這裡讀回重畫，不需重跑分析：
+- 記憶體內最多保留 max_in_memory 筆（LRU），超過的寫入磁碟，之後取用時再讀回
+- 磁碟上最多保留 max_on_disk 筆，超過時刪除最舊的
+- Excel / JSON / NDJSON / Parquet 匯出內容在下載時才產生；keep=False 時不保留在 record 中
+  （Streamlit 可延後產生下載內容時使用，record 只保留結果本身）
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+from cache import CACHE_DIR
+from report import build_json_text, build_stream_bytes, collect_reports
+
+RUN_STORE_DIR = os.path.join(CACHE_DIR, "run_store")
+
+
+class RunRecord:
+    """單次執行的結果、內容指引與統計；匯出內容 lazy 產生（keep=True 時 memoize）"""
+
+    def __init__(self, keywords, results, content_direction=None, content_error=None,
+                 stats=None, run_id=None, created_at=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.keywords = list(keywords)
+        self.results = OrderedDict(results)
+        self.content_direction = content_direction
+        self.content_error = content_error
+        self.stats = stats or {}
+        self.created_at = created_at or time.time()
+        self._lock = threading.Lock()
+        self._memo = {}
+
+    def _cached(self, name, build, keep=True):
+        with self._lock:
+            if name in self._memo:
+                return self._memo[name]
+        value = build()
+        if keep:
+            with self._lock:
+                value = self._memo.setdefault(name, value)
+        return value
+
+    def reports(self):
+        """(reports, serp_frames)"""
+        return self._cached("reports", lambda: collect_reports(self.keywords, self.results))
+
+    def export_bytes(self, fmt, keep=True):
+        """xlsx / ndjson / parquet（串流 writer 逐列寫入，不組整張 DataFrame）"""
+        return self._cached(fmt, lambda: build_stream_bytes(
+            fmt, self.keywords, self.results, self.content_direction
+        ), keep)
+
+    def excel_bytes(self, keep=True):
+        return self.export_bytes("xlsx", keep)
+
+    def json_text(self, keep=True):
+        return self._cached("json", lambda: build_json_text(self.reports()[0], self.content_direction), keep)
+
+    def export(self, fmt, keep=True):
+        """依格式取得下載內容（json 為文字，其餘為 bytes）"""
+        if fmt == "json":
+            return self.json_text(keep)
+        return self.export_bytes(fmt, keep)
+
+    # -------------------------------------------------
+    # 序列化（DataFrame 以 serp_raw 保存，讀回時重建）
+    # -------------------------------------------------
+    def to_dict(self):
+        results = []
+        for r in self.results.values():
+            entry = {k: v for k, v in r.items() if k != "serp_df"}
+            results.append(entry)
+        return {
+            "run_id": self.run_id,
+            "keywords": self.keywords,
+            "results": results,
+            "content_direction": self.content_direction,
+            "content_error": self.content_error,
+            "stats": self.stats,
+            "created_at": self.created_at
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        results = OrderedDict()
+        for entry in data.get("results", []):
+            serp_raw = entry.get("serp_raw")
+            entry["serp_df"] = pd.DataFrame(serp_raw) if serp_raw is not None else None
+            results[entry["keyword"]] = entry
+        return cls(
+            data["keywords"], results,
+            content_direction=data.get("content_direction"),
+            content_error=data.get("content_error"),
+            stats=data.get("stats"),
+            run_id=data["run_id"],
+            created_at=data.get("created_at")
+        )
+
+
+class RunStore:
+    """依 run id 保存 RunRecord：記憶體 LRU + 磁碟溢出"""
+
+    def __init__(self, directory=RUN_STORE_DIR, max_in_memory=4, max_on_disk=50):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_in_memory = max(1, max_in_memory)
+        self.max_on_disk = max(1, max_on_disk)
+        self.lock = threading.Lock()
+        self._records = OrderedDict()
+        self.stats = {"spills": 0, "loads": 0}
+
+    def _path(self, run_id):
+        return os.path.join(self.directory, f"{run_id}.json")
+
+    def _spill(self, record):
+        tmp_path = self._path(record.run_id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record.to_dict(), f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self._path(record.run_id))
+        self.stats["spills"] += 1
+        self._prune_disk()
+
+    def _prune_disk(self):
+        paths = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory) if name.endswith(".json")
+        ]
+        if len(paths) <= self.max_on_disk:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_on_disk]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        while len(self._records) > self.max_in_memory:
+            _, oldest = self._records.popitem(last=False)
+            self._spill(oldest)
+
+    def put(self, record):
+        """保存一筆執行結果，回傳 run id"""
+        with self.lock:
+            self._records[record.run_id] = record
+            self._records.move_to_end(record.run_id)
+            self._evict()
+        return record.run_id
+
+    def get(self, run_id):
+        """取得執行結果（記憶體 → 磁碟），找不到回傳 None"""
+        if not run_id:
+            return None
+        with self.lock:
+            record = self._records.get(run_id)
+            if record is not None:
+                self._records.move_to_end(run_id)
+                return record
+
+            path = self._path(run_id)
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path, encoding="utf-8") as f:
+                    record = RunRecord.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                return None
+            self.stats["loads"] += 1
+            self._records[run_id] = record
+            self._evict()
+            return record
+
+    def in_memory(self):
+        with self.lock:
+            return list(self._records)
@@ -0,0 +1,259 @@
+"""
+limiter.py 的確定性測試（假時鐘 / 假 sleep，不實際等待）
+
+執行方式：
+    python -m pytest -q tests/
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limiter import AIMDController, ProviderLimiter, RateLimitedExecutor, TokenBucket, is_rate_limit_error
+
+
+class FakeClock:
+    """以 sleep() 推進的時鐘"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimited(Exception):
+    def __init__(self, message="Too many requests"):
+        super().__init__(message)
+        self.code = 429
+
+
+# ---------- TokenBucket ----------
+
+def test_reserve_returns_wait_without_sleeping():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_sec=1.0, capacity=1, clock=clock)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+
+    clock.advance(3.0)
+    assert bucket.reserve() == 0.0
+
+
+def test_reserve_caps_amount_at_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_sec=10.0, capacity=100, clock=clock)
+
+    assert bucket.reserve(500) == 0.0
+    assert bucket.reserve(50) == pytest.approx(5.0)
+
+
+def test_set_rate_refills_at_previous_rate_first():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_sec=1.0, capacity=1, clock=clock)
+    bucket.reserve()
+    bucket.reserve()  # tokens = -1
+
+    clock.advance(0.5)  # 以舊速率回補到 -0.5
+    bucket.set_rate(2.0)
+    assert bucket.reserve() == pytest.approx(0.75)
+
+
+# ---------- AIMDController ----------
+
+def test_on_throttle_halves_once_per_cooldown():
+    clock = FakeClock()
+    aimd = AIMDController(max_rate=60, min_rate=5, increase=3, cooldown=5.0, clock=clock)
+
+    assert aimd.on_throttle() == 30
+    clock.advance(4.9)
+    assert aimd.on_throttle() == 30
+    clock.advance(0.1)
+    assert aimd.on_throttle() == 15
+
+
+def test_on_throttle_respects_min_rate():
+    clock = FakeClock()
+    aimd = AIMDController(max_rate=8, min_rate=5, increase=1, cooldown=0.0, clock=clock)
+
+    assert aimd.on_throttle() == 5
+    assert aimd.on_throttle() == 5
+
+
+def test_on_success_increases_linearly_up_to_max():
+    clock = FakeClock()
+    aimd = AIMDController(max_rate=60, min_rate=5, increase=20, clock=clock)
+    aimd.on_throttle()
+
+    assert aimd.on_success() == 50
+    assert aimd.on_success() == 60
+    assert aimd.on_success() == 60
+
+
+# ---------- ProviderLimiter ----------
+
+def test_acquire_waits_for_the_slower_of_rpm_and_tpm():
+    clock = FakeClock()
+    limiter = ProviderLimiter("gemini", rpm=60, max_concurrent=1, tpm=600, clock=clock, sleep=clock.sleep)
+
+    assert limiter.acquire(tokens=600) == 0.0
+    # RPM 需等 1 秒，TPM（每秒 10 token）需等 30 秒
+    assert limiter.acquire(tokens=300) == pytest.approx(30.0)
+    assert clock.sleeps == [pytest.approx(30.0)]
+
+
+def test_acquire_without_tokens_ignores_tpm():
+    clock = FakeClock()
+    limiter = ProviderLimiter("gemini", rpm=60, max_concurrent=1, tpm=600, clock=clock, sleep=clock.sleep)
+    limiter.acquire(tokens=600)
+
+    assert limiter.acquire() == pytest.approx(1.0)
+
+
+def test_slot_waits_for_rate_inside_the_semaphore():
+    clock = FakeClock()
+    held = []
+
+    def sleep(seconds):
+        held.append(limiter.semaphore._value)
+        clock.sleep(seconds)
+
+    limiter = ProviderLimiter("gemini", rpm=60, max_concurrent=1, clock=clock, sleep=sleep)
+    with limiter.slot():
+        pass
+    with limiter.slot():
+        pass
+
+    assert held == [0]
+
+
+def test_report_throttle_lowers_request_rate():
+    clock = FakeClock()
+    limiter = ProviderLimiter("serp", rpm=120, max_concurrent=1, clock=clock, sleep=clock.sleep)
+    limiter.report_throttle()
+
+    assert limiter.current_rpm == 60
+    assert limiter.requests.rate == pytest.approx(1.0)
+
+
+# ---------- RateLimitedExecutor._call ----------
+
+def make_executor(clock, **kwargs):
+    return RateLimitedExecutor(serp_rpm=600, gemini_min_interval=0.1, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_call_retries_rate_limits_then_succeeds():
+    clock = FakeClock()
+    executor = make_executor(clock)
+    attempts = []
+
+    def flaky():
+        attempts.append(clock())
+        if len(attempts) < 3:
+            raise RateLimited()
+        return "ok"
+
+    assert executor.call_serp(flaky) == "ok"
+    assert len(attempts) == 3
+    assert executor.stats["serp_retries"] == 2
+    assert executor.stats["serp_calls"] == 1
+    assert executor.stats["errors"] == []
+    # 兩次退避：2^0 + U(0.5, 1.5)、2^1 + U(0.5, 1.5)
+    backoffs = [s for s in clock.sleeps if s >= 1.5]
+    assert len(backoffs) == 2
+    assert 1.5 <= backoffs[0] <= 2.5 and 2.5 <= backoffs[1] <= 3.5
+    # 第二次 429 在冷卻期內不再降速；成功後回升 rpm / 20
+    assert executor.serp.current_rpm == 300 + 30
+    assert executor.metrics["serp"].snapshot()["throttled"] == 2
+
+
+def test_call_raises_after_max_retries():
+    clock = FakeClock()
+    executor = make_executor(clock, max_retries=2)
+    attempts = []
+
+    def always_throttled():
+        attempts.append(1)
+        raise RateLimited()
+
+    with pytest.raises(RateLimited):
+        executor.call_gemini(always_throttled)
+    assert len(attempts) == 2
+    assert executor.stats["gemini_retries"] == 1
+    assert executor.stats["errors"] == ["Gemini: Too many requests"]
+
+
+def test_call_does_not_retry_other_errors():
+    clock = FakeClock()
+    executor = make_executor(clock)
+    attempts = []
+
+    def not_found():
+        attempts.append(1)
+        raise ValueError("404 models/x is not found for API version v1beta, or is not supported for generateContent")
+
+    with pytest.raises(ValueError):
+        executor.call_gemini(not_found)
+    assert len(attempts) == 1
+    assert executor.stats["gemini_retries"] == 0
+    assert executor.gemini.current_rpm == 600
+    assert executor.metrics["gemini"].snapshot()["errors"] == 1
+
+
+def test_call_does_not_retry_errors_raised_before_the_request():
+    class ExhaustedQuota:
+        def acquire(self):
+            raise RateLimited("429 daily budget")
+
+    clock = FakeClock()
+    executor = make_executor(clock, serp_quota=ExhaustedQuota())
+    calls = []
+
+    with pytest.raises(RateLimited):
+        executor.call_serp(lambda: calls.append(1))
+    assert calls == []
+    assert executor.stats["serp_retries"] == 0
+
+
+# ---------- is_rate_limit_error ----------
+
+@pytest.mark.parametrize("message", [
+    "404 models/x is not found for API version v1beta, or is not supported for generateContent",
+    "400 Request payload size exceeds the limit: 20971520 bytes",
+    "Invalid GenerateContentRequest.contents",
+])
+def test_non_rate_limit_messages(message):
+    assert not is_rate_limit_error(ValueError(message))
+
+
+@pytest.mark.parametrize("message", [
+    "429 Resource has been exhausted (e.g. check quota).",
+    "<HttpError 429 when requesting https://www.googleapis.com/customsearch/v1 returned \"Quota exceeded\">",
+])
+def test_rate_limit_messages(message):
+    assert is_rate_limit_error(Exception(message))
+
+
+def test_status_code_takes_precedence_over_message():
+    class HttpError(Exception):
+        pass
+
+    throttled = HttpError("Quota exceeded for quota metric 'Queries'")
+    throttled.resp = type("Resp", (), {"status": 429})()
+    not_found = HttpError("rate 429 limit in the body")
+    not_found.resp = type("Resp", (), {"status": 404})()
+
+    assert is_rate_limit_error(throttled)
+    assert not is_rate_limit_error(not_found)